@@ -0,0 +1,981 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ベンチマークを実行するプログラム
+parser: 保存済みのページで抽出器(--parser)ごとの解析時間を計測し、抽出結果が同一かを確認する
+crawler: ローカルのリプレイサーバーに対してクローラを実行し、取得速度・取得時間・CPU時間を計測する
+terms: 合成した文書集合で単語の統計(回数, tf, idf)の計算時間を計測し、以前の実装と結果が同一かを確認する
+postings: 合成した文書集合で、pklの転置インデックスと圧縮した転置リストの大きさ・読み込み時間を比較する
+matrix: 合成した文書集合で、tf-idf行列と辞書の作成時間・ランキング検索の時間を比較する
+startup: python -X importtimeでモジュールの読み込み時間を計測し、重い依存を読み込んでいないかを確認する
+server: 検索サーバーへの同時の検索と、検索ごとにsearcher.pyを起動した場合の時間を比較し、結果が同一かを確認する
+"""
+
+import contextlib
+import copy
+import glob
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from argparse import ArgumentParser
+from argparse import ArgumentDefaultsHelpFormatter
+from collections import Counter
+
+
+class ParserBenchmark:
+    """
+    保存済みのページで抽出器ごとの解析時間を計測するクラス
+    基準はhtml.parserの抽出結果で、他の抽出器の結果が一致するかを確認する
+    """
+    BASELINE = 'html.parser'
+    URL_PATTERN = re.compile(r'/article/.+')
+
+    def __init__(self, args):
+        """
+        初期化します
+        """
+        self.args = args
+
+    def load_pages(self):
+        """
+        アーカイブと--fixture_path内の*.htmlから(名前, html)のリストを返す
+        """
+        from crawler import RawArchive    # pylint: disable=import-outside-toplevel
+        pages = []
+        if self.args.archive_path and os.path.isdir(self.args.archive_path):
+            for category in sorted(os.listdir(self.args.archive_path)):
+                path = os.path.join(self.args.archive_path, category)
+                if os.path.isdir(path):
+                    pages.extend(RawArchive(path).records())
+        if self.args.fixture_path:
+            for path in sorted(glob.glob(os.path.join(self.args.fixture_path, '*.html'))):
+                with open(path, encoding='utf-8') as a_file:
+                    pages.append((path, a_file.read()))
+        return pages
+
+    @staticmethod
+    def measure(function, html_document, repeat):
+        """
+        functionをrepeat回実行し、1回あたりの時間(ミリ秒)の中央値と結果を返す
+        抽出できないページでは(None, None)を返す
+        """
+        times = []
+        result = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                result = function(html_document)
+            except (AttributeError, IndexError, TypeError):
+                return None, None
+            times.append((time.perf_counter() - start) * 1000)
+        return statistics.median(times), result
+
+    def run(self):
+        """
+        ベンチマークを実行し結果を表示する。
+        抽出結果が基準と異なるページがあれば1を返す
+        """
+        from crawler import EXTRACTORS  # pylint: disable=import-outside-toplevel
+        pages = self.load_pages()
+        if not pages:
+            print('ページが見つかりませんでした。--archive_pathか--fixture_pathを指定してください')
+            return 1
+        extractors = {name: EXTRACTORS[name]() for name in EXTRACTORS}
+        tasks = {
+            'article': lambda extractor: extractor.extract_title_and_body,
+            'listing': lambda extractor: (
+                lambda html_document: extractor.extract_urls(self.URL_PATTERN, html_document)
+            ),
+        }
+        mismatch = 0
+        print(f'{len(pages)} pages, repeat {self.args.repeat}')
+        for task, make_function in tasks.items():
+            times = {name: [] for name in extractors}
+            for page_name, html_document in pages:
+                baseline_time, expected = self.measure(
+                    make_function(extractors[self.BASELINE]), html_document, self.args.repeat,
+                )
+                if baseline_time is None:   # このページは対象外(一覧ページの本文など)
+                    continue
+                times[self.BASELINE].append(baseline_time)
+                for name, extractor in extractors.items():
+                    if name == self.BASELINE:
+                        continue
+                    elapsed, result = self.measure(
+                        make_function(extractor), html_document, self.args.repeat,
+                    )
+                    if result != expected:
+                        mismatch += 1
+                        print(f'  mismatch: {task} {name} {page_name}')
+                        continue
+                    times[name].append(elapsed)
+            print(f'{task}:')
+            for name, values in times.items():
+                if not values:
+                    continue
+                speedup = statistics.mean(times[self.BASELINE]) / statistics.mean(values)
+                print(
+                    f'  {name: <12} pages {len(values): >5}'
+                    f'  median {statistics.median(values): >8.3f} ms'
+                    f'  mean {statistics.mean(values): >8.3f} ms'
+                    f'  x{speedup:.1f}'
+                )
+        print('identical' if mismatch == 0 else f'{mismatch} mismatches')
+        return 0 if mismatch == 0 else 1
+
+
+def serve_pages(pages, options, connection):
+    """
+    別プロセスでリプレイサーバーを起動し、ポート番号をconnectionで返す
+    """
+    from replay_server import ReplayServer   # pylint: disable=import-outside-toplevel
+    server = ReplayServer(pages, **options)
+    connection.send(server.server_port)
+    server.serve_forever()
+
+
+class CrawlerBenchmark:
+    """
+    ローカルのリプレイサーバーに対してクローラを実行し、性能を計測するクラス
+    crawl_top_page → crawl_article_pageの経路をネットワークに接続せずに計測する
+    サーバーは別プロセスで動かすため、CPU時間はクローラの分だけになる
+    """
+
+    def __init__(self, args):
+        """
+        初期化します
+        """
+        self.args = args
+
+    def load_pages(self, configures):
+        """
+        --archive_pathがあればそのページを、無ければ生成したページを{パス: html}で返す
+        """
+        from replay_server import load_archive_pages     # pylint: disable=import-outside-toplevel
+        from replay_server import make_synthetic_pages   # pylint: disable=import-outside-toplevel
+        if self.args.archive_path:
+            return load_archive_pages(self.args.archive_path)
+        return make_synthetic_pages(configures, articles_per_page=self.args.articles_per_page)
+
+    def start_server(self, pages):
+        """
+        リプレイサーバーのプロセスを起動し、(プロセス, url)を返す
+        """
+        options = {
+            'latency': self.args.latency, 'jitter': self.args.jitter,
+            'error_rate': self.args.error_rate, 'seed': 0,
+        }
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=serve_pages, args=(pages, options, sender), daemon=True,
+        )
+        process.start()
+        port = receiver.recv()
+        return process, f'http://127.0.0.1:{port}'
+
+    def crawler_args(self, output_path):
+        """
+        クローラの引数を作成し返す。キャッシュとアーカイブは計測の対象外にする
+        """
+        from crawler import make_parser   # pylint: disable=import-outside-toplevel
+        return make_parser().parse_args([
+            '--output_path', output_path,
+            '--article_nums', str(self.args.article_nums),
+            '--max_workers', str(self.args.max_workers),
+            '--sleep_time', str(self.args.sleep_time),
+            '--burst', str(self.args.burst),
+            '--parser', self.args.parser,
+            '--metrics_stream', os.path.join(output_path, 'metrics.jsonl'),
+            '--no_cache', '--no_archive',
+        ])
+
+    @staticmethod
+    def read_latencies(stream_path):
+        """
+        計測イベントから成功した取得の時間(ミリ秒、待ち時間を除く)のリストを返す
+        """
+        latencies = []
+        with open(stream_path, encoding='utf-8') as a_file:
+            for line in a_file:
+                event = json.loads(line)
+                if event['event'] == 'fetch' and event['status'] == 200:
+                    latencies.append(sum(
+                        value for phase, value in event['phases_ms'].items() if phase != 'wait'
+                    ))
+        return sorted(latencies)
+
+    @staticmethod
+    def percentile(values, ratio):
+        """
+        ソート済みのvaluesの百分位を返す
+        """
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(ratio * len(values)))]
+
+    def run(self):
+        """
+        ベンチマークを実行し結果を表示する。
+        取得速度が--min_articles_per_secを下回れば1を返す
+        """
+        from crawler import CONFIGURES    # pylint: disable=import-outside-toplevel
+        from crawler import Crawler       # pylint: disable=import-outside-toplevel
+        from crawler import DOMAINS       # pylint: disable=import-outside-toplevel
+        configures = []
+        for category_name in self.args.category:
+            category_name, start_urls, url_pattern = CONFIGURES[category_name]()
+            configures.append((category_name, list(start_urls), url_pattern))
+        pages = self.load_pages(configures)
+        process, base_url = self.start_server(pages)
+        try:
+            with tempfile.TemporaryDirectory() as output_path:
+                crawler_args = self.crawler_args(output_path)
+                app = Crawler(crawler_args, domains=base_url, sleep_time=crawler_args.sleep_time)
+                log = io.StringIO()
+                wall = time.perf_counter()
+                cpu = time.process_time()
+                with contextlib.redirect_stdout(log):
+                    for category_name, start_urls, url_pattern in configures:
+                        start_urls = [url.replace(DOMAINS, base_url) for url in start_urls]
+                        app.run(category_name, start_urls, url_pattern)
+                wall = time.perf_counter() - wall
+                cpu = time.process_time() - cpu
+                app.telemetry.close()
+                snapshot = app.telemetry.snapshot()
+                latencies = self.read_latencies(crawler_args.metrics_stream)
+        finally:
+            process.terminate()
+            process.join()
+        if self.args.verbose:
+            print(log.getvalue())
+        articles = sum(stats['pages'] for stats in snapshot['categories'].values())
+        result = {
+            'pages_served': len(pages),
+            'articles': articles,
+            'fetches': len(latencies),
+            'seconds': wall,
+            'articles_per_sec': articles / wall if wall else 0.0,
+            'fetch_p50_ms': self.percentile(latencies, 0.50),
+            'fetch_p99_ms': self.percentile(latencies, 0.99),
+            'cpu_ms_per_page': cpu * 1000 / articles if articles else 0.0,
+            'counters': snapshot['counters'],
+        }
+        print(
+            f'{articles} articles in {wall:.2f} s'
+            f'  {result["articles_per_sec"]:.1f} articles/s'
+            f'  fetch p50 {result["fetch_p50_ms"]:.2f} ms'
+            f'  p99 {result["fetch_p99_ms"]:.2f} ms'
+            f'  cpu {result["cpu_ms_per_page"]:.2f} ms/page'
+        )
+        if self.args.output:
+            with open(self.args.output, 'w', encoding='utf-8') as a_file:
+                json.dump(result, a_file, ensure_ascii=False, indent=2)
+        if result['articles_per_sec'] < self.args.min_articles_per_sec:
+            print(f'regression: below {self.args.min_articles_per_sec} articles/s')
+            return 1
+        return 0
+
+
+def make_corpus(documents, words, vocabulary_size):
+    """
+    Zipf分布に従う単語で合成した{id:[[word_list],(word_set)]}を返す
+    documents: 文書数, words: 1文書あたりの平均単語数, vocabulary_size: 語彙数
+    """
+    generator = random.Random(0)
+    vocabulary = [f'単語{number}' for number in range(vocabulary_size)]
+    cumulative = []
+    total = 0.0
+    for rank in range(1, vocabulary_size + 1):
+        total += 1 / rank
+        cumulative.append(total)
+    word_dict = {}
+    for number in range(documents):
+        length = generator.randint(words // 2, words * 3 // 2)
+        word_list = generator.choices(vocabulary, cum_weights=cumulative, k=length)
+        word_dict[f'{number:08d}'] = [word_list, set(word_list)]
+    return word_dict
+
+
+class LegacyAnalyzer:
+    """
+    単語の統計を1回の走査にまとめる前のAnalyzerの実装(比較用)
+    """
+    @staticmethod
+    def make_word_count(word_dict):
+        """
+        ワードごとに回数リストを作成する。
+        return {id:{word:回数}}
+        """
+        word_count_dict = {}
+        for article in word_dict:
+            word_count = {}
+            for word in word_dict[article][1]:
+                word_count[word] = word_dict[article][0].count(word)
+            word_count_dict[article] = word_count
+        return word_count_dict
+
+    @staticmethod
+    def count_tf(word_count_dict):
+        """
+        tfを計算を行う
+        return {id:{word:tf}}
+        """
+        all_count_dict = {}
+        tf_dict = copy.deepcopy(word_count_dict)
+        for id in word_count_dict:  # pylint: disable=redefined-builtin
+            count = 0
+            for key in word_count_dict[id]:
+                count += word_count_dict[id][key]
+            all_count_dict[id] = count
+        for id in word_count_dict:  # pylint: disable=redefined-builtin
+            for key in word_count_dict[id]:
+                tf_dict[id][key] = word_count_dict[id][key] / all_count_dict[id]
+        return tf_dict
+
+    @staticmethod
+    def count_idf(word_count_dict):
+        """
+        idfを計算する
+        return {word:idf}
+        """
+        input_dict = word_count_dict
+        count_id = len(input_dict)
+        count_word = {}
+        word_set = set()
+        for tmp in input_dict:
+            for key in input_dict.get(tmp):
+                word_set.add(key)
+        for tmp in word_set:
+            count_word[tmp] = 0
+        for tmp_set in word_set:
+            for tmp in input_dict:
+                for key in input_dict.get(tmp):
+                    if key == tmp_set:
+                        count_word[tmp_set] += 1
+                        break
+        for key in count_word:
+            count_word[key] = math.log(count_id / count_word[key])
+        return count_word
+
+
+class TermsBenchmark:
+    """
+    合成した文書集合で単語の統計の計算時間を計測するクラス
+    以前の実装は文書数の2乗以上の時間がかかるため、先頭の--legacy_documents件だけで比較する
+    """
+
+    def __init__(self, args):
+        """
+        初期化します
+        """
+        self.args = args
+
+    def make_corpus(self):
+        """
+        Zipf分布に従う単語で合成した{id:[[word_list],(word_set)]}を返す
+        """
+        return make_corpus(self.args.documents, self.args.words, self.args.vocabulary)
+
+    @staticmethod
+    def measure(function, *arguments):
+        """
+        functionを実行し、(秒, 結果)を返す
+        """
+        start = time.perf_counter()
+        result = function(*arguments)
+        return time.perf_counter() - start, result
+
+    @staticmethod
+    def run_legacy(word_dict):
+        """
+        以前の実装で(回数, tf, idf)を計算して返す
+        """
+        word_count_dict = LegacyAnalyzer.make_word_count(word_dict)
+        tf_dict = LegacyAnalyzer.count_tf(word_count_dict)
+        idf_dict = LegacyAnalyzer.count_idf(word_count_dict)
+        return word_count_dict, tf_dict, idf_dict
+
+    def run(self):
+        """
+        ベンチマークを実行し結果を表示する。
+        結果が以前の実装と異なれば1を返す
+        """
+        from indexer import Analyzer  # pylint: disable=import-outside-toplevel
+        word_dict = self.make_corpus()
+        subset = dict(list(word_dict.items())[:self.args.legacy_documents])
+        print(f'{len(word_dict)} documents, {self.args.words} words/document on average')
+
+        legacy_time, expected = self.measure(self.run_legacy, subset)
+        subset_time, result = self.measure(Analyzer.term_statistics, subset)
+        identical = result == expected  # Counterと辞書は要素が同じなら等しい
+        print(
+            f'  {len(subset)} documents: legacy {legacy_time:.3f} s'
+            f'  single pass {subset_time:.3f} s'
+            f'  x{legacy_time / subset_time:.1f}'
+        )
+        full_time, (_, _, idf_dict) = self.measure(Analyzer.term_statistics, word_dict)
+        print(
+            f'  {len(word_dict)} documents: single pass {full_time:.3f} s'
+            f'  ({full_time / len(word_dict) * 1e6:.1f} us/document, {len(idf_dict)} words)'
+        )
+        print('identical' if identical else 'mismatch')
+        return 0 if identical else 1
+
+
+class PostingsBenchmark:
+    """
+    合成した文書集合で、pklの転置インデックス({word: [記事id]})と
+    セグメントの圧縮した転置リストの大きさ・読み込み時間・検索時間を比較するクラス
+    """
+
+    def __init__(self, args):
+        """
+        初期化します
+        """
+        self.args = args
+
+    def median_time(self, function):
+        """
+        functionを--repeat回実行し、時間(秒)の中央値と最後の結果を返す
+        """
+        times = []
+        result = None
+        for _ in range(self.args.repeat):
+            start = time.perf_counter()
+            result = function()
+            times.append(time.perf_counter() - start)
+        return statistics.median(times), result
+
+    def run(self):
+        """
+        ベンチマークを実行し結果を表示する。
+        復元した転置リストがpklと異なれば1を返す
+        """
+        import pickle   # pylint: disable=import-outside-toplevel
+        from postings import intersect    # pylint: disable=import-outside-toplevel
+        from segments import Segment      # pylint: disable=import-outside-toplevel
+        word_dict = make_corpus(self.args.documents, self.args.words, self.args.vocabulary)
+        articles = [{'id': article_id, 'category': 'society'} for article_id in word_dict]
+        inverted_index = {}
+        for article_id, (_, word_set) in word_dict.items():
+            for word in word_set:
+                inverted_index.setdefault(word, []).append(article_id)
+        inverted_index = {word: sorted(ids) for word, ids in inverted_index.items()}
+        frequent = sorted(inverted_index, key=lambda word: len(inverted_index[word]), reverse=True)
+        query = frequent[10:12]     # 頻出する2語のAND検索
+        print(f'{len(word_dict)} documents, {len(inverted_index)} words, query {query}')
+
+        with tempfile.TemporaryDirectory() as path:
+            pkl_path = os.path.join(path, 'inverted_index.pkl')
+            with open(pkl_path, 'wb') as a_file:
+                pickle.dump(inverted_index, a_file)
+            segment = Segment.build(os.path.join(path, 'segment.idx'), articles, word_dict)
+
+            def load_pkl():
+                with open(pkl_path, 'rb') as a_file:
+                    return pickle.load(a_file)
+
+            def load_segment():
+                loaded = Segment(segment.path)
+                loaded.open()
+                return loaded
+
+            pkl_load, loaded_index = self.median_time(load_pkl)
+            segment_load, loaded = self.median_time(load_segment)
+            pkl_query, expected = self.median_time(
+                lambda: sorted(set(loaded_index[query[0]]) & set(loaded_index[query[1]]))
+            )
+            segment_query, doc_numbers = self.median_time(
+                lambda: intersect([loaded.cursor(word) for word in query])
+            )
+            docs = loaded.load_docs()
+            identical = [docs[doc_number][1] for doc_number in doc_numbers] == expected
+            identical = identical and all(
+                [docs[doc_number][1] for doc_number, _ in loaded.iter_postings(word)] == inverted_index[word]
+                for word in frequent[:100]
+            )
+            pkl_size = os.path.getsize(pkl_path)
+            segment_size = os.path.getsize(segment.path)
+        print(f'  {"": <10} {"size": >12} {"load": >12} {"AND query": >12}')
+        print(f'  {"pkl": <10} {pkl_size: >12,} {pkl_load * 1000: >9.1f} ms {pkl_query * 1000: >9.2f} ms')
+        print(
+            f'  {"segment": <10} {segment_size: >12,} {segment_load * 1000: >9.1f} ms'
+            f' {segment_query * 1000: >9.2f} ms'
+        )
+        print(f'  size x{pkl_size / segment_size:.1f} smaller, load x{pkl_load / segment_load:.1f} faster')
+        print('identical' if identical else 'mismatch')
+        return 0 if identical else 1
+
+
+class MatrixBenchmark:
+    """
+    合成した文書集合で、辞書によるtf-idfの計算・ランキングと、
+    tf-idf行列(CSR)による計算・ランキングの時間を比較するクラス
+    """
+
+    def __init__(self, args):
+        """
+        初期化します
+        """
+        self.args = args
+
+    @staticmethod
+    def build_dicts(word_dict):
+        """
+        辞書で{word: {id: tf-idf}}と{id: L2ノルム}を作成して返す
+        """
+        from indexer import Analyzer  # pylint: disable=import-outside-toplevel
+        _, tf_dict, idf_dict = Analyzer.term_statistics(word_dict)
+        index = {}
+        norms = {}
+        for article_id, tf in tf_dict.items():
+            square = 0.0
+            for word, value in tf.items():
+                tf_idf = value * idf_dict[word]
+                index.setdefault(word, {})[article_id] = tf_idf
+                square += tf_idf * tf_idf
+            norms[article_id] = math.sqrt(square)
+        return index, idf_dict, norms
+
+    @staticmethod
+    def rank_dicts(index, idf_dict, norms, words):
+        """
+        辞書を単語ごとにたどり、コサイン類似度の[(記事id, スコア)]を高い順に返す
+        """
+        query = Counter(word for word in words if word in idf_dict)
+        query = {word: count * idf_dict[word] for word, count in query.items()}
+        query_norm = math.sqrt(sum(weight * weight for weight in query.values()))
+        scores = Counter()
+        for word, weight in query.items():
+            for article_id, tf_idf in index[word].items():
+                scores[article_id] += tf_idf * weight
+        ranking = [
+            (article_id, score / (norms[article_id] * query_norm))
+            for article_id, score in scores.items() if score > 0
+        ]
+        return sorted(ranking, key=lambda item: (-item[1], item[0]))
+
+    def run(self):
+        """
+        ベンチマークを実行し結果を表示する。
+        ランキングが辞書による計算と異なれば1を返す
+        """
+        from matrix import MatrixBuilder   # pylint: disable=import-outside-toplevel
+        word_dict = make_corpus(self.args.documents, self.args.words, self.args.vocabulary)
+        frequency = Counter(word for _, word_set in word_dict.values() for word in word_set)
+        query = [word for word, _ in frequency.most_common(self.args.query_words * 10)[::10]]
+        print(f'{len(word_dict)} documents, {len(frequency)} words, query {query}')
+
+        def build_matrix():
+            builder = MatrixBuilder()
+            for article_id, (word_list, _) in word_dict.items():
+                builder.add_document('society', article_id, word_list)
+            return builder.build()
+
+        dict_build, (index, idf_dict, norms) = TermsBenchmark.measure(self.build_dicts, word_dict)
+        matrix_build, matrix = TermsBenchmark.measure(build_matrix)
+        dict_query, expected = TermsBenchmark.measure(self.rank_dicts, index, idf_dict, norms, query)
+        matrix_query, result = TermsBenchmark.measure(matrix.rank, query, ['society'])
+        expected_scores = dict(expected)
+        identical = len(result) == len(expected) and all(
+            abs(score - expected_scores[article_id]) < 1e-9 for article_id, score in result
+        )
+        print(f'  {"": <10} {"build": >12} {"ranked query": >14}')
+        print(f'  {"dict": <10} {dict_build: >10.2f} s {dict_query * 1000: >11.2f} ms')
+        print(f'  {"matrix": <10} {matrix_build: >10.2f} s {matrix_query * 1000: >11.2f} ms')
+        print(f'  build x{dict_build / matrix_build:.1f}, query x{dict_query / matrix_query:.1f} faster')
+        print('identical' if identical else 'mismatch')
+        return 0 if identical else 1
+
+
+class StartupBenchmark:
+    """
+    新しいインタプリタでモジュールを読み込み、python -X importtimeの出力から読み込み時間を計測するクラス
+    検索のたびにプロセスを起動するため、読み込み時間が上限を超えるか、重い依存を読み込めば失敗とする
+    """
+
+    def __init__(self, args):
+        """
+        初期化します
+        """
+        self.args = args
+
+    @staticmethod
+    def import_times(module):
+        """
+        moduleを読み込み、({モジュール名: (自身の時間, 累積の時間)}(マイクロ秒), 読み込んだモジュールの一覧)を返す
+        時間はmoduleとmoduleが読み込んだモジュールのものだけで、インタプリタの起動(site等)は含めない
+        """
+        code = f'import sys, {module}; print("\\n".join(sys.modules))'
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+        )
+        times = {}
+        pending = {}    # 直前の最上位のモジュールまでに読み込んだモジュール
+        for line in process.stderr.splitlines():
+            match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)', line)
+            if not match:
+                continue
+            name = match.group(4)
+            pending[name] = (int(match.group(1)), int(match.group(2)))
+            if not match.group(3):  # 子のモジュールの後に、字下げの無い最上位のモジュールが出力される
+                if name == module:
+                    times = pending
+                pending = {}
+        return times, set(process.stdout.split())
+
+    def run(self):
+        """
+        ベンチマークを実行し結果を表示する。
+        読み込み時間が--max_msを超えるか、--forbiddenのモジュールを読み込めば1を返す
+        """
+        failed = False
+        for module in self.args.module:
+            totals = []
+            for _ in range(self.args.repeat):
+                times, loaded = self.import_times(module)
+                totals.append(times[module][1] / 1000)
+            total = statistics.median(totals)
+            print(f'{module}: {total:.1f} ms (median of {self.args.repeat}, max {self.args.max_ms:.1f} ms)')
+            slowest = sorted(
+                (item for item in times.items() if item[0] != module), key=lambda item: -item[1][1],
+            )
+            for name, (own, cumulative) in slowest[:self.args.top]:
+                print(f'  {name: <32} self {own / 1000: >7.2f} ms  cumulative {cumulative / 1000: >7.2f} ms')
+            forbidden = sorted(
+                name for name in loaded
+                if name.split('.')[0] in self.args.forbidden
+            )
+            if forbidden:
+                print(f'  loads heavy modules: {", ".join(forbidden[:10])}')
+                failed = True
+            if total > self.args.max_ms:
+                print(f'  slower than {self.args.max_ms:.1f} ms')
+                failed = True
+        print('failed' if failed else 'ok')
+        return 1 if failed else 0
+
+
+class ServerBenchmark:
+    """
+    作成済みのセグメントの索引で、検索サーバー(search_server.py)への同時の検索の時間と、
+    検索ごとにsearcher.pyを起動した場合の時間を比較するクラス
+    """
+
+    def __init__(self, args):
+        """
+        初期化します
+        """
+        self.args = args
+
+    def make_queries(self, reader):
+        """
+        索引の単語から、2単語のAND検索の単語の組を--queries個作成して返す
+        """
+        words = [word for segment in reader.segments for word, _ in segment.open().iter_terms()]
+        words = sorted(set(words))
+        generator = random.Random(0)
+        return [generator.sample(words, 2) for _ in range(self.args.queries)]
+
+    @staticmethod
+    def request(base_url, words, categories):
+        """
+        サーバーにAND検索を依頼し、(秒, 応答)を返す
+        """
+        from urllib.parse import urlencode     # pylint: disable=import-outside-toplevel
+        from urllib.request import urlopen     # pylint: disable=import-outside-toplevel
+        query = urlencode({'mode': 'and', 'word': words, 'category': categories}, doseq=True)
+        start = time.perf_counter()
+        with urlopen(f'{base_url}/search?{query}') as response:
+            result = json.load(response)
+        return time.perf_counter() - start, result
+
+    def run(self):
+        """
+        ベンチマークを実行し結果を表示する。
+        サーバーの結果がSegmentReaderで直接検索した結果と異なれば1を返す
+        """
+        from concurrent.futures import ThreadPoolExecutor   # pylint: disable=import-outside-toplevel
+        from search_server import SearchServer     # pylint: disable=import-outside-toplevel
+        from search_server import SearchService    # pylint: disable=import-outside-toplevel
+        from segments import SegmentReader         # pylint: disable=import-outside-toplevel
+        categories = self.args.category
+        reader = SegmentReader(self.args.input_path, categories)
+        queries = self.make_queries(reader)
+        expected = [reader.intersect(words) for words in queries]
+
+        start = time.perf_counter()
+        server = SearchServer(SearchService(self.args.input_path))
+        load_time = time.perf_counter() - start
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=self.args.threads) as executor:
+                results = list(executor.map(
+                    lambda words: self.request(server.base_url, words, categories), queries,
+                ))
+            server_time = time.perf_counter() - start
+            stats = server.service.stats()['modes']['and']
+        finally:
+            server.shutdown()
+            server.server_close()
+        identical = [result['results'] for _, result in results] == expected
+        latencies = sorted(seconds for seconds, _ in results)
+
+        cli_times = []
+        for words in queries[:self.args.cli_queries]:
+            start = time.perf_counter()
+            subprocess.run(
+                [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'searcher.py'),
+                 '--input_path', self.args.input_path, '--search_word', *words,
+                 '--category', *categories, '--mode', 'and'],
+                capture_output=True, check=True,
+            )
+            cli_times.append(time.perf_counter() - start)
+        cli_time = statistics.median(cli_times) if cli_times else None
+
+        print(f'{len(queries)} and queries, {self.args.threads} threads, index loaded in {load_time * 1000:.1f} ms')
+        print(
+            f'  server: {len(queries) / server_time:.1f} queries/s'
+            f'  round trip p50 {latencies[len(latencies) // 2] * 1000:.2f} ms'
+            f'  p95 {latencies[min(len(latencies) - 1, len(latencies) * 95 // 100)] * 1000:.2f} ms'
+        )
+        print(f'  search (server side): p50 {stats["p50_ms"]:.2f} ms  p95 {stats["p95_ms"]:.2f} ms')
+        if cli_time is not None:
+            print(
+                f'  searcher.py per query: {cli_time * 1000:.1f} ms (median of {len(cli_times)})'
+                f'  x{cli_time / latencies[len(latencies) // 2]:.0f}'
+            )
+        print('identical' if identical else 'mismatch')
+        return 0 if identical else 1
+
+
+BENCHMARKS = {
+    'parser': ParserBenchmark,
+    'crawler': CrawlerBenchmark,
+    'terms': TermsBenchmark,
+    'postings': PostingsBenchmark,
+    'matrix': MatrixBenchmark,
+    'startup': StartupBenchmark,
+    'server': ServerBenchmark,
+}
+
+
+def get_args():
+    """
+    コマンドライン引数を応答します
+    """
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    parser_parser = subparsers.add_parser(
+        'parser', formatter_class=ArgumentDefaultsHelpFormatter,
+        help="抽出器ごとの解析時間を計測します",
+    )
+    parser_parser.add_argument(
+        "--archive_path", type=str, required=False, default='archive',
+        help="クローラの生htmlアーカイブのディレクトリ名を指定します",
+    )
+    parser_parser.add_argument(
+        "--fixture_path", type=str, required=False, default=None,
+        help="*.htmlを置いたディレクトリ名を指定します",
+    )
+    parser_parser.add_argument(
+        "--repeat", type=int, required=False, default=3,
+        help="1ページあたりの計測回数を指定します",
+    )
+    crawler_parser = subparsers.add_parser(
+        'crawler', formatter_class=ArgumentDefaultsHelpFormatter,
+        help="リプレイサーバーに対してクローラの性能を計測します",
+    )
+    crawler_parser.add_argument(
+        "--archive_path", type=str, required=False, default=None,
+        help="返すページのアーカイブのディレクトリ名を指定します。省略時はページを生成します",
+    )
+    crawler_parser.add_argument(
+        "--category", nargs='*', required=False, default=['society', 'sports'],
+        help="計測するカテゴリーを指定します",
+    )
+    crawler_parser.add_argument(
+        "--articles_per_page", type=int, required=False, default=30,
+        help="生成する一覧ページあたりの記事数を指定します",
+    )
+    crawler_parser.add_argument(
+        "--article_nums", type=int, required=False, default=100,
+        help="カテゴリーあたりの取得記事数を指定します",
+    )
+    crawler_parser.add_argument(
+        "--max_workers", type=int, required=False, default=4,
+        help="同時に実行するリクエストの最大数を指定します",
+    )
+    crawler_parser.add_argument(
+        "--sleep_time", type=float, required=False, default=0.0,
+        help="ホストへのリクエストの間隔(秒)を指定します",
+    )
+    crawler_parser.add_argument(
+        "--burst", type=int, required=False, default=1,
+        help="間隔を空けずに送れるリクエスト数を指定します",
+    )
+    crawler_parser.add_argument(
+        "--parser", type=str, required=False, default='html.parser',
+        help="記事の抽出器を指定します",
+    )
+    crawler_parser.add_argument(
+        "--latency", type=float, required=False, default=0.02,
+        help="サーバーの応答までの遅延(秒)を指定します",
+    )
+    crawler_parser.add_argument(
+        "--jitter", type=float, required=False, default=0.01,
+        help="遅延のゆらぎ(秒)を指定します",
+    )
+    crawler_parser.add_argument(
+        "--error_rate", type=float, required=False, default=0.0,
+        help="サーバーが503を返す割合を指定します",
+    )
+    crawler_parser.add_argument(
+        "--min_articles_per_sec", type=float, required=False, default=0.0,
+        help="取得速度(記事/秒)がこれを下回れば失敗とします",
+    )
+    crawler_parser.add_argument(
+        "--output", type=str, required=False, default=None,
+        help="結果を保存するjsonファイル名を指定します",
+    )
+    crawler_parser.add_argument(
+        "--verbose", action='store_true',
+        help="このオプションを付けるとクローラの出力を表示します",
+    )
+    terms_parser = subparsers.add_parser(
+        'terms', formatter_class=ArgumentDefaultsHelpFormatter,
+        help="単語の統計(回数, tf, idf)の計算時間を計測します",
+    )
+    terms_parser.add_argument(
+        "--documents", type=int, required=False, default=100000,
+        help="合成する文書数を指定します",
+    )
+    terms_parser.add_argument(
+        "--words", type=int, required=False, default=100,
+        help="1文書あたりの平均単語数を指定します",
+    )
+    terms_parser.add_argument(
+        "--vocabulary", type=int, required=False, default=20000,
+        help="語彙数を指定します",
+    )
+    terms_parser.add_argument(
+        "--legacy_documents", type=int, required=False, default=300,
+        help="以前の実装と比較する文書数を指定します",
+    )
+    postings_parser = subparsers.add_parser(
+        'postings', formatter_class=ArgumentDefaultsHelpFormatter,
+        help="転置リストの大きさと読み込み時間を比較します",
+    )
+    postings_parser.add_argument(
+        "--documents", type=int, required=False, default=20000,
+        help="合成する文書数を指定します",
+    )
+    postings_parser.add_argument(
+        "--words", type=int, required=False, default=100,
+        help="1文書あたりの平均単語数を指定します",
+    )
+    postings_parser.add_argument(
+        "--vocabulary", type=int, required=False, default=20000,
+        help="語彙数を指定します",
+    )
+    postings_parser.add_argument(
+        "--repeat", type=int, required=False, default=3,
+        help="計測回数を指定します",
+    )
+    matrix_parser = subparsers.add_parser(
+        'matrix', formatter_class=ArgumentDefaultsHelpFormatter,
+        help="tf-idf行列の作成時間とランキング検索の時間を比較します",
+    )
+    matrix_parser.add_argument(
+        "--documents", type=int, required=False, default=50000,
+        help="合成する文書数を指定します",
+    )
+    matrix_parser.add_argument(
+        "--words", type=int, required=False, default=100,
+        help="1文書あたりの平均単語数を指定します",
+    )
+    matrix_parser.add_argument(
+        "--vocabulary", type=int, required=False, default=20000,
+        help="語彙数を指定します",
+    )
+    matrix_parser.add_argument(
+        "--query_words", type=int, required=False, default=3,
+        help="ランキング検索の単語数を指定します",
+    )
+    startup_parser = subparsers.add_parser(
+        'startup', formatter_class=ArgumentDefaultsHelpFormatter,
+        help="モジュールの読み込み時間を計測します",
+    )
+    startup_parser.add_argument(
+        "--module", nargs='*', required=False, default=['searcher'],
+        help="計測するモジュールを指定します",
+    )
+    startup_parser.add_argument(
+        "--forbidden", nargs='*', required=False, default=['MeCab', 'matplotlib', 'numpy', 'scipy'],
+        help="読み込んではいけないモジュールを指定します",
+    )
+    startup_parser.add_argument(
+        "--max_ms", type=float, required=False, default=100.0,
+        help="読み込み時間(ミリ秒)がこれを超えれば失敗とします",
+    )
+    startup_parser.add_argument(
+        "--repeat", type=int, required=False, default=5,
+        help="計測回数を指定します",
+    )
+    startup_parser.add_argument(
+        "--top", type=int, required=False, default=10,
+        help="表示する時間の長いモジュールの数を指定します",
+    )
+    server_parser = subparsers.add_parser(
+        'server', formatter_class=ArgumentDefaultsHelpFormatter,
+        help="検索サーバーと、検索ごとにsearcher.pyを起動した場合の検索時間を比較します",
+    )
+    server_parser.add_argument(
+        "--input_path", type=str, required=False, default='index',
+        help="セグメントの索引のディレクトリ名を指定します",
+    )
+    server_parser.add_argument(
+        "--category", nargs='*', required=False, default=['society', 'sports', 'government'],
+        help="検索するカテゴリーを指定します",
+    )
+    server_parser.add_argument(
+        "--queries", type=int, required=False, default=1000,
+        help="サーバーへの検索数を指定します",
+    )
+    server_parser.add_argument(
+        "--threads", type=int, required=False, default=8,
+        help="同時に検索を依頼するスレッド数を指定します",
+    )
+    server_parser.add_argument(
+        "--cli_queries", type=int, required=False, default=5,
+        help="searcher.pyを起動して検索する回数を指定します",
+    )
+    return parser.parse_args()
+
+
+def main():
+    """
+    メイン（main）プログラムです
+    ベンチマークが成功すれば0、抽出結果の不一致や取得速度の低下があれば1を応答します
+    """
+    args = get_args()
+    app = BENCHMARKS[args.benchmark](args)
+    return app.run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+コーパスの統計(Zipfの法則, Heapsの法則)を計算するプログラム
+単語ごとの合計の回数だけを保持し、順位と頻度の曲線はNumPyの配列でまとめて計算する。
+プロット用の曲線は順位を対数で等間隔の区間に分けて間引くため、語彙数によらず点の数は一定になる
+"""
+
+import json
+from array import array
+from collections import Counter
+import numpy as np
+
+BINS = 100      # Zipfの曲線を間引いた後の点の最大数
+GROWTH = 1.1    # Heapsの法則の標本を取る間隔(単語数がこの倍になるごと)
+
+
+class CorpusStatistics:
+    """
+    文書を追加した順に単語の合計の回数と語彙数の増え方を記録するクラス
+    語彙数の標本は単語数が一定の倍率で増えるごとに取るため、標本の数は単語数の対数に比例する
+    """
+
+    def __init__(self, growth=GROWTH):
+        """
+        初期化します
+        """
+        self.growth = growth
+        self.counts = Counter()     # {word: 全文書での回数}
+        self.documents = 0
+        self.tokens = 0
+        self.samples = array('q')   # [文書数, 単語数, 語彙数]*
+        self.next_sample = 1
+
+    def add(self, word_list):
+        """
+        文書の単語のリストを追加する
+        """
+        self.counts.update(word_list)
+        self.documents += 1
+        self.tokens += len(word_list)
+        if self.tokens >= self.next_sample:
+            self.samples.extend((self.documents, self.tokens, len(self.counts)))
+            self.next_sample = max(int(self.tokens * self.growth), self.tokens + 1)
+
+    def rank_frequency(self):
+        """
+        (順位の配列, 相対頻度の配列)を頻度の高い順に返す
+        """
+        counts = np.fromiter(self.counts.values(), dtype=np.int64, count=len(self.counts))
+        counts = np.sort(counts)[::-1]
+        return np.arange(1, len(counts) + 1), counts / max(self.tokens, 1)
+
+    def zipf(self, bins=BINS):
+        """
+        順位を対数で等間隔の区間に分け、区間ごとの(順位の幾何平均, 相対頻度の平均)の配列を返す
+        """
+        ranks, frequencies = self.rank_frequency()
+        if len(ranks) == 0:
+            return ranks.astype(np.float64), frequencies
+        edges = np.unique(np.geomspace(1, len(ranks) + 1, bins + 1).astype(np.int64))  # 区間の先頭の順位
+        sizes = np.diff(edges)
+        means = np.add.reduceat(frequencies, edges[:-1] - 1) / sizes
+        return np.sqrt(edges[:-1] * (edges[1:] - 1)), means
+
+    def heaps(self):
+        """
+        語彙数の標本の(文書数, 単語数, 語彙数)の配列を返す。最後の文書までの値を必ず含む
+        """
+        samples = np.frombuffer(self.samples, dtype=np.int64).reshape(-1, 3)
+        if self.tokens and (len(samples) == 0 or samples[-1, 1] != self.tokens):
+            samples = np.vstack([samples, [self.documents, self.tokens, len(self.counts)]])
+        return samples[:, 0], samples[:, 1], samples[:, 2]
+
+    @staticmethod
+    def fit_power_law(x, y):
+        """
+        y = c * x^aを両対数の最小二乗法で当てはめ、(c, a)を返す。点が2つ未満ならNoneを返す
+        """
+        if len(x) < 2:
+            return None
+        slope, intercept = np.polyfit(np.log(x), np.log(y), 1)
+        return float(np.exp(intercept)), float(slope)
+
+    def summary(self, bins=BINS):
+        """
+        統計をjsonに保存できる辞書で返す
+        Zipfの指数sは 頻度 ∝ 順位^-s, Heapsの法則は 語彙数 = K * 単語数^β
+        """
+        ranks, frequencies = self.zipf(bins)
+        documents, tokens, vocabulary = self.heaps()
+        zipf_fit = self.fit_power_law(ranks, frequencies)
+        heaps_fit = self.fit_power_law(tokens, vocabulary)
+        return {
+            'documents': self.documents,
+            'tokens': self.tokens,
+            'vocabulary': len(self.counts),
+            'zipf': {
+                'exponent': None if zipf_fit is None else -zipf_fit[1],
+                'points': [[float(rank), float(frequency)] for rank, frequency in zip(ranks, frequencies)],
+            },
+            'heaps': {
+                'k': None if heaps_fit is None else heaps_fit[0],
+                'beta': None if heaps_fit is None else heaps_fit[1],
+                'samples': [
+                    [int(document), int(token), int(word)]
+                    for document, token, word in zip(documents, tokens, vocabulary)
+                ],
+            },
+        }
+
+    def write(self, path, bins=BINS):
+        """
+        統計をjsonファイルに保存し、当てはめた指数を表示する
+        """
+        summary = self.summary(bins)
+        with open(path, 'w', encoding='utf-8') as a_file:
+            json.dump(summary, a_file, ensure_ascii=False, indent=2)
+        zipf_exponent = summary['zipf']['exponent']
+        beta = summary['heaps']['beta']
+        print(
+            f'statistics: {path} ({summary["documents"]} documents, {summary["tokens"]} tokens,'
+            f' {summary["vocabulary"]} words'
+            + ('' if zipf_exponent is None else f', zipf s={zipf_exponent:.3f}')
+            + ('' if beta is None else f', heaps K={summary["heaps"]["k"]:.2f} beta={beta:.3f}')
+            + ')'
+        )
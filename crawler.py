@@ -14,41 +14,917 @@ __author__ = 'HAYASHI Tomokazu, Ayumu Sakai'
 __version__ = '1.0.3'
 __date__ = '2023/10/20 (Created: 2023/9/12)'
 
+import hashlib
+import heapq
 import json
 import os
 import re
+import signal
+import socket
+import sqlite3
 import sys
+import threading
 import time
+import uuid
 from argparse import ArgumentParser
 from argparse import ArgumentDefaultsHelpFormatter
+from collections import Counter
+from collections import deque
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from concurrent.futures import wait
+from datetime import datetime
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from multiprocessing.managers import SyncManager
+from urllib.parse import urlparse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.connectionpool import HTTPSConnectionPool
 from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
+from dedup import DuplicateIndex
+from store import ArticleStore
+from store import RecordStore
+
+
+class HostRateLimiter:
+    """
+    ホストごとのトークンバケットでリクエストの間隔を制御するクラス
+    間隔はホストごとに変更でき、Retry-Afterなどで一定時間止めることもできる
+    bucketsとlockにManagerの共有オブジェクトを渡すとプロセス間で制限を共有する
+    """
+    def __init__(self, interval, burst=1, buckets=None, lock=None):
+        """
+        初期化します
+        interval: トークンが1つ補充されるまでの秒数(ホストごとの初期値)
+        burst: バケットに貯められるトークンの最大数
+        """
+        self.interval = interval
+        self.burst = burst
+        self.buckets = {} if buckets is None else buckets   # {host: (トークン数, 最終更新時刻, 間隔, 停止期限)}
+        self.lock = threading.Lock() if lock is None else lock
+
+    def get_state(self, host, now):
+        """
+        ホストのバケットの状態を返す
+        """
+        return self.buckets.get(host, (self.burst, now, self.interval, 0.0))
+
+    def acquire(self, url):
+        """
+        urlのホストのトークンを1つ取得する。
+        トークンが無いか、ホストが止められていれば待つ
+        """
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            tokens, last, interval, blocked_until = self.get_state(host, now)
+            if interval > 0:
+                tokens = min(self.burst, tokens + (now - last) / interval)
+                tokens -= 1     # 先に予約し、足りない分は待ち時間として返済する
+            wait_time = max(-tokens * interval, blocked_until - now, 0.0)
+            self.buckets[host] = (tokens, now, interval, blocked_until)
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    def scale_interval(self, url, factor, lower, upper):
+        """
+        urlのホストの間隔をfactor倍し、lower〜upperの範囲に収めて返す
+        """
+        host = urlparse(url).netloc
+        with self.lock:
+            tokens, last, interval, blocked_until = self.get_state(host, time.monotonic())
+            interval = min(upper, max(lower, interval * factor))
+            self.buckets[host] = (tokens, last, interval, blocked_until)
+        return interval
+
+    def block(self, url, seconds):
+        """
+        urlのホストへのリクエストをseconds秒止める
+        """
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            tokens, last, interval, blocked_until = self.get_state(host, now)
+            blocked_until = max(blocked_until, now + seconds)
+            self.buckets[host] = (tokens, last, interval, blocked_until)
+
+
+class AdaptiveController:
+    """
+    応答から同時実行数とホストごとの間隔を調整するクラス
+    レイテンシが目標以下なら間隔を縮めて同時実行数を1つずつ増やし(加算増加)、
+    429/5xx/タイムアウトでは間隔を2倍、同時実行数を半分にする(乗算減少)
+    """
+    def __init__(self, rate_limiter, max_workers, min_interval, max_interval, target_latency):
+        """
+        初期化します
+        """
+        self.rate_limiter = rate_limiter
+        self.max_workers = max_workers
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_latency = target_latency
+        self.concurrency = 1
+        self.successes = 0
+        self.lock = threading.Lock()
+
+    def on_success(self, url, latency):
+        """
+        成功した応答のレイテンシ(秒)から調整する
+        """
+        if latency > self.target_latency:   # 遅くなってきたら少しだけ間隔を広げる
+            self.rate_limiter.scale_interval(url, 1.25, self.min_interval, self.max_interval)
+            return
+        self.rate_limiter.scale_interval(url, 0.9, self.min_interval, self.max_interval)
+        with self.lock:
+            self.successes += 1
+            if self.successes >= self.concurrency:   # 同時実行数分の成功ごとに1つ増やす
+                self.concurrency = min(self.max_workers, self.concurrency + 1)
+                self.successes = 0
+
+    def on_failure(self, url):
+        """
+        429/5xx/タイムアウトの応答から調整する
+        """
+        self.rate_limiter.scale_interval(url, 2.0, self.min_interval, self.max_interval)
+        with self.lock:
+            self.concurrency = max(1, self.concurrency // 2)
+            self.successes = 0
+
+
+FetchResult = namedtuple('FetchResult', ['text', 'status', 'retry_after', 'latency', 'retryable'])
+
+
+class Telemetry:
+    """
+    クロールの計測値(フェーズごとの時間のヒストグラム、カウンタ、カテゴリーごとの取得速度)を集計するクラス
+    stream_pathを指定すると、イベントごとに1行のjsonを追記する
+    """
+    BOUNDS_MS = tuple(round(0.1 * 1.25 ** i, 3) for i in range(60))   # 0.1ms〜約65秒の対数目盛
+    PHASES = ('wait', 'dns', 'connect', 'request', 'transfer', 'parse', 'write')
+
+    def __init__(self, stream_path=None):
+        """
+        初期化します
+        """
+        self.lock = threading.Lock()
+        self.phases = {}        # {phase: {count, sum_ms, min_ms, max_ms, buckets}}
+        self.counters = Counter()
+        self.categories = {}    # {category: {pages, seconds}}
+        self.category_start = {}
+        self.stream_fd = None
+        if stream_path:
+            self.stream_fd = os.open(stream_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def record(self, phase, seconds):
+        """
+        フェーズの時間(秒)をヒストグラムに記録する
+        """
+        elapsed = seconds * 1000
+        bucket = 0
+        while bucket < len(self.BOUNDS_MS) and elapsed > self.BOUNDS_MS[bucket]:
+            bucket += 1
+        with self.lock:
+            histogram = self.phases.get(phase)
+            if histogram is None:
+                histogram = self.phases[phase] = {
+                    'count': 0, 'sum_ms': 0.0, 'min_ms': elapsed, 'max_ms': elapsed,
+                    'buckets': [0] * (len(self.BOUNDS_MS) + 1),
+                }
+            histogram['count'] += 1
+            histogram['sum_ms'] += elapsed
+            histogram['min_ms'] = min(histogram['min_ms'], elapsed)
+            histogram['max_ms'] = max(histogram['max_ms'], elapsed)
+            histogram['buckets'][bucket] += 1
+
+    def count(self, name, value=1):
+        """
+        カウンタを増やす
+        """
+        with self.lock:
+            self.counters[name] += value
+
+    def start_category(self, category):
+        """
+        カテゴリーの計測を開始する
+        """
+        with self.lock:
+            self.category_start[category] = time.monotonic()
+            self.categories.setdefault(category, {'pages': 0, 'seconds': 0.0})
+
+    def finish_category(self, category):
+        """
+        カテゴリーの計測を終了する
+        """
+        with self.lock:
+            start = self.category_start.pop(category, None)
+            if start is not None:
+                self.categories[category]['seconds'] += time.monotonic() - start
+
+    def page(self, category):
+        """
+        カテゴリーの取得記事数を1増やす
+        """
+        with self.lock:
+            self.categories.setdefault(category, {'pages': 0, 'seconds': 0.0})
+            self.categories[category]['pages'] += 1
+
+    def emit(self, event):
+        """
+        イベントを1行のjsonとして追記する。複数のプロセスから追記しても行が混ざらないように1回で書き込む
+        """
+        if self.stream_fd is None:
+            return
+        event = {'time': round(time.time(), 3), **event}
+        line = json.dumps(event, ensure_ascii=False) + '\n'
+        os.write(self.stream_fd, line.encode('utf-8'))
+
+    def percentile(self, histogram, ratio):
+        """
+        ヒストグラムから百分位の近似値(ミリ秒、目盛の上限)を返す
+        """
+        rank = ratio * histogram['count']
+        total = 0
+        for bucket, count in enumerate(histogram['buckets']):
+            total += count
+            if count and total >= rank:
+                if bucket < len(self.BOUNDS_MS):
+                    return min(self.BOUNDS_MS[bucket], histogram['max_ms'])
+                return histogram['max_ms']
+        return histogram['max_ms']
+
+    def merge(self, snapshot):
+        """
+        他のプロセスのsnapshot()の結果を合算する
+        """
+        with self.lock:
+            for phase, other in snapshot['phases'].items():
+                histogram = self.phases.get(phase)
+                if histogram is None:
+                    self.phases[phase] = {
+                        key: other[key] for key in ('count', 'sum_ms', 'min_ms', 'max_ms')
+                    }
+                    self.phases[phase]['buckets'] = list(other['buckets'])
+                    continue
+                histogram['count'] += other['count']
+                histogram['sum_ms'] += other['sum_ms']
+                histogram['min_ms'] = min(histogram['min_ms'], other['min_ms'])
+                histogram['max_ms'] = max(histogram['max_ms'], other['max_ms'])
+                histogram['buckets'] = [a + b for a, b in zip(histogram['buckets'], other['buckets'])]
+            self.counters.update(snapshot['counters'])
+            for category, other in snapshot['categories'].items():
+                stats = self.categories.setdefault(category, {'pages': 0, 'seconds': 0.0})
+                stats['pages'] += other['pages']
+                stats['seconds'] += other['seconds']
+
+    def snapshot(self):
+        """
+        集計結果をjsonにできる辞書で返す
+        """
+        with self.lock:
+            phases = {}
+            for phase, histogram in self.phases.items():
+                phases[phase] = dict(histogram, buckets=list(histogram['buckets']))
+                phases[phase].update({
+                    'mean_ms': histogram['sum_ms'] / histogram['count'],
+                    'p50_ms': self.percentile(histogram, 0.50),
+                    'p90_ms': self.percentile(histogram, 0.90),
+                    'p99_ms': self.percentile(histogram, 0.99),
+                })
+            categories = {}
+            for category, stats in self.categories.items():
+                minutes = stats['seconds'] / 60
+                categories[category] = dict(
+                    stats, pages_per_minute=stats['pages'] / minutes if minutes else 0.0,
+                )
+            return {
+                'bucket_bounds_ms': list(self.BOUNDS_MS),
+                'phases': phases,
+                'counters': dict(self.counters),
+                'categories': categories,
+            }
+
+    def write_summary(self, path):
+        """
+        集計結果をjsonファイルに保存する
+        """
+        with open(path, 'w', encoding='utf-8') as a_file:
+            json.dump(self.snapshot(), a_file, ensure_ascii=False, indent=2)
+
+    def close(self):
+        """
+        ストリームを閉じる
+        """
+        if self.stream_fd is not None:
+            os.close(self.stream_fd)
+            self.stream_fd = None
+
+
+PHASE_CONTEXT = threading.local()   # リクエスト中のスレッドのフェーズ時間 {phase: 秒}
+
+
+def record_phase(phase, seconds):
+    """
+    現在のスレッドで実行中のリクエストにフェーズの時間を加える
+    """
+    phases = getattr(PHASE_CONTEXT, 'phases', None)
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+class TimedConnectionMixin:
+    """
+    新しい接続を作るときに名前解決(dns)と接続(connect、TLSを含む)の時間を計測するMixin
+    """
+    def connect(self):
+        """
+        名前解決を先に行って計測し、解決したアドレスで接続する
+        """
+        dns_host = getattr(self, '_dns_host', None)
+        start = time.perf_counter()
+        if dns_host:
+            try:
+                address = socket.getaddrinfo(dns_host, self.port, type=socket.SOCK_STREAM)[0][4][0]
+            except OSError:
+                address = None
+            record_phase('dns', time.perf_counter() - start)
+            if address:
+                self._dns_host = address    # 証明書の検証とSNIにはself.hostが使われる
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            if dns_host:
+                self._dns_host = dns_host
+            record_phase('connect', time.perf_counter() - start)
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    """
+    計測するHTTP接続
+    """
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    """
+    計測するHTTPS接続
+    """
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    """
+    計測するHTTP接続のプール
+    """
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    """
+    計測するHTTPS接続のプール
+    """
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    計測する接続のプールを使うアダプター
+    """
+    def init_poolmanager(self, *args, **kwargs):
+        """
+        プールマネージャーが計測する接続のプールを作るようにする
+        """
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
+
+class HttpCache:
+    """
+    urlごとにETag/Last-Modifiedと本文をディスクに保存し、条件付きGETに使うクラス
+    """
+    def __init__(self, path):
+        """
+        初期化します
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def entry_path(self, url):
+        """
+        urlのキャッシュファイルのパスを返す
+        """
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, f'{name}.json')
+
+    def load(self, url):
+        """
+        urlのキャッシュを辞書で返す。無ければNoneを返す
+        return {url, etag, last_modified, text}
+        """
+        try:
+            with open(self.entry_path(url), encoding='utf-8') as a_file:
+                entry = json.load(a_file)
+        except (OSError, ValueError):
+            return None
+        if entry.get('url') != url:
+            return None
+        return entry
+
+    @staticmethod
+    def conditional_headers(entry):
+        """
+        キャッシュから条件付きリクエストのヘッダーを作成し返す
+        """
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, response):
+        """
+        レスポンスに検証用のヘッダーがあればキャッシュに保存する
+        """
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not (etag or last_modified):
+            return
+        entry = {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'text': response.text,
+        }
+        file_name = self.entry_path(url)
+        tmp_name = f'{file_name}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_name, 'w', encoding='utf-8') as a_file:
+            json.dump(entry, a_file, ensure_ascii=False)
+        os.replace(tmp_name, file_name)     # 書き込み途中のファイルを読まないように置き換える
+
+
+class Frontier:
+    """
+    カテゴリごとに発見した記事urlの状態をSQLiteに保存するクラス
+    state: discovered(未取得) / fetched(取得済み) / failed(取得失敗、再試行待ち)
+    """
+    DISCOVERED = 'discovered'
+    FETCHED = 'fetched'
+    FAILED = 'failed'
+
+    def __init__(self, path, max_retries=3):
+        """
+        初期化します
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.max_retries = max_retries
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS articles (
+                    category TEXT NOT NULL,
+                    article_id TEXT NOT NULL,
+                    url TEXT,
+                    state TEXT NOT NULL,
+                    retries INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (category, article_id)
+                );
+                CREATE TABLE IF NOT EXISTS listings (
+                    category TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    crawled_at REAL NOT NULL,
+                    PRIMARY KEY (category, url)
+                );
+            """)
+
+    def has_category(self, category):
+        """
+        カテゴリーの記録が既にあるかを返す
+        """
+        row = self.connection.execute(
+            'SELECT 1 FROM articles WHERE category = ? LIMIT 1', (category,)
+        ).fetchone()
+        return row is not None
+
+    def has_listing(self, category, url):
+        """
+        一覧ページを取得済みかを返す
+        """
+        row = self.connection.execute(
+            'SELECT 1 FROM listings WHERE category = ? AND url = ?', (category, url)
+        ).fetchone()
+        return row is not None
+
+    def seed_fetched(self, category, article_ids):
+        """
+        フロンティア導入前に保存済みの記事を取得済みとして登録する
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO articles (category, article_id, state, updated_at)'
+                ' VALUES (?, ?, ?, ?)',
+                ((category, article_id, self.FETCHED, now) for article_id in article_ids),
+            )
+
+    def add_listing(self, category, listing_url, articles):
+        """
+        一覧ページから発見した記事を登録し、一覧ページを取得済みにする
+        articles: [(article_id, url)]
+        """
+        now = time.time()
+        with self.connection:   # 一覧ページ単位で1トランザクションにする
+            self.connection.executemany(
+                'INSERT INTO articles (category, article_id, url, state, updated_at)'
+                ' VALUES (?, ?, ?, ?, ?)'
+                ' ON CONFLICT (category, article_id) DO UPDATE SET url = excluded.url'
+                ' WHERE articles.url IS NULL',
+                ((category, article_id, url, self.DISCOVERED, now) for article_id, url in articles),
+            )
+            self.connection.execute(
+                'INSERT OR REPLACE INTO listings (category, url, crawled_at) VALUES (?, ?, ?)',
+                (category, listing_url, now),
+            )
+
+    def pending_urls(self, category):
+        """
+        未取得または再試行できる記事のurlを発見順のリストで返す
+        """
+        rows = self.connection.execute(
+            'SELECT url FROM articles WHERE category = ? AND url IS NOT NULL'
+            ' AND (state = ? OR (state = ? AND retries < ?)) ORDER BY rowid',
+            (category, self.DISCOVERED, self.FAILED, self.max_retries),
+        )
+        return [row[0] for row in rows]
+
+    def count_states(self, category):
+        """
+        状態ごとの記事数を辞書で返す
+        """
+        rows = self.connection.execute(
+            'SELECT state, COUNT(*) FROM articles WHERE category = ? GROUP BY state',
+            (category,),
+        )
+        return dict(rows)
+
+    def mark_fetched(self, category, article_id):
+        """
+        記事を取得済みにする
+        """
+        with self.connection:
+            self.connection.execute(
+                'UPDATE articles SET state = ?, updated_at = ? WHERE category = ? AND article_id = ?',
+                (self.FETCHED, time.time(), category, article_id),
+            )
+
+    def mark_failed(self, category, article_id, permanent=False):
+        """
+        記事を取得失敗にし、再試行回数を増やして返す
+        permanentがTrueなら(404など)再試行しないようにする
+        """
+        with self.connection:
+            self.connection.execute(
+                'UPDATE articles SET state = ?, updated_at = ?,'
+                ' retries = CASE WHEN ? THEN ? ELSE retries + 1 END'
+                ' WHERE category = ? AND article_id = ?',
+                (self.FAILED, time.time(), permanent, self.max_retries, category, article_id),
+            )
+        row = self.connection.execute(
+            'SELECT retries FROM articles WHERE category = ? AND article_id = ?',
+            (category, article_id),
+        ).fetchone()
+        return row[0] if row else self.max_retries
+
+    def close(self):
+        """
+        データベースを閉じる
+        """
+        self.connection.close()
+
+
+class RawArchive:
+    """
+    取得した生のhtmlをWARC形式のレコードとして圧縮セグメントに追記するクラス
+    """
+    def __init__(self, path):
+        """
+        初期化します
+        """
+        self.store = RecordStore(path, suffix='.warc.gz')
+
+    def append(self, url, html_document):
+        """
+        htmlをWARCのresourceレコードとして追記する
+        """
+        body = html_document.encode('utf-8')
+        date = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        header = (
+            'WARC/1.0\r\n'
+            'WARC-Type: resource\r\n'
+            f'WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n'
+            f'WARC-Target-URI: {url}\r\n'
+            f'WARC-Date: {date}\r\n'
+            'Content-Type: text/html; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            '\r\n'
+        ).encode('utf-8')
+        self.store.append(url, header + body + b'\r\n\r\n')
+
+    @staticmethod
+    def parse_record(record):
+        """
+        WARCレコードからhtmlを取り出して返す
+        """
+        header, _, rest = record.partition(b'\r\n\r\n')
+        length = 0
+        for line in header.split(b'\r\n'):
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length':
+                length = int(value)
+        return rest[:length].decode('utf-8')
+
+    def read(self, url):
+        """
+        urlのhtmlを返す。無ければNoneを返す
+        """
+        record = self.store.read(url)
+        return None if record is None else self.parse_record(record)
+
+    def records(self):
+        """
+        保存された(url, html)を順に返すジェネレータ
+        """
+        for url, record in self.store.records():
+            yield url, self.parse_record(record)
+
+    def close(self):
+        """
+        アーカイブを閉じる
+        """
+        self.store.close()
+
+
+class SoupExtractor:
+    """
+    BeautifulSoup(html.parser)で文書全体を解析して抽出するクラス
+    """
+    @staticmethod
+    def extract_urls(url_pattern, html_document):
+        """
+        BeatifulSoupを使用して解析する。引数のdocumentからurlリストのみを抽出し返す。
+        """
+        soup = BeautifulSoup(html_document, "html.parser")
+        url_set = set()
+        for each in soup.find('ul', class_='widget_boxlist_set').find_all('a'): # soupから<ul>(widget_boxlist_setクラス)を検索しその中から<a>の内容を繰り返す
+            url = each.get('href') #urlのみを抽出
+            if url_pattern.match(url): # 指定されたurlパターンと正しければ
+                url_set.add(url) #urlのセットに追加する
+        return url_set
+
+    @staticmethod
+    def extract_title_and_body(html_document):
+        """
+        入力された記事htmlからタイトルと本文を返す
+        """
+        soup = BeautifulSoup(html_document, "html.parser")
+        title = soup.title.string
+        body = soup.find('body').find('div', class_='article_body').get_text()
+        return title, body
+
+
+class StrainerExtractor:
+    """
+    SoupStrainerで必要な要素だけを木にして抽出するクラス
+    """
+    URL_STRAINER = SoupStrainer('ul', class_='widget_boxlist_set')
+    TITLE_STRAINER = SoupStrainer('title')
+    BODY_STRAINER = SoupStrainer('div', class_='article_body')
+
+    def extract_urls(self, url_pattern, html_document):
+        """
+        <ul class="widget_boxlist_set">だけを解析し、urlリストを抽出し返す
+        """
+        soup = BeautifulSoup(html_document, "html.parser", parse_only=self.URL_STRAINER)
+        url_set = set()
+        for each in soup.find('ul', class_='widget_boxlist_set').find_all('a'):
+            url = each.get('href')
+            if url_pattern.match(url):
+                url_set.add(url)
+        return url_set
+
+    def extract_title_and_body(self, html_document):
+        """
+        <title>と<div class="article_body">だけを解析し、タイトルと本文を返す
+        """
+        title = BeautifulSoup(
+            html_document, "html.parser", parse_only=self.TITLE_STRAINER,
+        ).title.string
+        body = BeautifulSoup(
+            html_document, "html.parser", parse_only=self.BODY_STRAINER,
+        ).find('div', class_='article_body').get_text()
+        return title, body
+
+
+class LxmlExtractor:
+    """
+    lxmlで解析して抽出するクラス
+    本文はBeautifulSoupのget_textと同じ文字列になるように、get_textが除外する要素を取り除く
+    """
+    IGNORED_TAGS = ('script', 'style', 'template', 'rt', 'rp')
+    URL_XPATH = '//ul[contains(concat(" ", normalize-space(@class), " "), " widget_boxlist_set ")]'
+    BODY_XPATH = './/div[contains(concat(" ", normalize-space(@class), " "), " article_body ")]'
+
+    def __init__(self):
+        """
+        初期化します。lxmlはこの抽出器を使う場合だけ読み込む
+        """
+        from lxml import etree, html    # pylint: disable=import-outside-toplevel
+        self.etree = etree
+        self.html = html
+
+    def parse(self, html_document):
+        """
+        htmlを解析して文書の要素を返す
+        """
+        try:
+            return self.html.document_fromstring(html_document)
+        except ValueError:  # 文字コード宣言付きの文字列はbytesにして解析する
+            parser = self.html.HTMLParser(encoding='utf-8')
+            return self.html.document_fromstring(html_document.encode('utf-8'), parser=parser)
+
+    def extract_urls(self, url_pattern, html_document):
+        """
+        <ul class="widget_boxlist_set">内の<a>からurlリストを抽出し返す
+        """
+        url_list = self.parse(html_document).xpath(self.URL_XPATH)[0]
+        url_set = set()
+        for each in url_list.iter('a'):
+            url = each.get('href')
+            if url_pattern.match(url):
+                url_set.add(url)
+        return url_set
+
+    def extract_title_and_body(self, html_document):
+        """
+        入力された記事htmlからタイトルと本文を返す
+        """
+        document = self.parse(html_document)
+        title = document.find('.//title').text
+        body = document.find('body').xpath(self.BODY_XPATH)[0]
+        self.etree.strip_elements(body, *self.IGNORED_TAGS, with_tail=False)
+        return title, str(body.text_content())
+
+
+EXTRACTORS = {
+    'html.parser': SoupExtractor,
+    'strainer': StrainerExtractor,
+    'lxml': LxmlExtractor,
+}
 
 
 class Crawler:
     """
     カテゴリごとに記事をスクレイピングするためのクラス
     """
-    def __init__(self, args, domains, sleep_time=3):
+    def __init__(self, args, domains, sleep_time=3, rate_limiter=None, tag=None, on_article=None):
         """
         初期化します
+        rate_limiter: 複数のプロセスで共有する場合に指定する
+        tag: 出力の各行の先頭に付ける名前
+        on_article: 記事を保存するたびに記事の辞書を渡して呼び出す関数
         """
         self.args = args
+        self.on_article = on_article
         self.domains = domains
         self.sleep_time = sleep_time
+        self.rate_limiter = rate_limiter or HostRateLimiter(sleep_time, burst=args.burst)
+        self.controller = None
+        if args.adaptive:
+            self.controller = AdaptiveController(
+                self.rate_limiter, args.max_workers, args.min_interval,
+                args.max_interval, args.target_latency,
+            )
+        self.tag = tag
+        self.session = self.make_session(args.max_workers)
+        self.http_cache = None if args.no_cache else HttpCache(args.cache_path)
+        self.telemetry = Telemetry(stream_path=args.metrics_stream)
+        frontier_path = args.frontier_path or self.join_path(args.output_path, 'frontier.sqlite3')
+        self.frontier = Frontier(frontier_path, max_retries=args.max_retries)
+        self.duplicates = None
+        if args.dedup != 'off':
+            self.duplicates = DuplicateIndex(self.frontier.connection, args.dedup_threshold)
+        self.archive = None
+        self.article_store = None
+        self.extractor = EXTRACTORS[args.parser]()
+
+    def open_article_store(self, category_name):
+        """
+        --output_format jsonlの場合はカテゴリーの記事ストアを開く。jsonの場合はNoneを返す
+        """
+        if self.article_store is not None:
+            self.article_store.close()
+        self.article_store = None
+        if self.args.output_format == 'jsonl':
+            self.article_store = ArticleStore(
+                ArticleStore.category_path(self.args.output_path, category_name),
+                compress=self.args.compress,
+            )
+        return self.article_store
+
+    def open_archive(self, category_name):
+        """
+        カテゴリーの生htmlアーカイブを開く。--no_archiveの場合はNoneを返す
+        """
+        if self.archive is not None:
+            self.archive.close()
+        self.archive = None
+        if not self.args.no_archive:
+            self.archive = RawArchive(self.join_path(self.args.archive_path, category_name))
+        return self.archive
+
+    @staticmethod
+    def make_session(pool_size):
+        """
+        コネクションを使い回すためのセッションを作成し返す
+        """
+        session = requests.Session()
+        adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def count(self, name, value=1):
+        """
+        集計用のカウンタを増やす
+        """
+        self.telemetry.count(name, value)
+
+    def log(self, message):
+        """
+        進捗を表示します
+        tagがあれば各行の先頭に付け、他のプロセスの出力と混ざらないように1回で書き込む
+        """
+        if self.tag:
+            message = '\n'.join(
+                f'[{self.tag}] {line}' if line else line for line in message.split('\n')
+            )
+        sys.stdout.write(f'{message}\n')
+        sys.stdout.flush()
+
+    @staticmethod
+    def format_summary(stats):
+        """
+        集計結果を文字列にして返す
+        """
+        return (
+            f'cache hit {stats.get("cache_hit", 0)}'
+            f' / miss {stats.get("cache_miss", 0)}'
+            f', duplicate {stats.get("duplicate", 0)}'
+        )
 
     def run(self, category_name, start_urls, url_pattern):
         """
         スクレイピングを実行します
         """
+        before = self.telemetry.counters.copy()
+        self.telemetry.start_category(category_name)
         try:
-            print(f'\ncategory: {category_name}')
+            self.log(f'\ncategory: {category_name}')
             output_path = self.join_path(self.args.output_path, category_name)
             self.make_directories(output_path)
-            urls = self.crawl_top_page(start_urls, url_pattern)
+            self.open_archive(category_name)
+            self.open_article_store(category_name)
+            if not self.frontier.has_category(category_name):
+                # フロンティア導入前の保存済み記事を一度だけ登録する
+                self.frontier.seed_fetched(category_name, self.list_saved_articles(output_path))
+            self.crawl_top_page(category_name, start_urls, url_pattern)
+            urls = self.frontier.pending_urls(category_name)
+            states = self.frontier.count_states(category_name)
+            self.log(
+                f'frontier: {len(urls)} pending'
+                f' / {states.get(Frontier.FETCHED, 0)} fetched'
+                f' / {states.get(Frontier.FAILED, 0)} failed'
+            )
             self.crawl_article_page(category_name, urls, output_path)
         except KeyboardInterrupt:
-            print(f'\n{category_name}カテゴリのスクレイピングを終了します')
+            self.log(f'\n{category_name}カテゴリのスクレイピングを終了します')
+        self.telemetry.finish_category(category_name)
+        self.log(f'summary({category_name}): {self.format_summary(self.telemetry.counters - before)}')
 
     @staticmethod
     def join_path(*a_tuple):
@@ -58,90 +934,299 @@ class Crawler:
         """
         return os.path.join(*a_tuple)
 
-    def crawl_top_page(self, start_urls, url_pattern):
+    @staticmethod
+    def list_saved_articles(output_path):
+        """
+        出力ディレクトリのjsonファイルと記事ストアに保存済みの記事idのリストを返す
+        """
+        article_ids = [
+            file_name[:-len('.json')]
+            for file_name in os.listdir(output_path)
+            if file_name.endswith('.json')
+        ]
+        store_path = os.path.join(output_path, ArticleStore.STORE_NAME)
+        if os.path.isdir(store_path):
+            article_ids.extend(ArticleStore(store_path).load_index())
+        return article_ids
+
+    def complete_url(self, url):
+        """
+        domainsのurlが不完全であれば、完全なurl形式に変換して返す
+        """
+        if not url.startswith(self.domains):
+            url = f'{self.domains}{url}'
+        return url
+
+    def crawl_top_page(self, category_name, start_urls, url_pattern):
         """
-        start_urlsから記事のurlセットを作成し、返す。
+        start_urlsから記事のurlセットを作成し、フロンティアに登録して返す。
+        取得済みの一覧ページは--refreshを付けない限り再取得しない。
         もし見つからなかった場合は空のセットを返す。
         """
         url_set = set()
         for start_url in start_urls:
-            print(f'Top page URL: {start_url}', end='')
+            if not self.args.refresh and self.frontier.has_listing(category_name, start_url):
+                continue
             html_document = self.get_html_document(start_url)
             if html_document:          # 変数html_ducmentに値が入っていればSuccess、入っていなければFailureでreturn
-                print(' -> Success')
+                self.log(f'Top page URL: {start_url} -> Success')
             else:
-                print(' -> Failure')
+                self.log(f'Top page URL: {start_url} -> Failure')
                 return url_set
-            url_set |= self.extract_urls(url_pattern, html_document) #重複しないように
+            if self.archive:
+                self.archive.append(start_url, html_document)
+            start = time.perf_counter()
+            urls = self.extract_urls(url_pattern, html_document)
+            self.telemetry.record('parse', time.perf_counter() - start)
+            self.frontier.add_listing(category_name, start_url, (
+                (self.get_article_id(url), self.complete_url(url)) for url in urls
+            ))
+            url_set |= urls #重複しないように
         return url_set
 
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
     def get_html_document(self, url):
         """
         urlからテキストをダウンロードし、テキスト本文(html)を返す
+        取得できなければNoneを返す
         """
-        time.sleep(self.sleep_time)
+        return self.fetch(url).text
+
+    def fetch(self, url):
+        """
+        urlからテキストをダウンロードし、結果をFetchResultで返す
+        複数スレッドから呼ばれるため、待ち時間はホストごとのトークンバケットで決める
+        """
+        phases = {}
+        start = time.perf_counter()
+        self.rate_limiter.acquire(url)
+        phases['wait'] = time.perf_counter() - start
+        entry = self.http_cache.load(url) if self.http_cache else None
+        headers = HttpCache.conditional_headers(entry)  # 前回のETag/Last-Modifiedを送る
+        PHASE_CONTEXT.phases = phases   # 新しい接続ならdns/connectが記録される
+        status = None
         try:
-            response = requests.get(url, timeout=(6.0, 6.0)) # ダウンロード
-        except OSError:
-            return None
+            start = time.perf_counter()
+            response = self.session.get(url, headers=headers, timeout=(6.0, 6.0), stream=True) # ダウンロード
+            phases['request'] = (
+                time.perf_counter() - start - phases.get('dns', 0.0) - phases.get('connect', 0.0)
+            )
+            status = response.status_code
+            start = time.perf_counter()
+            content = response.content  # 本文の受信
+            phases['transfer'] = time.perf_counter() - start
+        except OSError as error:    # タイムアウト、接続エラーは再試行する
+            self.count(f'error_{type(error).__name__}')
+            if self.controller:
+                self.controller.on_failure(url)
+            return FetchResult(None, None, None, None, True)
+        finally:
+            PHASE_CONTEXT.phases = None
+            for phase, seconds in phases.items():
+                self.telemetry.record(phase, seconds)
+            self.telemetry.emit({
+                'event': 'fetch', 'category': self.tag, 'url': url, 'status': status,
+                'phases_ms': {phase: round(seconds * 1000, 3) for phase, seconds in phases.items()},
+            })
+        self.count(f'status_{response.status_code}')
+        self.count('bytes', len(content))
+        latency = phases['request']
+        if response.status_code in self.RETRY_STATUSES:
+            retry_after = self.parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after:
+                self.rate_limiter.block(url, retry_after)   # Retry-Afterの間はホストへのリクエストを止める
+            if self.controller:
+                self.controller.on_failure(url)
+            return FetchResult(None, status, retry_after, latency, True)
+        if self.controller:
+            self.controller.on_success(url, latency)
+        if response.status_code == 304 and entry:   # 変更なし。本文はキャッシュから返す
+            self.count('cache_hit')
+            return FetchResult(entry['text'], status, None, latency, False)
         if response.status_code != 200:
-            return None
+            return FetchResult(None, status, None, latency, False)
         # response.encoding = response.apparent_encoding
-        return response.text
+        if self.http_cache:
+            self.count('cache_miss')
+            self.http_cache.store(url, response)
+        return FetchResult(response.text, status, None, latency, False)
 
     @staticmethod
-    def extract_urls(url_pattern, html_document):
+    def parse_retry_after(value):
         """
-        BeatifulSoupを使用して解析する。引数のdocumentからurlリストのみを抽出し返す。
+        Retry-Afterヘッダー(秒数または日時)を秒数にして返す。無ければNoneを返す
         """
-        soup = BeautifulSoup(html_document, "html.parser")
-        url_set = set()
-        for each in soup.find('ul', class_='widget_boxlist_set').find_all('a'): # soupから<ul>(widget_boxlist_setクラス)を検索しその中から<a>の内容を繰り返す
-            url = each.get('href') #urlのみを抽出
-            if url_pattern.match(url): # 指定されたurlパターンと正しければ
-                url_set.add(url) #urlのセットに追加する
-        return url_set
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    def concurrency(self):
+        """
+        現在の同時実行数の上限を返す
+        """
+        return self.controller.concurrency if self.controller else self.args.max_workers
+
+    def backoff(self, retries, retry_after=None):
+        """
+        再試行までの秒数を返す。再試行回数ごとに2倍にし、Retry-Afterがあればそれ以上待つ
+        """
+        delay = min(self.args.max_interval, self.sleep_time * 2 ** retries)
+        return max(delay, retry_after or 0.0)
+
+    def extract_urls(self, url_pattern, html_document):
+        """
+        --parserで指定した抽出器で解析する。引数のdocumentからurlリストのみを抽出し返す。
+        """
+        return self.extractor.extract_urls(url_pattern, html_document)
 
     def crawl_article_page(self, category_name, urls, output_path):
         """
-        指定された回数だけ記事をサーバーから取得し、jsonファイルとして書き込みを行う
+        指定された回数だけ記事をサーバーから取得し、書き込みを行う
+        最大max_workers件(--adaptiveの場合は調整された件数)のリクエストを同時に実行する
+        429/5xx/タイムアウトで失敗した記事は待ち時間の後に再試行する
         """
         article_count = 0
-        for url in urls:
-            if not url.startswith(self.domains): # domainsのurlが不完全であれば、完全なurl形式に変換する
-                url = f'{self.domains}{url}'
-            print(f'  Article page URL: {url}', end='')
-            article_id = self.get_article_id(url)
-            file_name = self.join_path(               # パスとファイル名で出力先のパスを指定
-                output_path, f"{article_id}.json"
-            )
-            if os.path.isfile(file_name):     #ファイルが既に存在すればcontinue
-                print(' -> Already exists')
+        pending = deque(urls)   # 取得済みの記事はフロンティアで除外されている
+        retry_queue = []        # [(再試行する時刻, url)]
+        in_flight = {}  # {future: (url, article_id)}
+        with ThreadPoolExecutor(max_workers=self.args.max_workers) as executor:
+            while pending or retry_queue or in_flight:
+                if article_count >= self.args.article_nums:
+                    return
+                while retry_queue and retry_queue[0][0] <= time.monotonic():
+                    pending.appendleft(heapq.heappop(retry_queue)[1])
+                # 同時実行数の上限、または取得済み+取得中の件数が指定件数に達していなければ送信する
+                if pending and len(in_flight) < self.concurrency() and (
+                    article_count + len(in_flight) < self.args.article_nums
+                ):
+                    url = self.complete_url(pending.popleft())
+                    future = executor.submit(self.fetch, url) #urlから記事のhtmlを取得
+                    in_flight[future] = (url, self.get_article_id(url))
+                    continue
+                timeout = None
+                if retry_queue:
+                    timeout = max(0.0, retry_queue[0][0] - time.monotonic())
+                if in_flight:
+                    article_count = self.collect_article_page(
+                        category_name, in_flight, article_count, output_path, retry_queue, timeout,
+                    )
+                elif timeout is not None:
+                    time.sleep(timeout)
+                else:
+                    return
+
+    def collect_article_page(self, category_name, in_flight, article_count, output_path,
+                             retry_queue, timeout=None):
+        """
+        取得中の記事のうち完了したものを待ち、書き込みを行う
+        再試行できる失敗はretry_queueに入れる。更新した記事数を返す
+        """
+        done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            url, article_id = in_flight.pop(future)
+            result = future.result()
+            html_document = result.text
+            if not html_document:
+                retries = self.frontier.mark_failed(
+                    category_name, article_id, permanent=not result.retryable,
+                )
+                message = f'  Article page URL: {url} -> Failure (status {result.status})'
+                if result.retryable and retries < self.args.max_retries:
+                    delay = self.backoff(retries, result.retry_after)
+                    heapq.heappush(retry_queue, (time.monotonic() + delay, url))
+                    self.count('retry')
+                    message += f', retry in {delay:.1f} s'
+                self.log(message)   # ドキュメントが変数内に入っていないためcontinue
                 continue
-            html_document = self.get_html_document(url) #urlから記事のhtmlを取得
-            if html_document: # ドキュメントが存在すれば
-                article_count += 1 # 記事数カウント
-                progress = f'({article_count} / {self.args.article_nums})'  # 現在の取得数 / 設定された取得数
-                print(f' -> Success {progress}')
-            else:
-                print(' -> Failure')   # ドキュメントが変数内に入っていないためcontinue
+            article_count += 1 # 記事数カウント
+            progress = f'({article_count} / {self.args.article_nums})'  # 現在の取得数 / 設定された取得数
+            self.log(f'  Article page URL: {url} -> Success {progress}')
+            if self.archive:
+                self.archive.append(url, html_document)   # 抽出前に生htmlを保存する
+            start = time.perf_counter()
+            article = self.extract_title_and_body(html_document)
+            parse_time = time.perf_counter() - start
+            article_dict = self.define_format(
+                article_id, category_name, url, article,
+            )
+            duplicate = self.find_duplicate(article_dict)
+            start = time.perf_counter()
+            if duplicate is None or self.args.dedup == 'link':
+                self.write_article(output_path, article_dict)
+            write_time = time.perf_counter() - start
+            self.frontier.mark_fetched(category_name, article_id)
+            self.telemetry.record('parse', parse_time)
+            self.telemetry.record('write', write_time)
+            self.telemetry.page(category_name)
+            self.telemetry.emit({
+                'event': 'page', 'category': category_name, 'url': url,
+                'phases_ms': {'parse': round(parse_time * 1000, 3), 'write': round(write_time * 1000, 3)},
+            })
+            if self.on_article and duplicate is None:
+                self.on_article(article_dict)
+        return article_count
+
+    def find_duplicate(self, article_dict):
+        """
+        本文が保存済みの記事とほぼ同じであれば、正規の記事を(カテゴリー, 記事id, 距離)で返す
+        --dedup offの場合と重複でない場合はNoneを返す
+        """
+        if self.duplicates is None:
+            return None
+        duplicate = self.duplicates.check(
+            article_dict['category'], article_dict['id'], article_dict['body'],
+        )
+        if duplicate is not None:
+            self.count('duplicate')
+            canonical_category, canonical_id, distance = duplicate
+            self.log(
+                f'  duplicate of {canonical_category}/{canonical_id}'
+                f' (distance {distance}) -> {self.args.dedup}'
+            )
+        return duplicate
+
+    def reextract(self, category_name, url_pattern):
+        """
+        アーカイブの生htmlから記事を作り直す
+        ネットワークには接続しない
+        """
+        self.log(f'\ncategory: {category_name}')
+        archive = RawArchive(self.join_path(self.args.archive_path, category_name))
+        output_path = self.join_path(self.args.output_path, category_name)
+        self.make_directories(output_path)
+        self.open_article_store(category_name)
+        article_count = 0
+        for url, html_document in archive.records():
+            if not url_pattern.match(urlparse(url).path):   # 一覧ページは除く
                 continue
+            article_id = self.get_article_id(url)
             article = self.extract_title_and_body(html_document)
             article_dict = self.define_format(
                 article_id, category_name, url, article,
             )
-            self.write_json_file(file_name, article_dict)
-            if article_count >= self.args.article_nums:
-                return
+            if self.find_duplicate(article_dict) is not None and self.args.dedup == 'skip':
+                continue
+            self.write_article(output_path, article_dict)
+            article_count += 1
+        archive.close()
+        self.log(f'{article_count} articles re-extracted')
 
     def extract_title_and_body(self, html_document):
         """
         入力された記事htmlからタイトルと本文を返す
         """
-        soup = BeautifulSoup(html_document, "html.parser")
-        title = soup.title.string
-        body = soup.find('body').find('div', class_='article_body').get_text()
-        return title, body
+        return self.extractor.extract_title_and_body(html_document)
 
     def define_format(self, article_id, category_name, url, article):
         """
@@ -169,6 +1254,18 @@ class Crawler:
         """
         os.makedirs(path, exist_ok=True)
 
+    def write_article(self, output_path, article_dict):
+        """
+        記事を記事ストアに追記する。--output_format jsonの場合は記事ごとのjsonファイルに保存する
+        """
+        if self.article_store is not None:
+            self.article_store.append_article(article_dict)
+            return
+        file_name = self.join_path(               # パスとファイル名で出力先のパスを指定
+            output_path, f"{article_dict['id']}.json"
+        )
+        self.write_json_file(file_name, article_dict)
+
     @staticmethod
     def write_json_file(file_name, a_dict):
         """
@@ -182,6 +1279,13 @@ def get_args():
     """
     コマンドライン引数を応答します
     """
+    return make_parser().parse_args()
+
+
+def make_parser():
+    """
+    コマンドライン引数のパーサーを作成し返す
+    """
     parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
     parser.add_argument(
         "--article_nums", type=int, required=False, default=100,
@@ -191,7 +1295,104 @@ def get_args():
         "-o", "--output_path", type=str, required=False, default='output',
         help="出力ディレクトリ名を指定します",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--max_workers", type=int, required=False, default=4,
+        help="同時に実行するリクエスト数の上限を指定します",
+    )
+    parser.add_argument(
+        "--sleep_time", type=float, required=False, default=3.0,
+        help="同一ホストへのリクエスト間隔(秒)を指定します",
+    )
+    parser.add_argument(
+        "--burst", type=int, required=False, default=1,
+        help="同一ホストへ間隔を空けずに送れるリクエスト数を指定します",
+    )
+    parser.add_argument(
+        "--cache_path", type=str, required=False, default='cache',
+        help="HTTPキャッシュのディレクトリ名を指定します",
+    )
+    parser.add_argument(
+        "--no_cache", action='store_true',
+        help="このオプションを付けるとHTTPキャッシュを使用しません",
+    )
+    parser.add_argument(
+        "--frontier_path", type=str, required=False, default=None,
+        help="フロンティア(SQLite)のパスを指定します。省略時は<output_path>/frontier.sqlite3",
+    )
+    parser.add_argument(
+        "--max_retries", type=int, required=False, default=3,
+        help="取得に失敗した記事を再試行する回数の上限を指定します",
+    )
+    parser.add_argument(
+        "--refresh", action='store_true',
+        help="このオプションを付けると取得済みの一覧ページも再取得します",
+    )
+    parser.add_argument(
+        "--archive_path", type=str, required=False, default='archive',
+        help="生htmlを保存するアーカイブのディレクトリ名を指定します",
+    )
+    parser.add_argument(
+        "--no_archive", action='store_true',
+        help="このオプションを付けると生htmlを保存しません",
+    )
+    parser.add_argument(
+        "--reextract", action='store_true',
+        help="このオプションを付けるとアーカイブからjsonファイルを作り直します(ネットワークに接続しません)",
+    )
+    parser.add_argument(
+        "--parser", type=str, required=False, default='html.parser', choices=EXTRACTORS,
+        help="htmlの抽出に使う解析器を指定します",
+    )
+    parser.add_argument(
+        "--output_format", type=str, required=False, default='jsonl', choices=('jsonl', 'json'),
+        help="記事の保存形式を指定します。jsonl=カテゴリーごとの記事ストア json=記事ごとのjsonファイル",
+    )
+    parser.add_argument(
+        "--compress", action='store_true',
+        help="このオプションを付けると記事ストアをgzipで圧縮します(新規作成時のみ)",
+    )
+    parser.add_argument(
+        "--category", nargs='*', required=False, default=list(CONFIGURES), choices=CONFIGURES,
+        help="スクレイピングするカテゴリーを指定します",
+    )
+    parser.add_argument(
+        "--parallel_categories", "--parallel-categories", type=int, required=False, default=1,
+        help="カテゴリーを並列に処理するプロセス数を指定します。ホストごとの間隔は全プロセスで共有します",
+    )
+    parser.add_argument(
+        "--adaptive", action='store_true',
+        help="このオプションを付けると応答に合わせて同時実行数とリクエスト間隔を調整します",
+    )
+    parser.add_argument(
+        "--min_interval", type=float, required=False, default=1.0,
+        help="--adaptiveで縮めるリクエスト間隔(秒)の下限を指定します",
+    )
+    parser.add_argument(
+        "--max_interval", type=float, required=False, default=60.0,
+        help="リクエスト間隔と再試行までの待ち時間(秒)の上限を指定します",
+    )
+    parser.add_argument(
+        "--target_latency", type=float, required=False, default=1.0,
+        help="--adaptiveで健全とみなすレイテンシ(秒)を指定します",
+    )
+    parser.add_argument(
+        "--metrics_summary", type=str, required=False, default=None,
+        help="計測結果(フェーズごとの時間、ステータスコード、例外、取得速度)を保存するjsonファイル名を指定します(指定した場合のみ保存)",
+    )
+    parser.add_argument(
+        "--metrics_stream", type=str, required=False, default=None,
+        help="クロール中の計測イベントを1行ずつ追記するファイル名を指定します",
+    )
+    parser.add_argument(
+        "--dedup", type=str, required=False, default='link', choices=('skip', 'link', 'off'),
+        help="本文がほぼ同じ記事を、skip: 保存しない / link: 保存して正規の記事に対応付ける / off: 検出しない",
+    )
+    parser.add_argument(
+        "--dedup_threshold", type=int, required=False, default=3, choices=range(DuplicateIndex.BANDS),
+        metavar=f'{{0..{DuplicateIndex.BANDS - 1}}}',
+        help="重複とみなす本文の指紋(SimHash)のハミング距離の上限を指定します(指紋を分ける帯の数未満)",
+    )
+    return parser
 
 
 def configure_society():
@@ -293,22 +1494,87 @@ def configure_gourmet():
     return category_name, start_urls, url_pattern
 
 
+CONFIGURES = {
+    'society': configure_society,
+    'government': configure_government,
+    'sports': configure_sports,
+    'technology': configure_technology,
+    'entame': configure_entame,
+    'movie': configure_movie,
+    'music': configure_music,
+    'anime': configure_anime,
+    'gourmet': configure_gourmet,
+}
+
+DOMAINS = 'https://news.nifty.com'
+
+
+def crawl_category(app, category_name):
+    """
+    1カテゴリーのスクレイピング(--reextractの場合は再抽出)を実行します
+    """
+    category_name, start_urls, url_pattern = CONFIGURES[category_name]()
+    if app.args.reextract:
+        app.reextract(category_name, url_pattern)
+    else:
+        app.run(category_name, start_urls, url_pattern)
+
+
+def crawl_category_process(args, category_name, rate_limiter):
+    """
+    ワーカープロセスで1カテゴリーを処理し、計測結果を返す
+    """
+    app = Crawler(
+        args, domains=DOMAINS, sleep_time=args.sleep_time,
+        rate_limiter=rate_limiter, tag=category_name,
+    )
+    crawl_category(app, category_name)
+    app.telemetry.close()
+    return app.telemetry.snapshot()
+
+
+def crawl_in_processes(args):
+    """
+    カテゴリーをプロセスプールで並列に処理し、計測結果を合算して返す
+    ホストごとのトークンバケットはManagerで全プロセスから共有する
+    """
+    telemetry = Telemetry()
+    manager = SyncManager()
+    manager.start(signal.signal, (signal.SIGINT, signal.SIG_IGN))  # Ctrl-Cで共有の状態が先に消えないようにする
+    try:
+        rate_limiter = HostRateLimiter(
+            args.sleep_time, burst=args.burst, buckets=manager.dict(), lock=manager.Lock(),
+        )
+        with ProcessPoolExecutor(max_workers=args.parallel_categories) as executor:
+            futures = [
+                executor.submit(crawl_category_process, args, category_name, rate_limiter)
+                for category_name in args.category
+            ]
+            for future in as_completed(futures):
+                telemetry.merge(future.result())
+    finally:
+        manager.shutdown()
+    return telemetry
+
+
 def main():
     """
     メイン（main）プログラムです
     常に0を応答します
     """
     args = get_args()
-    app = Crawler(args, domains='https://news.nifty.com')
-    app.run(*configure_society())
-    app.run(*configure_government())
-    app.run(*configure_sports())
-    app.run(*configure_technology())
-    app.run(*configure_entame())
-    app.run(*configure_movie())
-    app.run(*configure_music())
-    app.run(*configure_anime())
-    app.run(*configure_gourmet())
+    if args.parallel_categories > 1:
+        telemetry = crawl_in_processes(args)
+    else:
+        app = Crawler(args, domains=DOMAINS, sleep_time=args.sleep_time)
+        for category_name in args.category:
+            crawl_category(app, category_name)
+        telemetry = app.telemetry
+        telemetry.close()
+    if not args.reextract:
+        print(f'summary(total): {Crawler.format_summary(telemetry.counters)}')
+        if args.metrics_summary:
+            telemetry.write_summary(args.metrics_summary)
     return 0
 
 
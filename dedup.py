@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+記事本文のSimHashで重複に近い記事を検出するプログラム
+指紋はフロンティアのSQLiteに保存し、LSH(指紋を帯に分けた完全一致)で候補を絞り込む
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+from collections import Counter
+
+
+def simhash(text, shingle_size=3, bits=64):
+    """
+    文字のshingle_size-gramを特徴とするSimHash(bits桁の整数)を返す
+    日本語の本文を形態素解析せずに扱うため、空白を除いた文字列のn-gramを使う
+    """
+    text = re.sub(r'\s+', '', text)
+    shingles = Counter(
+        text[index:index + shingle_size] for index in range(max(1, len(text) - shingle_size + 1))
+    )
+    # 1ビットずつではなくバイトごとの値の出現回数を数え、最後にビットの重みに展開する
+    byte_counts = [Counter() for _ in range(bits // 8)]
+    for shingle, count in shingles.items():
+        digest = hashlib.blake2b(shingle.encode('utf-8'), digest_size=bits // 8).digest()
+        for position, byte in enumerate(reversed(digest)):
+            byte_counts[position][byte] += count
+    total = sum(shingles.values())
+    weights = [-total] * bits
+    for position, counts in enumerate(byte_counts):
+        for byte, count in counts.items():
+            for bit in range(8):
+                if byte >> bit & 1:
+                    weights[position * 8 + bit] += 2 * count
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def to_signed(value, bits=64):
+    """
+    SQLiteのINTEGERに保存できるように符号付き整数にして返す
+    """
+    return value - (1 << bits) if value >= 1 << (bits - 1) else value
+
+
+def to_unsigned(value, bits=64):
+    """
+    to_signedで保存した整数を元に戻して返す
+    """
+    return value + (1 << bits) if value < 0 else value
+
+
+class DuplicateIndex:
+    """
+    記事の指紋と、重複記事から正規の記事への対応をSQLiteに保存するクラス
+    64ビットの指紋を16ビットずつ4つの帯に分けるため、ハミング距離が3以下の指紋は必ずどれかの帯が一致する
+    """
+    BITS = 64
+    BANDS = 4
+
+    def __init__(self, connection, threshold=3):
+        """
+        初期化します
+        connection: フロンティアのデータベースの接続
+        threshold: 重複とみなすハミング距離の上限。帯の数未満でなければ候補から漏れるためValueErrorを送出する
+        """
+        if not 0 <= threshold < self.BANDS:
+            raise ValueError(f'threshold must be between 0 and {self.BANDS - 1}: {threshold}')
+        self.connection = connection
+        self.threshold = threshold
+        self.band_bits = self.BITS // self.BANDS
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS fingerprints (
+                    category TEXT NOT NULL,
+                    article_id TEXT NOT NULL,
+                    fingerprint INTEGER NOT NULL,
+                    PRIMARY KEY (category, article_id)
+                );
+                CREATE TABLE IF NOT EXISTS fingerprint_bands (
+                    band INTEGER NOT NULL,
+                    value INTEGER NOT NULL,
+                    category TEXT NOT NULL,
+                    article_id TEXT NOT NULL,
+                    PRIMARY KEY (band, value, category, article_id)
+                );
+                CREATE TABLE IF NOT EXISTS canonical (
+                    category TEXT NOT NULL,
+                    article_id TEXT NOT NULL,
+                    canonical_category TEXT NOT NULL,
+                    canonical_id TEXT NOT NULL,
+                    distance INTEGER NOT NULL,
+                    PRIMARY KEY (category, article_id)
+                );
+            """)
+
+    def bands(self, fingerprint):
+        """
+        指紋を帯ごとの値のリストにして返す
+        """
+        mask = (1 << self.band_bits) - 1
+        return [fingerprint >> (band * self.band_bits) & mask for band in range(self.BANDS)]
+
+    def find(self, category, article_id, fingerprint):
+        """
+        指紋が最も近い正規の記事を(カテゴリー, 記事id, 距離)で返す。無ければNoneを返す
+        """
+        candidates = set()
+        for band, value in enumerate(self.bands(fingerprint)):
+            candidates.update(self.connection.execute(
+                'SELECT b.category, b.article_id, f.fingerprint FROM fingerprint_bands AS b'
+                ' JOIN fingerprints AS f USING (category, article_id)'
+                ' WHERE b.band = ? AND b.value = ?',
+                (band, value),
+            ))
+        nearest = None
+        for other_category, other_id, other in candidates:
+            if (other_category, other_id) == (category, article_id):
+                continue
+            distance = bin(fingerprint ^ to_unsigned(other)).count('1')
+            if distance <= self.threshold and (nearest is None or distance < nearest[2]):
+                nearest = (other_category, other_id, distance)
+        return nearest
+
+    def check(self, category, article_id, text):
+        """
+        本文の指紋を保存し、重複であれば正規の記事との対応を登録して(カテゴリー, 記事id, 距離)を返す
+        重複でなければ正規の記事として候補に加え、Noneを返す
+        """
+        fingerprint = simhash(text)
+        nearest = self.find(category, article_id, fingerprint)
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO fingerprints (category, article_id, fingerprint)'
+                ' VALUES (?, ?, ?)',
+                (category, article_id, to_signed(fingerprint)),
+            )
+            if nearest is not None:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO canonical'
+                    ' (category, article_id, canonical_category, canonical_id, distance)'
+                    ' VALUES (?, ?, ?, ?, ?)',
+                    (category, article_id, *nearest),
+                )
+                self.connection.execute(    # 重複になった記事は候補から外す
+                    'DELETE FROM fingerprint_bands WHERE category = ? AND article_id = ?',
+                    (category, article_id),
+                )
+                return nearest
+            self.connection.execute(
+                'DELETE FROM canonical WHERE category = ? AND article_id = ?',
+                (category, article_id),
+            )
+            self.connection.executemany(   # 正規の記事だけを候補にする
+                'INSERT OR IGNORE INTO fingerprint_bands (band, value, category, article_id)'
+                ' VALUES (?, ?, ?, ?)',
+                ((band, value, category, article_id)
+                 for band, value in enumerate(self.bands(fingerprint))),
+            )
+        return None
+
+
+def load_duplicates(path):
+    """
+    フロンティアのデータベースから重複記事の(カテゴリー, 記事id)のセットを返す
+    データベースや対応表が無ければ空のセットを返す
+    """
+    if not path or not os.path.isfile(path):
+        return set()
+    connection = sqlite3.connect(path, timeout=30)
+    try:
+        return set(connection.execute('SELECT category, article_id FROM canonical'))
+    except sqlite3.OperationalError:   # 重複検出を導入する前のデータベース
+        return set()
+    finally:
+        connection.close()
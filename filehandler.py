@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ファイル操作を行うプログラム
+インデクサーとサーチャーの両方が使うため、標準ライブラリ以外を読み込まない
+"""
+
+__author__ = 'Ayumu Sakai'
+__version__ = '1.0.0'
+__date__ = '2023/10/25 (Created: 2023/10/25)'
+
+import glob
+import os
+import pickle
+
+
+class FileHandler:
+    """
+    ファイル操作を行うクラスです
+    """
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def join_path(*a_tuple):
+        """
+        ファイルをのディレクトリを返す。
+        引数(*a_tuple)は複数の引数をタプルとして受け取る
+        """
+        return os.path.join(*a_tuple)
+
+    @staticmethod
+    def make_directories(path):
+        """
+        出力するディレクトリを作成する
+        """
+        os.makedirs(path, exist_ok=True)
+    
+    def perpetuation(self, keep_var, output_path, filename):
+        """
+        引数から入力された変数をバイナリデータとして保存する
+        検索中に書き込み途中のファイルを読まないように、一時ファイルに書いてから置き換える
+        """
+        self.make_directories(output_path)
+        output_path = self.join_path(output_path, filename+'.pkl')
+        tmp_path = f'{output_path}.{os.getpid()}.tmp'
+        with open(tmp_path,'wb') as f:
+            pickle.dump(keep_var, f)
+        os.replace(tmp_path, output_path)
+
+    @staticmethod
+    def open_pkl(path):
+        """
+        引数からpklファイルを読み込み返す
+        """
+        with open(path, 'rb') as p:
+            l = pickle.load(p)
+        return l
+    
+    @staticmethod
+    def open_file_list(input_path, input_category):
+        """
+        引数に指定されたファイルないのファイル名の配列を返す。
+        input_path:　入力ディレクトリ
+        input_category: 転置インデックスを作成する対象カテゴリ
+        """
+        file_path = [] # フォルダ一覧
+        for tmp_category in input_category:
+            path = os.path.join(input_path,tmp_category,'*.json')
+            files = glob.glob(path)
+            for path in files:
+                file_path.append(path)
+        return file_path
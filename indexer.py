@@ -9,20 +9,30 @@ __author__ = 'Ayumu Sakai'
 __version__ = '1.0.0'
 __date__ = '2023/10/25 (Created: 2023/10/25)'
 
+import contextlib
+import cProfile
+import hashlib
 import json
 from operator import inv
 import os
 from re import S
 import sys
-import glob
-import MeCab
+import itertools
 import math
-import pickle
-import copy
+import resource
 import shutil
-import matplotlib.pyplot as plt
+import sqlite3
+import time
+import tracemalloc
 from argparse import ArgumentParser
 from argparse import ArgumentDefaultsHelpFormatter
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from filehandler import FileHandler
+from store import ArticleStore
+from dedup import load_duplicates
+from segments import SegmentIndex
+from segments import article_digest
 
 
 
@@ -37,91 +47,291 @@ class Indexer:
         self.args = args
         self.fileHandler = FileHandler()
         self.jsonProcesser = JsonProcessor()
-        self.morphologicalAnalyzer = MorphologicalAnalyzer()
+        token_cache = None
+        if not args.no_token_cache:
+            token_cache = TokenCache(
+                args.token_cache or TokenCache.default_path(args.output_path),
+                max_bytes=args.token_cache_size * 1024 * 1024,
+            )
+        self.morphologicalAnalyzer = MorphologicalAnalyzer(workers=args.workers, cache=token_cache)
         self.analyzer = Analyzer()
         self.plot = Plot()
+        self.statistics = None  # --stats, --plotの場合のCorpusStatistics
+        self.profiler = Profiler(enabled=args.profile is not None)
 
     def run(self):
         """
         インデックスの作成および保存を行う
-        """
+        --profileの場合は段階ごとの計測結果をjsonで保存し、--profile_dumpの場合はcProfileの結果も保存する
+        """
+        profile = None
+        if self.args.stats or self.args.plot:
+            from corpusstats import CorpusStatistics   # pylint: disable=import-outside-toplevel
+            self.statistics = CorpusStatistics()
+        if self.args.profile_dump:
+            profile = cProfile.Profile()
+            profile.enable()
         try:
             input_path = self.fileHandler.join_path(self.args.input_path)     # inputパス
             output_path = self.fileHandler.join_path(self.args.output_path)   # outputパス
-            json_list = self.jsonProcesser.read_json(input_path, self.args.category) # ファイル一覧を取得し、jsonファイルを読み込み辞書にして返す
-            category_set = self.jsonProcesser.make_category_set(json_list)  # set(カテゴリー)を作成
-            category_id = self.jsonProcesser.make_category_id(json_list)    # {id:カテゴリー}を作成
-            word_dict = self.morphologicalAnalyzer.morphological_analysis(json_list) # 形態素解析行う {id:[[word_list],(word_set)]}
-            word_count_dict = self.analyzer.make_word_count(word_dict) # 文書内の回数リストを作成
-            tf_dict = self.analyzer.count_tf(word_count_dict) #tf値を計算する
-            idf_dict = self.analyzer.count_idf(json_list, word_count_dict) # idfを計算する
-            
-            ### 保存
-            self.analyzer.count_tf_idf(tf_dict, idf_dict, output_path) # idfインデックスを作成
-            self.analyzer.make_tf(tf_dict, output_path)
-            self.analyzer.make_inverted_index(word_dict,category_id, category_set, output_path) # 転置インデックスを作成
+            if self.args.format == 'segments':
+                self.write_segments(input_path, output_path)
+                if self.args.matrix:
+                    with self.profiler.stage('matrix'):
+                        self.write_matrix(output_path)
+            else:
+                with self.profiler.stage('read_json') as stats:
+                    json_list = self.jsonProcesser.read_json(input_path, self.args.category, self.args.frontier_path) # ファイル一覧を取得し、jsonファイルを読み込み辞書にして返す
+                    stats['documents'] = len(json_list)
+                with self.profiler.stage('morphological_analysis') as stats:
+                    word_dict = self.morphologicalAnalyzer.morphological_analysis(json_list) # 形態素解析行う {id:[[word_list],(word_set)]}
+                    self.count_tokens(stats, word_dict)
+                self.add_statistics(word_dict)
+                self.write_index(json_list, word_dict, output_path)
+                if self.args.matrix:
+                    with self.profiler.stage('matrix'):
+                        self.write_matrix(output_path, json_list, word_dict)
 
-            ### グラフ作成
+            ### 統計の保存とグラフ作成
+            if self.args.stats:
+                self.statistics.write(self.args.stats)
             if self.args.plot:
-                frequency = self.analyzer.make_frequency(word_count_dict) # 頻度を作成する
-                self.plot.make_plot(frequency) # プロットを作成する
+                with self.profiler.stage('plot'):
+                    self.plot.make_plot(self.statistics, self.args.plot_output)
         except KeyboardInterrupt:
             print('インデックスの作成を終了します')
-
-class FileHandler:
-    """
-    ファイル操作を行うクラスです
-    """
-    def __init__(self):
-        pass
+        finally:
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(self.args.profile_dump)
+            if self.args.profile:
+                self.profiler.write_report(self.args.profile)
 
     @staticmethod
-    def join_path(*a_tuple):
+    def count_tokens(stats, word_dict):
         """
-        ファイルをのディレクトリを返す。
-        引数(*a_tuple)は複数の引数をタプルとして受け取る
+        計測結果に形態素解析した文書数と単語数を記録する
         """
-        return os.path.join(*a_tuple)
+        stats['documents'] = len(word_dict)
+        stats['tokens'] = sum(len(word_list) for word_list, _ in word_dict.values())
 
-    @staticmethod
-    def make_directories(path):
+    def add_statistics(self, word_dict):
         """
-        出力するディレクトリを作成する
+        形態素解析した文書をコーパスの統計に追加する。--stats, --plotが無ければ何もしない
         """
-        os.makedirs(path, exist_ok=True)
-    
-    def perpetuation(self, keep_var, output_path, filename):
+        if self.statistics is None:
+            return
+        with self.profiler.stage('corpus_statistics'):
+            for word_list, _ in word_dict.values():
+                self.add_document_statistics(word_list)
+
+    def add_document_statistics(self, word_list):
+        """
+        1文書をコーパスの統計に追加し、--stats_interval件ごとにその時点の語彙数を表示する
+        """
+        statistics = self.statistics
+        if statistics is not None:
+            statistics.add(word_list)
+            if statistics.documents % self.args.stats_interval == 0:
+                print(
+                    f'heaps: {statistics.documents} documents, {statistics.tokens} tokens,'
+                    f' {len(statistics.counts)} words'
+                )
+
+    def write_segments(self, input_path, output_path):
+        """
+        記事をセグメントの索引に追加する
+        --incrementalの場合は新しい記事と、索引した後で更新された(ダイジェストが変わった)記事だけを追加し、
+        それ以外は索引を作り直す。更新された記事の古い文書は削除済みとして記録される
+        --memory_budgetの場合は記事を1件ずつ読み、上限までのメモリで索引を作成する
+        """
+        segment_index = SegmentIndex(
+            output_path, merge_factor=self.args.merge_factor, positions=self.args.positions,
+        )
+        indexed = {}    # {(カテゴリー, 記事id): ダイジェスト}
+        if self.args.incremental:
+            indexed = segment_index.document_digests()
+        replace = not self.args.incremental    # 作り直す場合も、新しいセグメントができるまで今の索引を残す
+        articles = (
+            article
+            for article in self.jsonProcesser.iter_json(input_path, self.args.category, self.args.frontier_path)
+            if indexed.get((article['category'], article['id'])) != article_digest(article)
+        )
+        if self.args.memory_budget is None:
+            with self.profiler.stage('read_json') as stats:
+                json_list = list(articles)
+                stats['documents'] = len(json_list)
+            with self.profiler.stage('morphological_analysis') as stats:
+                word_dict = self.morphologicalAnalyzer.morphological_analysis(json_list)
+                self.count_tokens(stats, word_dict)
+            self.add_statistics(word_dict)
+            with self.profiler.stage('write_segment') as stats:
+                segment_index.add_documents(json_list, word_dict, replace=replace)
+                stats['documents'] = added = len(json_list)
+        else:
+            # 読み込み・形態素解析・書き込みを記事ごとに交互に行うため、1つの段階として計測する
+            with self.profiler.stage('stream_build') as stats:
+                stats.update(documents=0, tokens=0)
+
+                def documents():
+                    for article, word_list in self.morphologicalAnalyzer.iter_analysis(articles):
+                        stats['documents'] += 1
+                        stats['tokens'] += len(word_list)
+                        self.add_document_statistics(word_list)
+                        yield article['category'], article['id'], word_list, article_digest(article)
+
+                name = segment_index.add_stream(
+                    documents(), self.args.memory_budget * 1024 * 1024, replace=replace,
+                )
+            segment = None if name is None else segment_index.segment(name)
+            added = 0 if segment is None else segment.open().doc_count
+        with self.profiler.stage('merge'):
+            segment_index.merge_in_background()
+            segment_index.wait()
+        print(f'{added} articles added ({len(segment_index.segments())} segments)')
+
+    def write_matrix(self, output_path, json_list=None, word_dict=None):
         """
-        引数から入力された変数をバイナリデータとして保存する
+        tf-idf行列を作成し、<output_path>/matrix.npzに保存する
+        json_listとword_dictが無ければセグメントの索引の全ての文書から作成する
         """
-        self.make_directories(output_path)
-        output_path = self.join_path(output_path, filename+'.pkl')
-        with open(output_path,'wb') as f:
-            pickle.dump(keep_var, f)
+        from matrix import MatrixBuilder   # pylint: disable=import-outside-toplevel
+        builder = MatrixBuilder()
+        if word_dict is None:
+            segment_index = SegmentIndex(output_path)
+            for entry in segment_index.load_manifest()['segments']:
+                builder.add_segment(segment_index.segment(entry['name']), set(entry.get('deleted', [])))
+        else:
+            for article in json_list:
+                builder.add_document(article['category'], article['id'], word_dict[article['id']][0])
+        matrix = builder.build()
+        matrix.save(output_path)
+        print(f'tf-idf matrix: {matrix.matrix.shape[0]} documents x {matrix.matrix.shape[1]} words')
+
+    def write_index(self, json_list, word_dict, output_path):
+        """
+        形態素解析の結果からtf, tf-idf, 転置インデックスを作成して保存する
+        """
+        category_set = self.jsonProcesser.make_category_set(json_list)  # set(カテゴリー)を作成
+        category_id = self.jsonProcesser.make_category_id(json_list)    # {id:カテゴリー}を作成
+        with self.profiler.stage('term_statistics'):
+            _, tf_dict, idf_dict = self.analyzer.term_statistics(word_dict) # 文書内の回数, tf, idfを1回の走査で計算する
+
+        ### 保存
+        with self.profiler.stage('write_tf_idf'):
+            self.analyzer.count_tf_idf(tf_dict, idf_dict, output_path) # idfインデックスを作成
+        with self.profiler.stage('write_tf'):
+            self.analyzer.make_tf(tf_dict, output_path)
+        with self.profiler.stage('write_inverted_index'):
+            self.analyzer.make_inverted_index(word_dict,category_id, category_set, output_path) # 転置インデックスを作成
+
+class Profiler:
+    """
+    索引作成の段階ごとに、経過時間・CPU時間・最大RSS・tracemallocのメモリの増減を計測するクラス
+    CPU時間には形態素解析のワーカープロセスの分も含める(終了したワーカーの分だけが加算される)
+    enabledがFalseなら何も計測しない
+    """
+
+    def __init__(self, enabled=False):
+        """
+        初期化します
+        """
+        self.enabled = enabled
+        self.stages = []
+        self.started = time.perf_counter()
+        self.started_cpu = self.cpu_seconds()
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
 
     @staticmethod
-    def open_pkl(path):
+    def cpu_seconds():
         """
-        引数からpklファイルを読み込み返す
+        このプロセスと終了した子プロセスのCPU時間(秒)の合計を返す
         """
-        with open(path, 'rb') as p:
-            l = pickle.load(p)
-        return l
-    
+        total = 0.0
+        for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+            usage = resource.getrusage(who)
+            total += usage.ru_utime + usage.ru_stime
+        return total
+
     @staticmethod
-    def open_file_list(input_path, input_category):
+    def max_rss(who=resource.RUSAGE_SELF):
         """
-        引数に指定されたファイルないのファイル名の配列を返す。
-        input_path:　入力ディレクトリ
-        input_category: 転置インデックスを作成する対象カテゴリ
+        最大RSS(バイト)を返す。macOSのru_maxrssはバイト、Linuxはキロバイト
         """
-        file_path = [] # フォルダ一覧
-        for tmp_category in input_category:
-            path = os.path.join(input_path,tmp_category,'*.json')
-            files = glob.glob(path)
-            for path in files:
-                file_path.append(path)
-        return file_path
+        max_rss = resource.getrusage(who).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        with文の間を1つの段階として計測する
+        with文で受け取る辞書にdocumentsやtokensを入れると、1秒あたりの件数も記録する
+        """
+        stats = {}
+        if not self.enabled:
+            yield stats
+            return
+        tracemalloc.reset_peak()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        wall = time.perf_counter()
+        cpu = self.cpu_seconds()
+        try:
+            yield stats
+        finally:
+            wall = time.perf_counter() - wall
+            memory, peak = tracemalloc.get_traced_memory()
+            entry = {
+                'stage': name,
+                'wall_seconds': round(wall, 6),
+                'cpu_seconds': round(self.cpu_seconds() - cpu, 6),
+                'max_rss_bytes': self.max_rss(),
+                'children_max_rss_bytes': self.max_rss(resource.RUSAGE_CHILDREN),
+                'tracemalloc_delta_bytes': memory - memory_before,
+                'tracemalloc_peak_bytes': peak - memory_before,
+            }
+            for key in ('documents', 'tokens'):
+                if key in stats:
+                    entry[key] = stats[key]
+                    entry[f'{key}_per_second'] = round(stats[key] / wall, 3) if wall > 0 else None
+            self.stages.append(entry)
+
+    def report(self):
+        """
+        計測結果をjsonにできる辞書で返す
+        """
+        wall = time.perf_counter() - self.started
+        documents = max((stage.get('documents', 0) for stage in self.stages), default=0)
+        tokens = max((stage.get('tokens', 0) for stage in self.stages), default=0)
+        return {
+            'argv': sys.argv,
+            'python': sys.version.split()[0],
+            'wall_seconds': round(wall, 6),
+            'cpu_seconds': round(self.cpu_seconds() - self.started_cpu, 6),
+            'max_rss_bytes': self.max_rss(),
+            'children_max_rss_bytes': self.max_rss(resource.RUSAGE_CHILDREN),
+            'documents': documents,
+            'tokens': tokens,
+            'documents_per_second': round(documents / wall, 3) if wall > 0 else None,
+            'tokens_per_second': round(tokens / wall, 3) if wall > 0 else None,
+            'stages': self.stages,
+        }
+
+    def write_report(self, path):
+        """
+        計測結果をjsonファイルに保存し、段階ごとの時間を表示する
+        """
+        report = self.report()
+        with open(path, 'w', encoding='utf-8') as a_file:
+            json.dump(report, a_file, ensure_ascii=False, indent=2)
+        for stage in report['stages']:
+            print(
+                f'{stage["stage"]: <24} {stage["wall_seconds"]: >9.3f} s'
+                f'  cpu {stage["cpu_seconds"]: >9.3f} s'
+                f'  peak {stage["tracemalloc_peak_bytes"] / 1024 / 1024: >8.1f} MB'
+            )
+        print(f'profile: {path} ({report["wall_seconds"]:.3f} s, max rss {report["max_rss_bytes"] / 1024 / 1024:.1f} MB)')
+
 
 class JsonProcessor:
     """
@@ -130,19 +340,41 @@ class JsonProcessor:
     def __init__(self):
         self.fileHandler = FileHandler()
 
-    def read_json(self,input_path, input_category):
+    def read_json(self,input_path, input_category, frontier_path=None):
         """
         引数のパスの辞書からjsonを読み込む。
         jsonからtitleとbodyのみの辞書をリスト形式で返す。
         """
-        path = self.fileHandler.open_file_list(input_path, input_category)
-        json_list = []
-        for tmp_path in path:
+        return list(self.iter_json(input_path, input_category, frontier_path))
+
+    def iter_json(self, input_path, input_category, frontier_path=None):
+        """
+        カテゴリーごとに記事を読み込み、url以外の辞書を順に返すジェネレータ
+        記事ストアがあるカテゴリーはストアを先頭から順に読み、無ければ記事ごとのjsonファイルを読む
+        クローラが重複と判定した記事(フロンティアの対応表にある記事)は返さない
+        """
+        duplicates = load_duplicates(
+            frontier_path or self.fileHandler.join_path(input_path, 'frontier.sqlite3')
+        )
+        for tmp_category in input_category:
+            if ArticleStore.exists(input_path, tmp_category):
+                store = ArticleStore(ArticleStore.category_path(input_path, tmp_category))
+                json_iter = store.articles()
+            else:
+                json_iter = self.load_json_files(input_path, tmp_category)
+            for json_raw_data in json_iter:
+                if (json_raw_data['category'], json_raw_data['id']) in duplicates:
+                    continue
+                del json_raw_data['url']
+                yield json_raw_data
+
+    def load_json_files(self, input_path, input_category):
+        """
+        カテゴリーの記事ごとのjsonファイルを読み込み、辞書を順に返すジェネレータ
+        """
+        for tmp_path in self.fileHandler.open_file_list(input_path, [input_category]):
             with open(tmp_path) as f:
-                json_raw_data = json.load(f)
-            del  json_raw_data['url']
-            json_list.append(json_raw_data)
-        return json_list
+                yield json.load(f)
 
     @staticmethod
     def make_category_set(json_list):
@@ -165,34 +397,229 @@ class JsonProcessor:
             category_id[json_tmp['id']] = json_tmp['category']
         return category_id
 
+class TokenCache:
+    """
+    形態素解析の結果(名詞のリスト)をSQLiteに保存するクラス
+    キーはタイトル+本文とMeCab・辞書の版から作るため、記事か辞書が変われば使われない
+    合計サイズがmax_bytesを超えたら最後に使ってから長いものから削除する
+    """
+    TOKENIZER_VERSION = 1   # 名詞の取り出し方を変えたら上げる
+    NAME = 'token_cache.sqlite3'
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024):
+        """
+        初期化します
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # パイプラインでは作成したスレッドとは別の索引スレッドから使う(同時には使わない)
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.max_bytes = max_bytes
+        self.version = None
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS tokens (
+                    key TEXT PRIMARY KEY,
+                    words TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    used_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS tokens_used_at ON tokens (used_at);
+            """)
+        self.total_size = self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM tokens'
+        ).fetchone()[0]
+
+    @classmethod
+    def default_path(cls, index_path):
+        """
+        索引のディレクトリに置くキャッシュのファイル名を返す
+        indexer.pyとpipeline.pyで同じキャッシュを使うため、どちらもこのファイル名を使う
+        """
+        return os.path.join(index_path, cls.NAME)
+
+    def key(self, text):
+        """
+        テキストとMeCab・辞書の版からキーを作成し返す
+        """
+        if self.version is None:
+            import MeCab    # pylint: disable=import-outside-toplevel
+            info = MorphologicalAnalyzer.get_tagger().dictionary_info()
+            self.version = (
+                f'{self.TOKENIZER_VERSION}:{MeCab.VERSION}:'
+                f'{info.filename}:{info.version}:{info.size}:{info.charset}'
+            )
+        return hashlib.sha1(f'{self.version}\0{text}'.encode('utf-8')).hexdigest()
+
+    def get_many(self, keys):
+        """
+        keysのうち保存済みのものを{key: 改行区切りの名詞}で返し、使用時刻を更新する
+        """
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), 500):  # SQLiteの変数の上限を超えないように分ける
+            chunk = keys[start:start + 500]
+            found.update(self.connection.execute(
+                f'SELECT key, words FROM tokens WHERE key IN ({",".join("?" * len(chunk))})',
+                chunk,
+            ))
+        if found:
+            now = time.time()
+            with self.connection:
+                self.connection.executemany(
+                    'UPDATE tokens SET used_at = ? WHERE key = ?', ((now, key) for key in found),
+                )
+        return found
+
+    def put_many(self, items):
+        """
+        [(key, 改行区切りの名詞)]を保存し、上限を超えていれば古いものを削除する
+        """
+        now = time.time()
+        rows = [(key, words, len(words.encode('utf-8')), now) for key, words in items]
+        if not rows:
+            return
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO tokens (key, words, size, used_at) VALUES (?, ?, ?, ?)', rows,
+            )
+        self.total_size += sum(row[2] for row in rows)
+        if self.total_size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        新しいものから数えて合計がmax_bytesを超える分を削除する
+        """
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM tokens WHERE key IN (SELECT key FROM ('
+                ' SELECT key, SUM(size) OVER (ORDER BY used_at DESC, key) AS total FROM tokens'
+                ') WHERE total > ?)',
+                (self.max_bytes,),
+            )
+        self.total_size = self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM tokens'
+        ).fetchone()[0]
+
+    def close(self):
+        """
+        データベースを閉じる
+        """
+        self.connection.close()
+
+
 class MorphologicalAnalyzer:
     """
     形態素解析を行うクラスです
+    workersが2以上なら記事をbatch_size件ずつワーカープロセスで解析する
+    タガーはプロセスごとに1つだけ作成して使い回す
+    cacheを指定すると、解析済みの記事はMeCabを使わずキャッシュから返す
     """
-    @staticmethod
-    def morphological_analysis(json_list):
+    tagger = None   # このプロセスのタガー
+
+    def __init__(self, workers=1, batch_size=64, cache=None):
+        """
+        初期化します
+        """
+        self.workers = workers
+        self.batch_size = batch_size
+        self.cache = cache
+
+    @classmethod
+    def get_tagger(cls):
+        """
+        このプロセスのタガーを返す。無ければ作成する
+        """
+        if cls.tagger is None:
+            import MeCab    # pylint: disable=import-outside-toplevel
+            cls.tagger = MeCab.Tagger('')
+            cls.tagger.parse('')
+        return cls.tagger
+
+    @classmethod
+    def tokenize(cls, text):
+        """
+        テキストを形態素解析し、名詞のリストを返す
+        """
+        node = cls.get_tagger().parseToNode(text)
+        word_list = []
+        while node:
+            term = node.surface
+            pos = node.feature.split(',')[0]
+            if pos in '名詞':
+                word_list.append(term)
+            node = node.next
+        return word_list
+
+    @classmethod
+    def tokenize_batch(cls, texts):
+        """
+        テキストのリストを形態素解析し、改行区切りの名詞のリストを返す
+        プロセス間で受け渡す量を減らすため、名詞のリストは1つの文字列にする
+        """
+        return ['\n'.join(cls.tokenize(text)) for text in texts]
+
+    def tokenize_texts(self, texts, executor=None):
+        """
+        テキストのリストを形態素解析し、改行区切りの名詞のリストを返す
+        executorがあればbatch_size件ずつワーカープロセスで解析する
+        """
+        if executor is None:
+            return self.tokenize_batch(texts)
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        return [words for results in executor.map(self.tokenize_batch, batches) for words in results]
+
+    def analyze_chunk(self, chunk, executor=None):
+        """
+        [(記事, テキスト)]のうちキャッシュに無いものだけを形態素解析し、(記事, [word_list])のリストを返す
+        """
+        texts = [text for _, text in chunk]
+        if self.cache is None:
+            words_list = self.tokenize_texts(texts, executor)
+        else:
+            keys = [self.cache.key(text) for text in texts]
+            cached = self.cache.get_many(keys)
+            misses = [index for index, key in enumerate(keys) if key not in cached]
+            tokenized = self.tokenize_texts([texts[index] for index in misses], executor)
+            self.cache.put_many(
+                (keys[index], words) for index, words in zip(misses, tokenized)
+            )
+            words_list = [cached.get(key) for key in keys]
+            for index, words in zip(misses, tokenized):
+                words_list[index] = words
+        return [
+            (article, words.split('\n') if words else [])
+            for (article, _), words in zip(chunk, words_list)
+        ]
+
+    def iter_analysis(self, json_list):
+        """
+        記事を形態素解析し、(記事, [word_list])を記事の順に返すジェネレータ
+        json_listはイテラブルでもよく、一度に読むのはchunk_size件だけ
+        """
+        texts = ((article, article['title'] + '\n' + article['body']) for article in json_list)
+        chunk_size = self.batch_size * max(1, self.workers) * 4
+        chunks = iter(lambda: list(itertools.islice(texts, chunk_size)), [])
+        if self.workers <= 1:
+            for chunk in chunks:
+                yield from self.analyze_chunk(chunk)
+            return
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=self.get_tagger) as executor:
+            for chunk in chunks:
+                yield from self.analyze_chunk(chunk, executor)
+
+    def morphological_analysis(self, json_list):
         """
         入力の辞書リストから形態素解析を行い単語を返す。
         return {id:[[word_list],(word_set)]}  <2>
         """
         word_dict = {}
-        for article in json_list:
-            text = article['title'] + '\n' + article['body']
-            tagger = MeCab.Tagger('')
-            tagger.parse('')
-            node = tagger.parseToNode(text)
-            word_set = set()
-            word_list = []
-            while node:
-                term = node.surface
-                pos = node.feature.split(',')[0]
-                if pos in '名詞':
-                    word_set.add(term)
-                    word_list.append(term)
-                node = node.next
-            word_dict[article['id']] = [word_list, word_set]
+        for article, word_list in self.iter_analysis(json_list):
+            word_dict[article['id']] = [word_list, set(word_list)]
         return word_dict
-    
+
 class Analyzer:
     """
     文書の頻度などを計算するクラス
@@ -200,19 +627,34 @@ class Analyzer:
     def __init__(self):
         self.fileHandler = FileHandler()
 
+    @staticmethod
+    def term_statistics(word_dict):
+        """
+        全ての文書を1回だけ走査し、文書内の回数, tf, idfを計算する
+        make_word_count, count_tf, count_idfと同じ値を返す
+        return {id:{word:回数}}, {id:{word:tf}}, {word:idf}
+        """
+        word_count_dict = {}
+        tf_dict = {}
+        document_frequency = Counter()  # 単語が出現する文書数
+        for id in word_dict:
+            word_list = word_dict[id][0]
+            word_count = Counter(word_list)
+            all_count = len(word_list)  # 文章内の単語数
+            word_count_dict[id] = word_count
+            tf_dict[id] = {word: count / all_count for word, count in word_count.items()}
+            document_frequency.update(word_count.keys())
+        count_id = len(word_dict) # 全文書数
+        idf_dict = {word: math.log(count_id / count) for word, count in document_frequency.items()}
+        return word_count_dict, tf_dict, idf_dict
+
     @staticmethod
     def make_word_count(word_dict):
         """
         ワードごとに回数リストを作成する。
         return {id:{word:回数}}<3>
         """
-        word_count_dict = {}
-        for article in word_dict:       # 全てのidで繰り返し
-            word_count = {}
-            for word in word_dict[article][1]:  # setのみを抽出
-                word_count[word] = word_dict[article][0].count(word)
-            word_count_dict[article] = word_count
-        return word_count_dict
+        return {id: Counter(word_dict[id][0]) for id in word_dict}
 
     @staticmethod
     def count_tf(word_count_dict):
@@ -223,30 +665,13 @@ class Analyzer:
         return {id:{word:tf}}
         参考：https://atmarkit.itmedia.co.jp/ait/articles/2112/23/news028.html
         """
-        all_count_dict = {} #文章内の単語数を計算
-        tf_dict = copy.deepcopy(word_count_dict) # 参照渡しを回避
+        tf_dict = {}
         for id in word_count_dict:
-            count = 0
-            for key in word_count_dict[id]:
-                count += word_count_dict[id][key]
-            all_count_dict[id] = count
-        for id in word_count_dict:
-            for key in word_count_dict[id]:
-                tf_dict[id][key] = word_count_dict[id][key] / all_count_dict[id] # tfを計算する。文書内での出現回数 / 文章ないの個数出現回数
+            all_count = sum(word_count_dict[id].values()) # 文章内の単語数
+            tf_dict[id] = {
+                key: count / all_count for key, count in word_count_dict[id].items()
+            } # tfを計算する。文書内での出現回数 / 文章ないの個数出現回数
         return tf_dict
-    
-    @staticmethod
-    def make_frequency_list(frequency):
-        """
-        tf値を頻度とその降順のx,yの配列で返す
-        """
-        cie_x = []
-        for i in range(len(frequency)):
-            frequency[i] = math.log(frequency[i])
-            cie_x.append(math.log(i+1))
-        frequency.sort(reverse=True)
-        cie = [[cie_x],[frequency]]
-        return cie
 
     @staticmethod
     def count_idf(json_list, word_count_dict, *category):
@@ -254,40 +679,20 @@ class Analyzer:
         idfを計算する
         return {id:{word:idf}}
         """
-        input_dict = {}
         if(len(category)==0):
-            input_dict = word_count_dict
+            input_ids = word_count_dict
         else:
-            for tmp_json in json_list: #全ての入力を結合
-                if(tmp_json['category'] in category):
-                    tmp_dict = {tmp_json['id']:word_count_dict.get(tmp_json['id'])}
-                    input_dict |= tmp_dict
-        
-        count_id = len(input_dict) # 全文書数
-        count_word = {} # 単語が出現する文書数
-        word_set = set()
-        # setを作る
-        for tmp in input_dict:
-            for key in input_dict.get(tmp):
-                word_set.add(key)
-        
-        # setから0の辞書を作成
-        for tmp in word_set:
-            count_word[tmp] = 0
-        
-        # ワードが出現する文書数を数える
-        for tmp_set in word_set: # キーワードに対して繰り返し
-            for tmp in input_dict:
-                for key in input_dict.get(tmp):
-                    if(key==tmp_set):
-                        count_word[tmp_set] += 1
-                        break
-        
+            input_ids = dict.fromkeys(
+                tmp_json['id'] for tmp_json in json_list if tmp_json['category'] in category
+            )
+        count_id = len(input_ids) # 全文書数
+        count_word = Counter() # 単語が出現する文書数
+        for tmp in input_ids:
+            count_word.update(word_count_dict[tmp].keys())
+
         #idfを計算
-        for key in count_word:
-            count_word[key] = math.log(count_id / count_word[key])
-        return count_word
-    
+        return {key: math.log(count_id / count) for key, count in count_word.items()}
+
     def count_tf_idf(self, tf_dict, idf_dict, output_path):
         """
         tfとidfからtf-idfを計算し、インデックスを作成し保存する
@@ -333,33 +738,6 @@ class Analyzer:
         for word_index in index:
             self.fileHandler.perpetuation(index[word_index], path, word_index)
 
-    @staticmethod
-    def make_frequency(word_count_dict):
-        """
-        プロット用の頻度を計算し返します。
-        return frequency[頻度,,,] (降順)
-        """
-        frequency = [] #頻度
-        word_count = {} #単語:回数
-        all_count = 0 # 全体の回数
-
-        # ワードごとの回数を集計する
-        for tmp_id in word_count_dict:
-            for tmp_word in word_count_dict[tmp_id]:
-                tmp_count = word_count_dict[tmp_id][tmp_word]
-                if tmp_word in word_count:
-                    word_count[tmp_word] += tmp_count
-                else:
-                    word_count[tmp_word] = tmp_count
-                all_count += tmp_count
-        
-        # 辞書から頻度を作成
-        for tmp_id in word_count:
-            frequency.append(word_count[tmp_id] / all_count)
-        return frequency
-        
-    
-    
     def make_inverted_index(self, word_dict, category_id, category_set, output_path):
         """
         転置インデックスを作成し、保存する
@@ -398,19 +776,32 @@ class Plot:
     """
     グラフを作成するクラスです
     """
-    def make_plot(self, frequency):
-        """
-        配列からグラフを作成する
-        """
-        cie = self.analyzer.make_frequency_list(frequency)
-        fig = plt.figure()
-        ax = fig.add_subplot(1, 1, 1)
-        ax.scatter(cie[0], cie[1])
-        ax.set_xlabel("rank(log)")
-        ax.set_ylabel("frequency(log)")
-        plt.show()
-
-    
+    @staticmethod
+    def make_plot(statistics, output=None):
+        """
+        コーパスの統計から、順位と頻度(Zipfの法則)と単語数と語彙数(Heapsの法則)の両対数グラフを作成する
+        outputを指定した場合は画面に表示せず、画像ファイルに保存する
+        """
+        import matplotlib   # pylint: disable=import-outside-toplevel
+        if output is not None:
+            matplotlib.use('Agg')   # 画面の無い環境でも保存できるようにする
+        import matplotlib.pyplot as plt     # pylint: disable=import-outside-toplevel
+        ranks, frequencies = statistics.zipf()
+        _, tokens, vocabulary = statistics.heaps()
+        fig, (zipf_ax, heaps_ax) = plt.subplots(1, 2, figsize=(10, 4))
+        zipf_ax.loglog(ranks, frequencies, marker='.', linestyle='none')
+        zipf_ax.set_xlabel("rank")
+        zipf_ax.set_ylabel("frequency")
+        heaps_ax.loglog(tokens, vocabulary, marker='.')
+        heaps_ax.set_xlabel("tokens")
+        heaps_ax.set_ylabel("vocabulary")
+        fig.tight_layout()
+        if output is None:
+            plt.show()
+        else:
+            fig.savefig(output)
+            plt.close(fig)
+            print(f'plot: {output}')
 
 
 def get_args():
@@ -430,11 +821,78 @@ def get_args():
         "-i", "--input_path", type=str, required=False, default='output',
         help="入力ディレクトリ名を指定します",
     )
+    parser.add_argument(
+        "--frontier_path", type=str, required=False, default=None,
+        help="クローラのフロンティアのファイル名を指定します。重複記事を索引から除きます(省略時は<input_path>/frontier.sqlite3)",
+    )
+    parser.add_argument(
+        "--workers", type=int, required=False, default=os.cpu_count(),
+        help="形態素解析を行うプロセス数を指定します",
+    )
+    parser.add_argument(
+        "--token_cache", type=str, required=False, default=None,
+        help="形態素解析のキャッシュのファイル名を指定します(省略時は<output_path>/token_cache.sqlite3)",
+    )
+    parser.add_argument(
+        "--token_cache_size", type=int, required=False, default=512,
+        help="形態素解析のキャッシュの上限(MB)を指定します",
+    )
+    parser.add_argument(
+        "--no_token_cache", action='store_true',
+        help="このオプションを付けると形態素解析のキャッシュを使いません",
+    )
+    parser.add_argument(
+        "--format", type=str, required=False, default='segments', choices=('segments', 'pickle'),
+        help="索引の形式を指定します。segments: セグメントの索引 / pickle: 単語ごとのpklファイル",
+    )
+    parser.add_argument(
+        "--incremental", action='store_true',
+        help="このオプションを付けると新しい記事と、索引した後で本文が変わった記事だけをセグメントとして追加します",
+    )
+    parser.add_argument(
+        "--merge_factor", type=int, required=False, default=4,
+        help="この数の同じ大きさのセグメントが並んだら1つに併合します",
+    )
+    parser.add_argument(
+        "--memory_budget", type=int, required=False, default=None,
+        help="記事を1件ずつ読み、転置リストに使うメモリの上限(MB)を超えたら中間ファイルに書き出して索引を作成します(--format segmentsのみ)",
+    )
+    parser.add_argument(
+        "--matrix", action='store_true',
+        help="ランキング検索用のtf-idf行列(matrix.npz)も作成します",
+    )
+    parser.add_argument(
+        "--positions", action='store_true',
+        help="フレーズ検索・近接検索用に単語の出現位置も保存します",
+    )
+    parser.add_argument(
+        "--profile", type=str, required=False, default=None,
+        help="段階ごとの時間・CPU時間・メモリを計測し、指定したjsonファイルに保存します",
+    )
+    parser.add_argument(
+        "--profile_dump", type=str, required=False, default=None,
+        help="cProfileの結果(pstats形式)を指定したファイルに保存します",
+    )
+    parser.add_argument(
+        "--stats", type=str, required=False, default=None,
+        help="Zipfの法則の曲線とHeapsの法則の語彙数の増え方を計算し、指定したjsonファイルに保存します",
+    )
+    parser.add_argument(
+        "--stats_interval", type=int, required=False, default=1000,
+        help="この文書数ごとに単語数と語彙数を表示します(--stats, --plot)",
+    )
     parser.add_argument(
         "-p", "--plot",action='store_true',
         help="このオプションを付けるとグラフをプロットします"
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--plot_output", type=str, required=False, default=None,
+        help="グラフを画面に表示せず、指定した画像ファイルに保存します(--plotも付けたことになります)",
+    )
+    args = parser.parse_args()
+    if args.plot_output is not None:
+        args.plot = True
+    return args
 
 
 def main():
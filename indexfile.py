@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+セグメントの索引を1つのファイルに保存し、mmapで読むプログラム
+単語の辞書は単語(UTF-8のバイト列)の昇順に並べた固定長の表で、二分探索で引く。
+転置リストはmmapのmemoryviewのままPostingCursorに渡すため、読み込み時にファイル全体を復元しない
+出現位置(フレーズ検索用)は任意で、単語ごとに転置リストと同じ文書順に保存する
+"""
+
+import mmap
+import os
+import shutil
+import struct
+from postings import PostingCursor
+from postings import decode_positions
+from postings import decode_varint
+from postings import encode_positions
+from postings import encode_postings
+
+MAGIC = b'MIYAIDX3'
+# 識別子, フラグ, 文書数, 単語数, 各セクションの先頭位置
+# (文書の表, 記事idの文字列, 単語の表, 単語の文字列, 転置リスト, 出現位置の表, 出現位置)
+HEADER = struct.Struct('<8sIII7Q')
+FLAG_POSITIONS = 1  # 出現位置を保存した索引ファイル
+# 文書の表: 記事idの文字列での位置, バイト数, 単語数
+DOC_ENTRY = struct.Struct('<III')
+# 単語の表: 単語の文字列での位置, バイト数, 転置リストでの位置, バイト数, 文書頻度
+TERM_ENTRY = struct.Struct('<IIQII')
+# 出現位置の表(単語の表と同じ順): 出現位置での位置, バイト数
+POSITION_ENTRY = struct.Struct('<QI')
+
+
+class IndexFileWriter:
+    """
+    索引ファイルを少しずつ書き込むクラス
+    各セクションを一時ファイルに書き、close()で1つのファイルにつなげるため、
+    書き込み中に保持するのはセクションの位置だけになる
+    単語はUTF-8のバイト列の昇順に追加する
+    """
+    SECTIONS = (
+        'doc_table', 'doc_keys', 'term_table', 'term_bytes', 'postings', 'position_table', 'positions',
+    )
+
+    def __init__(self, path, positions=False):
+        """
+        初期化します
+        positions: 出現位置も保存する場合はTrue
+        """
+        self.path = path
+        self.positions = positions
+        self.files = {
+            name: open(f'{path}.{name}.tmp', 'w+b') for name in self.SECTIONS
+        }
+        self.doc_count = 0
+        self.term_count = 0
+        self.last_term = None
+
+    def add_doc(self, category, article_id, length):
+        """
+        文書を追加し、文書番号を返す。文書番号は追加した順の連番
+        記事idはカテゴリーとタブ区切りで保存する
+        """
+        key = f'{category}\t{article_id}'.encode('utf-8')
+        doc_keys = self.files['doc_keys']
+        self.files['doc_table'].write(DOC_ENTRY.pack(doc_keys.tell(), len(key), length))
+        doc_keys.write(key)
+        self.doc_count += 1
+        return self.doc_count - 1
+
+    def add_term(self, word, entries, positions=None):
+        """
+        単語と転置リスト[(文書番号, 回数)]を追加する
+        positions: encode_positionsで圧縮した出現位置(出現位置を保存する場合)
+        """
+        self.add_encoded_term(word, encode_postings(entries), positions)
+
+    def add_encoded_term(self, word, data, positions=None):
+        """
+        単語とencode_postingsで圧縮した転置リストを追加する
+        positions: encode_positionsで圧縮した出現位置(出現位置を保存する場合)
+        """
+        encoded = word.encode('utf-8')
+        if self.last_term is not None and encoded <= self.last_term:
+            raise ValueError(f'{word} is not in sorted order')
+        if self.positions != (positions is not None):
+            raise ValueError(f'positions of {word} do not match the index')
+        self.last_term = encoded
+        document_frequency = decode_varint(data, 0)[0]
+        term_bytes = self.files['term_bytes']
+        postings = self.files['postings']
+        self.files['term_table'].write(TERM_ENTRY.pack(
+            term_bytes.tell(), len(encoded), postings.tell(), len(data), document_frequency,
+        ))
+        term_bytes.write(encoded)
+        postings.write(data)
+        if positions is not None:
+            self.files['position_table'].write(
+                POSITION_ENTRY.pack(self.files['positions'].tell(), len(positions)),
+            )
+            self.files['positions'].write(positions)
+        self.term_count += 1
+
+    def close(self):
+        """
+        ヘッダーと各セクションをつなげてファイルを作成し、一時ファイルを削除する
+        """
+        offsets = []
+        offset = HEADER.size
+        for name in self.SECTIONS:
+            offsets.append(offset)
+            offset += self.files[name].tell()
+        with open(self.path, 'wb') as a_file:
+            flags = FLAG_POSITIONS if self.positions else 0
+            a_file.write(HEADER.pack(MAGIC, flags, self.doc_count, self.term_count, *offsets))
+            for name in self.SECTIONS:
+                section = self.files[name]
+                section.seek(0)
+                shutil.copyfileobj(section, a_file)
+        self.abort()
+
+    def abort(self):
+        """
+        一時ファイルを閉じて削除する
+        """
+        for section in self.files.values():
+            section.close()
+            os.remove(section.name)
+
+
+def write_index_file(path, docs, postings, positions=None):
+    """
+    文書[(カテゴリー, 記事id, 単語数)]と転置リスト{word: [(文書番号, 回数)]}を1つのファイルに保存する
+    positions: 転置リストと同じ順の出現位置{word: [[位置]]}。Noneなら出現位置は保存しない
+    """
+    writer = IndexFileWriter(path, positions=positions is not None)
+    try:
+        for category, article_id, length in docs:
+            writer.add_doc(category, article_id, length)
+        for _, word in sorted((word.encode('utf-8'), word) for word in postings):
+            writer.add_term(
+                word, postings[word], None if positions is None else encode_positions(positions[word]),
+            )
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+
+class IndexFile:
+    """
+    write_index_fileで保存したファイルをmmapで読むクラス
+    開く時に読むのはヘッダーだけなので、開く時間は索引の大きさによらない
+    """
+
+    def __init__(self, path):
+        """
+        初期化します
+        """
+        with open(path, 'rb') as a_file:
+            self.map = mmap.mmap(a_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        (magic, flags, self.doc_count, self.term_count, self.doc_table, self.doc_keys, self.term_table,
+         self.term_bytes, self.postings, self.position_table, self.positions) = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not an index file of this version. Rebuild it with indexer.py')
+        self.has_positions = bool(flags & FLAG_POSITIONS)
+
+    def doc(self, doc_number):
+        """
+        文書番号の(カテゴリー, 記事id, 単語数)を返す
+        """
+        offset, size, length = DOC_ENTRY.unpack_from(
+            self.map, self.doc_table + doc_number * DOC_ENTRY.size,
+        )
+        start = self.doc_keys + offset
+        category, article_id = str(self.map[start:start + size], 'utf-8').split('\t', 1)
+        return category, article_id, length
+
+    def docs(self):
+        """
+        全ての文書の[(カテゴリー, 記事id, 単語数)]を返す
+        """
+        return [self.doc(doc_number) for doc_number in range(self.doc_count)]
+
+    def term_entry(self, position):
+        """
+        単語の表のposition番目を(単語のバイト列, 転置リストでの位置, バイト数, 文書頻度)で返す
+        """
+        offset, size, posting_offset, posting_size, frequency = TERM_ENTRY.unpack_from(
+            self.map, self.term_table + position * TERM_ENTRY.size,
+        )
+        start = self.term_bytes + offset
+        return self.map[start:start + size], posting_offset, posting_size, frequency
+
+    def find(self, word):
+        """
+        単語を二分探索し、単語の表での番号を返す。無ければNoneを返す
+        """
+        encoded = word.encode('utf-8')
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            term = self.term_entry(middle)[0]
+            if term < encoded:
+                low = middle + 1
+            elif term > encoded:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def term(self, position):
+        """
+        単語の表のposition番目の(word, PostingCursor)を返す
+        """
+        term, offset, size, _ = self.term_entry(position)
+        start = self.postings + offset
+        return str(term, 'utf-8'), PostingCursor(self.view[start:start + size])
+
+    def term_positions(self, position, entries):
+        """
+        単語の表のposition番目の、転置リストentriesの文書ごとの出現位置を順に返すジェネレータ
+        """
+        offset, size = POSITION_ENTRY.unpack_from(
+            self.map, self.position_table + position * POSITION_ENTRY.size,
+        )
+        start = self.positions + offset
+        return decode_positions(self.view[start:start + size], (count for _, count in entries))
+
+    def cursor(self, word):
+        """
+        単語の転置リストのPostingCursorを返す。単語が無ければNoneを返す
+        """
+        position = self.find(word)
+        return None if position is None else self.term(position)[1]
+
+    def document_frequency(self, word):
+        """
+        単語が出現する文書数を返す
+        """
+        position = self.find(word)
+        return 0 if position is None else self.term_entry(position)[3]
+
+    def iter_positions(self, word):
+        """
+        単語の(文書番号, [出現位置])を文書番号の順に返すジェネレータ
+        出現位置は文書の区切りを持たないため、転置リストと同時に先頭から読む
+        """
+        position = self.find(word)
+        if position is None or not self.has_positions:
+            return
+        entries = list(self.term(position)[1])
+        yield from zip((doc_number for doc_number, _ in entries), self.term_positions(position, entries))
+
+    def iter_terms(self):
+        """
+        全ての単語の(word, PostingCursor)を単語の昇順に返すジェネレータ
+        """
+        for position in range(self.term_count):
+            yield self.term(position)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+文書×単語のtf-idf行列(CSR形式の疎行列)を作成し、複数の単語の検索を行列とベクトルの積で順位付けするプログラム
+tf, idf, tf-idf, 文書ごとのL2ノルムはNumPyの配列の演算でまとめて計算する
+"""
+
+import os
+from array import array
+from collections import Counter
+import numpy as np
+from scipy import sparse
+
+MATRIX_NAME = 'matrix.npz'
+
+
+class MatrixBuilder:
+    """
+    文書ごとの単語の回数を(行, 列, 回数)の3つの配列に溜め、TfidfMatrixを作成するクラス
+    列の番号は単語を見つけた順に付け、最後に単語の昇順に付け直す
+    """
+
+    def __init__(self):
+        """
+        初期化します
+        """
+        self.categories = []
+        self.ids = []
+        self.lengths = array('q')   # 文書ごとの単語数
+        self.rows = array('q')
+        self.columns = array('q')
+        self.counts = array('q')
+        self.vocabulary = {}        # {word: 列の番号}
+
+    def add_document(self, category, article_id, word_list):
+        """
+        形態素解析した文書を1行として追加する
+        """
+        row = len(self.ids)
+        self.categories.append(category)
+        self.ids.append(article_id)
+        self.lengths.append(len(word_list))
+        for word, count in Counter(word_list).items():
+            self.rows.append(row)
+            self.columns.append(self.vocabulary.setdefault(word, len(self.vocabulary)))
+            self.counts.append(count)
+
+    def add_segment(self, segment, deleted=()):
+        """
+        セグメントの、新しいセグメントに置き換えられていない文書を追加する
+        """
+        index_file = segment.open()
+        rows = {}   # 文書番号 -> 行
+        for doc_number in range(index_file.doc_count):
+            if doc_number in deleted:
+                continue
+            category, article_id, length = index_file.doc(doc_number)
+            rows[doc_number] = len(self.ids)
+            self.categories.append(category)
+            self.ids.append(article_id)
+            self.lengths.append(length)
+        for word, cursor in index_file.iter_terms():
+            column = None
+            for doc_number, count in cursor:
+                row = rows.get(doc_number)
+                if row is None:
+                    continue
+                if column is None:
+                    column = self.vocabulary.setdefault(word, len(self.vocabulary))
+                self.rows.append(row)
+                self.columns.append(column)
+                self.counts.append(count)
+
+    def build(self):
+        """
+        tf-idf行列を作成し、TfidfMatrixを返す
+        """
+        terms = np.array(list(self.vocabulary), dtype=str)
+        order = np.argsort(terms)
+        remap = np.empty(len(terms), dtype=np.int64)
+        remap[order] = np.arange(len(terms))   # 見つけた順の番号 -> 単語の昇順の番号
+        counts = sparse.csr_matrix(
+            (
+                np.frombuffer(self.counts, dtype=np.int64).astype(np.float64),
+                (np.frombuffer(self.rows, dtype=np.int64),
+                 remap[np.frombuffer(self.columns, dtype=np.int64)]),
+            ),
+            shape=(len(self.ids), len(terms)),
+        )
+        lengths = np.frombuffer(self.lengths, dtype=np.int64)
+        return TfidfMatrix.from_counts(
+            counts, lengths, terms[order], np.array(self.categories, dtype=str),
+            np.array(self.ids, dtype=str),
+        )
+
+
+class TfidfMatrix:
+    """
+    tf-idf行列と、単語の辞書・文書の一覧・idf・文書のL2ノルムを保持するクラス
+    列は単語の昇順に並んでいるので、単語の列は二分探索(np.searchsorted)で引く
+    """
+
+    def __init__(self, matrix, idf, norms, terms, categories, ids):
+        """
+        初期化します
+        matrix: tf-idfのCSR行列(文書×単語)
+        """
+        self.matrix = matrix
+        self.idf = idf
+        self.norms = norms
+        self.terms = terms
+        self.categories = categories
+        self.ids = ids
+
+    @classmethod
+    def from_counts(cls, counts, lengths, terms, categories, ids):
+        """
+        文書×単語の回数の行列からtf, idf, tf-idf, L2ノルムを計算し、TfidfMatrixを返す
+        tf = 回数 / 文書の単語数, idf = log(文書数 / 文書頻度)
+        """
+        counts.sort_indices()
+        row_lengths = np.repeat(lengths, np.diff(counts.indptr))   # 非零要素ごとの文書の単語数
+        document_frequency = np.bincount(counts.indices, minlength=len(terms))
+        with np.errstate(divide='ignore'):
+            idf = np.log(len(ids) / document_frequency)
+        tfidf = counts.data / row_lengths * idf[counts.indices]
+        matrix = sparse.csr_matrix((tfidf, counts.indices, counts.indptr), shape=counts.shape)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        return cls(matrix, idf, norms, terms, categories, ids)
+
+    def save(self, path):
+        """
+        <path>/matrix.npzに保存する
+        """
+        tmp_path = os.path.join(path, f'{MATRIX_NAME}.{os.getpid()}.tmp.npz')
+        np.savez(
+            tmp_path, data=self.matrix.data, indices=self.matrix.indices,
+            indptr=self.matrix.indptr, shape=np.array(self.matrix.shape), idf=self.idf,
+            norms=self.norms, terms=self.terms, categories=self.categories, ids=self.ids,
+        )
+        os.replace(tmp_path, os.path.join(path, MATRIX_NAME))
+
+    @staticmethod
+    def exists(path):
+        """
+        保存したtf-idf行列が存在するかを返す
+        """
+        return os.path.isfile(os.path.join(path, MATRIX_NAME))
+
+    @classmethod
+    def load(cls, path):
+        """
+        <path>/matrix.npzを読み込み、TfidfMatrixを返す
+        """
+        with np.load(os.path.join(path, MATRIX_NAME), allow_pickle=False) as arrays:
+            matrix = sparse.csr_matrix(
+                (arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(arrays['shape']),
+            )
+            return cls(
+                matrix, arrays['idf'], arrays['norms'], arrays['terms'], arrays['categories'],
+                arrays['ids'],
+            )
+
+    def columns(self, words):
+        """
+        単語の列の番号の配列を返す。辞書に無い単語は除く
+        """
+        words = np.array(words, dtype=str)
+        positions = np.searchsorted(self.terms, words)
+        positions = np.minimum(positions, len(self.terms) - 1)
+        return positions[self.terms[positions] == words] if len(self.terms) else positions[:0]
+
+    def rank(self, words, categories, top=None):
+        """
+        単語の検索をコサイン類似度で順位付けし、[(記事id, スコア)]を高い順に返す
+        """
+        return self.rank_with_total(words, categories, top)[0]
+
+    def rank_with_total(self, words, categories, top=None):
+        """
+        rankと同じ順位付けを行い、(上位top件の[(記事id, スコア)], 一致した記事の総数)を返す
+        クエリのベクトル(単語の回数×idf)と行列の積を1回だけ計算する
+        """
+        if top is not None and top < 0:
+            raise ValueError(f'top must be non-negative: {top}')
+        columns, counts = np.unique(self.columns(words), return_counts=True)
+        if len(columns) == 0:
+            return [], 0
+        weights = counts * self.idf[columns]
+        query = np.zeros(self.matrix.shape[1])
+        query[columns] = weights
+        scores = self.matrix @ query
+        # 全ての文書に出現する単語はidfが0なので、一致は値ではなく要素の有無で判定し、スコアは0とする
+        matched = self.matrix[:, columns].getnnz(axis=1) > 0
+        denominators = self.norms * np.linalg.norm(weights)
+        scores = np.divide(scores, denominators, out=np.zeros_like(scores), where=denominators > 0)
+        candidates = np.flatnonzero(matched & np.isin(self.categories, list(categories)))
+        total = len(candidates)
+        if top is not None and top < total:
+            candidates = candidates[np.argpartition(-scores[candidates], top)[:top]]
+        candidates = candidates[np.lexsort((self.ids[candidates], -scores[candidates]))]
+        return [(str(self.ids[row]), float(scores[row])) for row in candidates], total
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+クローラが取得した記事をそのまま索引化するプログラム
+記事は有界キューで索引スレッドに渡し、一定間隔で新しい記事だけをセグメントとして追加するため、クロール中でも検索できる
+"""
+
+import queue
+import sys
+import threading
+import time
+from crawler import Crawler
+from crawler import DOMAINS
+from crawler import crawl_category
+from crawler import make_parser
+from indexer import Indexer
+from indexer import JsonProcessor
+from indexer import TokenCache
+from segments import SegmentIndex
+from segments import article_digest
+
+
+class Pipeline:
+    """
+    クロールと形態素解析・索引の作成を並行して行うクラス
+    """
+    STOP = object()     # 索引スレッドを終了させるための目印
+
+    def __init__(self, args):
+        """
+        初期化します
+        """
+        self.args = args
+        self.queue = queue.Queue(maxsize=args.queue_size)
+        self.indexer = Indexer(args)
+        self.jsonProcesser = JsonProcessor()
+        self.morphologicalAnalyzer = self.indexer.morphologicalAnalyzer
+        self.segment_index = SegmentIndex(
+            args.index_path, merge_factor=args.merge_factor, positions=args.positions,
+        )
+        self.error = None
+
+    def run(self):
+        """
+        保存済みの記事と新しく取得した記事を索引スレッドに渡す
+        """
+        consumer = threading.Thread(target=self.consume, daemon=True)
+        consumer.start()
+        try:
+            # 保存済みで索引に無い記事と、索引した後で更新された記事も索引に含める
+            indexed = self.segment_index.document_digests()
+            for article in self.jsonProcesser.iter_json(
+                    self.args.output_path, self.args.category, self.args.frontier_path,
+            ):
+                if indexed.get((article['category'], article['id'])) != article_digest(article):
+                    self.put_article(article)
+            app = Crawler(
+                self.args, domains=DOMAINS, sleep_time=self.args.sleep_time,
+                on_article=self.put_article,
+            )
+            for category_name in self.args.category:
+                crawl_category(app, category_name)
+        except KeyboardInterrupt:
+            print('パイプラインを終了します')
+        finally:
+            if self.error is None:
+                self.queue.put(self.STOP)
+            consumer.join()
+            self.segment_index.wait()
+        if self.error is not None:
+            raise self.error
+
+    def put_article(self, article):
+        """
+        記事をキューに入れる。キューが一杯なら空きを待つ
+        """
+        while True:
+            if self.error is not None:
+                raise RuntimeError('索引の作成に失敗しました') from self.error
+            try:
+                self.queue.put(article, timeout=1.0)
+                return
+            except queue.Full:
+                continue
+
+    def consume(self):
+        """
+        キューから記事を取り出して形態素解析し、
+        --flush_articles件ごと、または--flush_interval秒ごとにセグメントとして追加する
+        """
+        try:
+            articles = {}   # 前回の追加以降の記事 {id: 記事}
+            word_dict = {}  # {id:[[word_list],(word_set)]}
+            pending = 0
+            deadline = time.monotonic() + self.args.flush_interval
+            while True:
+                try:
+                    article = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    article = None
+                if article is self.STOP:
+                    break
+                if article is not None:
+                    article = {key: value for key, value in article.items() if key != 'url'}
+                    articles[article['id']] = article
+                    word_dict |= self.morphologicalAnalyzer.morphological_analysis([article])
+                    pending += 1
+                if time.monotonic() >= deadline or pending >= self.args.flush_articles:
+                    if pending:
+                        self.flush(articles, word_dict)
+                        articles, word_dict, pending = {}, {}, 0
+                    deadline = time.monotonic() + self.args.flush_interval
+            if pending:
+                self.flush(articles, word_dict)
+        except BaseException as error:  # pylint: disable=broad-except
+            self.error = error
+
+    def flush(self, articles, word_dict):
+        """
+        前回の追加以降の記事をセグメントとして追加し、必要なら裏で併合する
+        """
+        start = time.perf_counter()
+        self.segment_index.add_documents(articles.values(), word_dict)
+        self.segment_index.merge_in_background()
+        print(f'index: {len(articles)} articles flushed ({time.perf_counter() - start:.2f} s)')
+
+
+def get_args():
+    """
+    コマンドライン引数を応答します
+    クローラの引数に索引用の引数を加える
+    """
+    parser = make_parser()
+    parser.add_argument(
+        "--index_path", type=str, required=False, default='index',
+        help="索引の出力ディレクトリ名を指定します",
+    )
+    parser.add_argument(
+        "--queue_size", type=int, required=False, default=100,
+        help="索引スレッドに渡す記事のキューの大きさを指定します",
+    )
+    parser.add_argument(
+        "--flush_interval", type=float, required=False, default=60.0,
+        help="索引を保存する間隔(秒)を指定します",
+    )
+    parser.add_argument(
+        "--flush_articles", type=int, required=False, default=100,
+        help="この件数の記事を追加するたびに索引を保存します",
+    )
+    parser.add_argument(
+        "--token_cache", type=str, required=False, default=None,
+        help="形態素解析のキャッシュのファイル名を指定します(省略時はindexer.pyと同じ<index_path>/token_cache.sqlite3)",
+    )
+    parser.add_argument(
+        "--token_cache_size", type=int, required=False, default=512,
+        help="形態素解析のキャッシュの上限(MB)を指定します",
+    )
+    parser.add_argument(
+        "--no_token_cache", action='store_true',
+        help="このオプションを付けると形態素解析のキャッシュを使いません",
+    )
+    parser.add_argument(
+        "--merge_factor", type=int, required=False, default=4,
+        help="この数の同じ大きさのセグメントが並んだら1つに併合します",
+    )
+    parser.add_argument(
+        "--positions", action='store_true',
+        help="フレーズ検索・近接検索用に単語の出現位置も保存します",
+    )
+    parser.set_defaults(workers=1)  # 記事は1件ずつ届くため、索引スレッドで解析する
+    parser.set_defaults(profile=None)  # 索引の段階ごとの計測はindexer.pyだけで行う
+    args = parser.parse_args()
+    if args.token_cache is None:
+        # Indexerの省略時の<output_path>はクロールの出力先になるため、索引のディレクトリに置く
+        args.token_cache = TokenCache.default_path(args.index_path)
+    return args
+
+
+def main():
+    """
+    メイン（main）プログラムです
+    常に0を応答します
+    """
+    args = get_args()
+    app = Pipeline(args)
+    app.run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
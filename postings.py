@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+転置リストを差分(ギャップ)の可変長整数(varint)で圧縮するプログラム
+文書は記事idではなく連続した整数の文書番号で表し、ブロックごとのスキップポインタで途中から読み出せる
+文書内の出現位置(名詞の並びでの番号)も同じく差分のvarintで圧縮する
+"""
+
+from bisect import bisect_left
+
+BLOCK_SIZE = 128    # スキップポインタ1つあたりの文書数
+
+
+def encode_varint(value, out):
+    """
+    0以上の整数を7ビットずつの可変長整数としてbytearrayに追記する
+    """
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(buffer, offset):
+    """
+    bufferのoffsetから可変長整数を読み、(値, 次の位置)を返す
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_postings(postings, block_size=BLOCK_SIZE):
+    """
+    文書番号の昇順の[(文書番号, 回数)]を圧縮したbytesを返す
+    形式: 文書数, ブロック数, [ブロックの最後の文書番号の差分, ブロックのバイト数]*,
+          [文書番号の差分, 回数]*
+    """
+    blocks = []
+    skips = []
+    previous = 0    # 直前のブロックの最後の文書番号
+    for start in range(0, len(postings), block_size):
+        block = bytearray()
+        last = previous
+        for doc_number, count in postings[start:start + block_size]:
+            encode_varint(doc_number - last, block)
+            encode_varint(count, block)
+            last = doc_number
+        skips.append((last - previous, len(block)))
+        blocks.append(block)
+        previous = last
+    out = bytearray()
+    encode_varint(len(postings), out)
+    encode_varint(len(blocks), out)
+    for last_gap, length in skips:
+        encode_varint(last_gap, out)
+        encode_varint(length, out)
+    for block in blocks:
+        out += block
+    return bytes(out)
+
+
+def concat_postings(buffers):
+    """
+    encode_postingsで圧縮した転置リストを、復元せずに順につなげたbytesを返す
+    各リストの文書番号は前のリストの文書番号より大きいこと。
+    ブロックはそのまま使い、各リストの最初の文書番号の差分と最初のスキップポインタだけを、
+    前のリストの最後の文書番号からの差分に付け直す
+    """
+    length = 0
+    skips = []      # [(ブロックの最後の文書番号の差分, ブロックのバイト数)]
+    blocks = []
+    previous = 0    # つなげた転置リストの最後の文書番号
+    for buffer in buffers:
+        count, offset = decode_varint(buffer, 0)
+        block_count, offset = decode_varint(buffer, offset)
+        if count == 0:
+            continue
+        buffer_skips = []
+        for _ in range(block_count):
+            last_gap, offset = decode_varint(buffer, offset)
+            size, offset = decode_varint(buffer, offset)
+            buffer_skips.append((last_gap, size))
+        first, start = decode_varint(buffer, offset)    # 最初の文書番号(0からの差分)
+        if length and first <= previous:
+            raise ValueError('document numbers of the postings are not increasing')
+        head = bytearray()
+        encode_varint(first - previous, head)
+        last_gap, size = buffer_skips[0]
+        end = offset + size
+        skips.append((last_gap - previous, len(head) + end - start))
+        blocks.append(head)
+        blocks.append(buffer[start:end])
+        for last_gap, size in buffer_skips[1:]:
+            skips.append((last_gap, size))
+            blocks.append(buffer[end:end + size])
+            end += size
+        previous = sum(last_gap for last_gap, _ in buffer_skips)
+        length += count
+    out = bytearray()
+    encode_varint(length, out)
+    encode_varint(len(skips), out)
+    for last_gap, size in skips:
+        encode_varint(last_gap, out)
+        encode_varint(size, out)
+    return b''.join([out] + blocks)
+
+
+def encode_positions(position_lists):
+    """
+    文書ごとの出現位置のリスト[[位置]]を圧縮したbytesを返す
+    文書ごとに最初の位置はそのまま、以降は直前の位置との差分をvarintで書く。
+    文書の区切りは書かないため、転置リストの回数で区切って読む
+    """
+    out = bytearray()
+    for positions in position_lists:
+        previous = 0
+        for position in positions:
+            encode_varint(position - previous, out)
+            previous = position
+    return bytes(out)
+
+
+def decode_positions(buffer, counts):
+    """
+    encode_positionsで圧縮したbufferから、文書ごとの回数countsに従って出現位置のリストを順に返すジェネレータ
+    """
+    offset = 0
+    for count in counts:
+        positions = []
+        position = 0
+        for _ in range(count):
+            gap = buffer[offset]
+            if gap < 0x80:
+                offset += 1
+            else:
+                gap, offset = decode_varint(buffer, offset)
+            position += gap
+            positions.append(position)
+        yield positions
+
+
+class PostingCursor:
+    """
+    圧縮した転置リストを必要な分だけ復元して読むクラス
+    復元はブロック単位で行い、advance(target)はスキップポインタでtarget未満のブロックを復元せずに飛ばす
+    """
+
+    def __init__(self, buffer):
+        """
+        初期化します
+        """
+        self.buffer = buffer
+        self.length, offset = decode_varint(buffer, 0)
+        block_count, offset = decode_varint(buffer, offset)
+        self.skips = []     # [(直前のブロックの最後の文書番号, このブロックの最後の文書番号)]
+        last = 0
+        lengths = []
+        for _ in range(block_count):
+            last_gap, offset = decode_varint(buffer, offset)
+            length, offset = decode_varint(buffer, offset)
+            self.skips.append((last, last + last_gap))
+            lengths.append(length)
+            last += last_gap
+        self.starts = []
+        for length in lengths:
+            self.starts.append(offset)
+            offset += length
+        self.ends = self.starts[1:] + [offset] if self.starts else []
+        self.block = -1
+        self.entries = []   # 復元した現在のブロックの[(文書番号, 回数)]
+        self.position = 0
+        self.current = None
+
+    def __len__(self):
+        return self.length
+
+    def decode_block(self, block):
+        """
+        ブロックを復元し、[(文書番号, 回数)]を返す
+        """
+        buffer = self.buffer
+        offset = self.starts[block]
+        end = self.ends[block]
+        doc_number = self.skips[block][0]
+        entries = []
+        while offset < end:
+            gap = buffer[offset]    # 1バイトに収まる値が大半なので先に判定する
+            if gap < 0x80:
+                offset += 1
+            else:
+                gap, offset = decode_varint(buffer, offset)
+            count = buffer[offset]
+            if count < 0x80:
+                offset += 1
+            else:
+                count, offset = decode_varint(buffer, offset)
+            doc_number += gap
+            entries.append((doc_number, count))
+        return entries
+
+    def __iter__(self):
+        """
+        (文書番号, 回数)を先頭から順に返すジェネレータ
+        """
+        for block in range(len(self.starts)):
+            yield from self.decode_block(block)
+
+    def load_block(self, block):
+        """
+        ブロックを復元して現在のブロックにする。ブロックが無ければFalseを返す
+        """
+        self.block = block
+        if block >= len(self.starts):
+            self.entries = []
+            self.current = None
+            return False
+        self.entries = self.decode_block(block)
+        self.position = 0
+        return True
+
+    def next(self):
+        """
+        次の(文書番号, 回数)を返す。終わりに達したらNoneを返す
+        """
+        if self.current is not None:
+            self.position += 1
+        if self.position >= len(self.entries) or self.block < 0:
+            if not self.load_block(self.block + 1):
+                return None
+        self.current = self.entries[self.position]
+        return self.current
+
+    def advance(self, target):
+        """
+        文書番号がtarget以上の最初の(文書番号, 回数)を返す。無ければNoneを返す
+        """
+        if self.current is not None and self.current[0] >= target:
+            return self.current
+        block = max(self.block, 0)
+        while block < len(self.skips) and self.skips[block][1] < target:
+            block += 1
+        if block >= len(self.skips):
+            self.block = block
+            self.entries = []
+            self.current = None
+            return None
+        if block != self.block:
+            self.load_block(block)
+        self.position = bisect_left(self.entries, (target,), self.position)
+        self.current = self.entries[self.position]  # ブロックの最後はtarget以上
+        return self.current
+
+
+def intersect(cursors):
+    """
+    全てのカーソルに含まれる文書番号を昇順のリストで返す
+    短い転置リストから順に、他のリストをスキップポインタで進める
+    """
+    if not cursors:
+        return []
+    cursors = sorted(cursors, key=len)
+    result = []
+    current = cursors[0].next()
+    while current is not None:
+        target = current[0]
+        for cursor in cursors[1:]:
+            found = cursor.advance(target)
+            if found is None:
+                return result
+            if found[0] != target:
+                target = found[0]
+                break
+        else:
+            result.append(target)
+            target += 1
+        current = cursors[0].advance(target)
+    return result
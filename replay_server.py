@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+記録したページを返すローカルのHTTPサーバー
+クローラの生htmlアーカイブ(無ければ生成したページ)を、指定した遅延・ゆらぎ・エラー率で返す。
+ネットワークに接続せずにクローラの性能を計測するために使う
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from argparse import ArgumentDefaultsHelpFormatter
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """
+    パスに対応するページを返すハンドラー
+    """
+    protocol_version = 'HTTP/1.1'   # keep-aliveで接続を使い回せるようにする
+    disable_nagle_algorithm = True  # ヘッダーと本文を別に送るため、遅延ACKの待ちを避ける
+
+    def do_GET(self):   # pylint: disable=invalid-name
+        """
+        GETリクエストに応答する
+        """
+        server = self.server
+        server.sleep()
+        if server.inject_error():
+            self.send_page(503, b'', {'Retry-After': str(server.retry_after)})
+            return
+        html_document = server.pages.get(urlparse(self.path).path)
+        if html_document is None:
+            self.send_page(404, b'')
+            return
+        self.send_page(200, html_document.encode('utf-8'))
+
+    def send_page(self, status, body, headers=None):
+        """
+        ステータスと本文を送信する
+        """
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """
+        アクセスログは表示しない
+        """
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    {パス: html}のページを返すサーバー
+    latency, jitter: 応答までの遅延と、その一様なゆらぎ(秒)
+    error_rate: 503(Retry-After付き)を返す割合
+    """
+    daemon_threads = True
+
+    def __init__(self, pages, port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 retry_after=1, seed=None):
+        """
+        初期化します
+        """
+        super().__init__(('127.0.0.1', port), ReplayHandler)
+        self.pages = pages
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        """
+        サーバーのurlを返す
+        """
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def sleep(self):
+        """
+        設定された遅延だけ待つ
+        """
+        with self.random_lock:
+            delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def inject_error(self):
+        """
+        エラーを返すかを決める
+        """
+        with self.random_lock:
+            return self.random.random() < self.error_rate
+
+
+def load_archive_pages(archive_path):
+    """
+    クローラの生htmlアーカイブから{パス: html}を作成し返す
+    """
+    from crawler import RawArchive    # pylint: disable=import-outside-toplevel
+    pages = {}
+    for category in sorted(os.listdir(archive_path)):
+        path = os.path.join(archive_path, category)
+        if not os.path.isdir(path):
+            continue
+        archive = RawArchive(path)
+        for url, html_document in archive.records():
+            pages[urlparse(url).path] = html_document
+    return pages
+
+
+def make_synthetic_pages(configures, listing_pages=4, articles_per_page=30, paragraphs=20):
+    """
+    カテゴリーの設定から一覧ページと記事ページを生成し、{パス: html}を返す
+    configures: [(category_name, start_urls, url_pattern)]
+    """
+    pages = {}
+    for category_name, start_urls, url_pattern in configures:
+        article_prefix = url_pattern.pattern.replace('.+', '')
+        for page_number, start_url in enumerate(list(start_urls)[:listing_pages]):
+            links = []
+            for index in range(articles_per_page):
+                article_id = f'{category_name}-{page_number}-{index}'
+                article_path = f'{article_prefix}{article_id}'
+                links.append(f'<li><a href="{article_path}">{article_id}</a></li>')
+                body = ''.join(
+                    f'<p>{category_name}の記事{article_id}の段落{number}。'
+                    f'政府は消費税の増税について議論した。</p>'
+                    for number in range(paragraphs)
+                )
+                pages[article_path] = (
+                    f'<html><head><title>記事 {article_id}</title></head><body>'
+                    f'<div class="header"><a href="/">ニュース</a></div>'
+                    f'<div class="article_body">{body}</div></body></html>'
+                )
+            pages[urlparse(start_url).path] = (
+                f'<html><head><title>{category_name} {page_number + 1}</title></head><body>'
+                f'<ul class="widget_boxlist_set">{"".join(links)}</ul></body></html>'
+            )
+    return pages
+
+
+def get_args():
+    """
+    コマンドライン引数を応答します
+    """
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "--port", type=int, required=False, default=8000,
+        help="待ち受けるポート番号を指定します",
+    )
+    parser.add_argument(
+        "--archive_path", type=str, required=False, default=None,
+        help="返すページのアーカイブのディレクトリ名を指定します。省略時はページを生成します",
+    )
+    parser.add_argument(
+        "--latency", type=float, required=False, default=0.0,
+        help="応答までの遅延(秒)を指定します",
+    )
+    parser.add_argument(
+        "--jitter", type=float, required=False, default=0.0,
+        help="遅延のゆらぎ(秒)を指定します",
+    )
+    parser.add_argument(
+        "--error_rate", type=float, required=False, default=0.0,
+        help="503を返す割合を指定します",
+    )
+    return parser.parse_args()
+
+
+def main():
+    """
+    メイン（main）プログラムです
+    常に0を応答します
+    """
+    args = get_args()
+    if args.archive_path:
+        pages = load_archive_pages(args.archive_path)
+    else:
+        from crawler import CONFIGURES    # pylint: disable=import-outside-toplevel
+        pages = make_synthetic_pages(configure() for configure in CONFIGURES.values())
+    server = ReplayServer(
+        pages, port=args.port, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate,
+    )
+    print(f'{len(pages)} pages on {server.base_url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('サーバーを終了します')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+索引を読み込んだまま検索に応答するローカルのHTTPサーバー
+索引(セグメント, tf-idf行列, またはカテゴリーごとのpkl)は起動時に1回だけ読み込み、
+GET /search?mode=and&word=...&category=... にjsonで応答する。検索ごとの時間は応答に含め、GET /statsで集計を返す
+索引が更新されたら(manifestなどの更新時刻が変われば)次の検索の前に読み込み直す
+"""
+
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from argparse import ArgumentDefaultsHelpFormatter
+from collections import OrderedDict
+from collections import deque
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+from filehandler import FileHandler
+from segments import SegmentIndex
+from segments import SegmentReader
+
+MODES = ('single', 'and', 'or', 'ranked', 'phrase', 'near')
+LATENCY_SAMPLES = 10000     # 集計に使う、検索モードごとの直近の検索数
+SCORE_CACHE_SIZE = 1024     # pklの索引で読み込んだままにする、単語ごとのtf, tf-idfの数
+
+
+class SearchError(Exception):
+    """
+    検索の条件が正しくないか、索引がその検索に対応していないことを表す例外
+    """
+
+
+class SearchService:
+    """
+    索引を読み込んだまま検索を行うクラス
+    複数のスレッドから同時に呼ばれるため、読み込んだ索引は置き換えるだけで書き換えない
+    """
+
+    def __init__(self, path, score_cache_size=SCORE_CACHE_SIZE):
+        """
+        初期化します
+        path: 索引のディレクトリ(indexer.pyの--output_path)
+        score_cache_size: pklの索引で、最近使ったものから読み込んだままにする単語ごとのtf, tf-idfの数
+        """
+        self.path = path
+        self.fileHandler = FileHandler()
+        self.lock = threading.Lock()
+        self.signature = None
+        self.reader = None      # セグメントの索引(SegmentReader)
+        self.matrix = None      # tf-idf行列(TfidfMatrix)
+        self.legacy = None      # pklの転置インデックス{カテゴリー: {word: [記事id]}}
+        self.score_cache = OrderedDict()    # pklの索引の{(tf/tf-idf, word): {記事id: 値}}。古く使ったものから並ぶ
+        self.score_cache_size = score_cache_size
+        self.cache_lock = threading.Lock()
+        self.latencies = {mode: deque(maxlen=LATENCY_SAMPLES) for mode in MODES}
+        self.counts = dict.fromkeys(MODES, 0)
+        self.stats_lock = threading.Lock()
+        self.started = time.time()
+        self.refresh()
+
+    def index_files(self):
+        """
+        更新を確認する索引のファイルの一覧を返す
+        """
+        return [
+            os.path.join(self.path, SegmentIndex.SEGMENTS_NAME, SegmentIndex.MANIFEST_NAME),
+            os.path.join(self.path, 'matrix.npz'),
+        ] + sorted(glob.glob(os.path.join(self.path, 'inverted_index', '*', 'inverted_index.pkl')))
+
+    def make_signature(self):
+        """
+        索引のファイルの(パス, 更新時刻)のタプルを返す
+        """
+        signature = []
+        for path in self.index_files():
+            try:
+                signature.append((path, os.stat(path).st_mtime_ns))
+            except FileNotFoundError:
+                continue
+        return tuple(signature)
+
+    def refresh(self):
+        """
+        索引が更新されていれば読み込み直す
+        """
+        signature = self.make_signature()
+        if signature == self.signature:
+            return
+        with self.lock:
+            if signature == self.signature:
+                return
+            self.load()
+            self.signature = signature
+
+    def load(self):
+        """
+        索引を読み込む
+        """
+        reader = None
+        legacy = None
+        matrix = None
+        if SegmentIndex.exists(self.path):
+            reader = SegmentReader(self.path, ()).open()
+        else:
+            legacy = {}
+            for path in glob.glob(os.path.join(self.path, 'inverted_index', '*', 'inverted_index.pkl')):
+                legacy[os.path.basename(os.path.dirname(path))] = self.fileHandler.open_pkl(path)
+        if os.path.isfile(os.path.join(self.path, 'matrix.npz')):
+            from matrix import TfidfMatrix     # pylint: disable=import-outside-toplevel
+            matrix = TfidfMatrix.load(self.path)
+        self.reader, self.legacy, self.matrix = reader, legacy, matrix
+        with self.cache_lock:
+            self.score_cache.clear()
+
+    def postings(self, word, categories, reader):
+        """
+        単語を含む記事idを昇順のリストで返す
+        """
+        if reader is not None:
+            return reader.postings(word)
+        ids = set()
+        for category in categories:
+            ids.update(self.legacy.get(category, {}).get(word, ()))
+        return sorted(ids)
+
+    def scores(self, word, kind, reader):
+        """
+        単語を含む記事の{記事id: 値}を返す。kindは'tf'か'tf-idf'
+        """
+        if reader is not None:
+            return reader.scores(word, kind)
+        key = (kind, word)
+        with self.cache_lock:
+            scores = self.score_cache.get(key)
+            if scores is not None:
+                self.score_cache.move_to_end(key)
+                return scores
+        path = self.fileHandler.join_path(self.path, kind, word + '.pkl')
+        scores = self.fileHandler.open_pkl(path) if os.path.isfile(path) else {}
+        with self.cache_lock:
+            self.score_cache[key] = scores
+            self.score_cache.move_to_end(key)
+            while len(self.score_cache) > self.score_cache_size:
+                self.score_cache.popitem(last=False)
+        return scores
+
+    @staticmethod
+    def ranking(scores, ids):
+        """
+        idsに含まれる記事の[[記事id, 値]]を値の高い順に返す
+        """
+        ids = set(ids)
+        ranking = [[article_id, score] for article_id, score in scores.items() if article_id in ids]
+        return sorted(ranking, key=lambda item: (-item[1], item[0]))
+
+    def search(self, mode, words, categories, distance=5, top=None):
+        """
+        検索を行い、結果と検索にかかった時間の辞書を返す
+        single: results=記事id, rankings={tf-idf, tf: [[記事id, 値]]}
+        and/or/phrase/near: results=記事id, ranked: results=[[記事id, コサイン類似度]]
+        """
+        if mode not in MODES:
+            raise SearchError(f'検索モード{mode}はありません。{", ".join(MODES)}のいずれかを指定してください。')
+        if not words:
+            raise SearchError('検索するワードを指定してください。')
+        if not categories:
+            raise SearchError('カテゴリーを指定してください。')
+        if top is not None and top < 0:
+            raise SearchError('topには0以上の件数を指定してください。')
+        if distance < 0:
+            raise SearchError('distanceには0以上の語数を指定してください。')
+        start = time.perf_counter()
+        self.refresh()
+        reader, matrix = self.reader, self.matrix   # 検索中に読み込み直されても同じ索引を使う
+        if reader is not None:
+            reader = reader.with_categories(categories)
+        response = {'mode': mode, 'words': words, 'categories': categories}
+        if mode == 'ranked':
+            if matrix is None:
+                raise SearchError('tf-idf行列がありません。indexer.pyを--matrixを付けて実行してください。')
+            ranking, response['count'] = matrix.rank_with_total(words, categories, top)
+            response['results'] = [[article_id, score] for article_id, score in ranking]
+        elif mode == 'single':
+            ids = self.postings(words[0], categories, reader)
+            response['results'] = ids
+            response['rankings'] = {
+                kind: self.ranking(self.scores(words[0], kind, reader), ids) for kind in ('tf-idf', 'tf')
+            }
+        elif mode == 'and':
+            if reader is not None:
+                response['results'] = reader.intersect(words)
+            else:
+                ids = set(self.postings(words[0], categories, reader))
+                for word in words[1:]:
+                    ids &= set(self.postings(word, categories, reader))
+                response['results'] = sorted(ids)
+        elif mode == 'or':
+            ids = set()
+            for word in words:
+                ids.update(self.postings(word, categories, reader))
+            response['results'] = sorted(ids)
+        else:
+            if reader is None or not reader.has_positions:
+                raise SearchError('索引に出現位置がありません。indexer.pyを--positionsを付けて実行してください。')
+            if mode == 'phrase':
+                response['results'] = reader.phrase(words)
+            else:
+                response['results'] = reader.near(words, distance)
+        response.setdefault('count', len(response['results']))    # rankedは上位top件に絞る前の件数
+        if top is not None:
+            response['results'] = response['results'][:top]
+        seconds = time.perf_counter() - start
+        with self.stats_lock:
+            self.latencies[mode].append(seconds)
+            self.counts[mode] += 1
+        response['latency_ms'] = seconds * 1000
+        return response
+
+    def stats(self):
+        """
+        検索モードごとの検索数と、直近の検索の時間(ミリ秒)の分位点を辞書で返す
+        """
+        modes = {}
+        for mode in MODES:
+            with self.stats_lock:
+                latencies = sorted(self.latencies[mode])
+            if not latencies:
+                continue
+            modes[mode] = {
+                'queries': self.counts[mode],
+                'p50_ms': latencies[len(latencies) // 2] * 1000,
+                'p95_ms': latencies[min(len(latencies) - 1, len(latencies) * 95 // 100)] * 1000,
+                'max_ms': latencies[-1] * 1000,
+            }
+        reader = self.reader
+        return {
+            'index': 'segments' if reader is not None else 'pickle',
+            'documents': reader.document_count if reader is not None else None,
+            'matrix': self.matrix is not None,
+            'uptime_seconds': time.time() - self.started,
+            'modes': modes,
+        }
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    """
+    GET /search と GET /stats にjsonで応答するハンドラー
+    """
+    protocol_version = 'HTTP/1.1'   # keep-aliveで接続を使い回せるようにする
+    disable_nagle_algorithm = True  # ヘッダーと本文を別に送るため、遅延ACKの待ちを避ける
+
+    def do_GET(self):   # pylint: disable=invalid-name
+        """
+        GETリクエストに応答する
+        """
+        url = urlparse(self.path)
+        service = self.server.service
+        if url.path == '/stats':
+            self.send_json(200, service.stats())
+            return
+        if url.path != '/search':
+            self.send_json(404, {'error': f'{url.path}はありません。'})
+            return
+        query = parse_qs(url.query)
+        try:
+            mode = query.get('mode', ['single'])[0]
+            distance = int(query.get('distance', ['5'])[0])
+            top = int(query['top'][0]) if 'top' in query else None
+            response = service.search(
+                mode, query.get('word', []), query.get('category', []), distance, top,
+            )
+        except (SearchError, ValueError) as error:
+            self.send_json(400, {'error': str(error)})
+            return
+        if self.server.verbose:
+            print(
+                f'{response["mode"]: <6} {" ".join(response["words"])}: {response["count"]} documents'
+                f' ({response["latency_ms"]:.2f} ms)'
+            )
+        self.send_json(200, response)
+
+    def send_json(self, status, data):
+        """
+        ステータスとjsonの本文を送信する
+        """
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """
+        アクセスログは表示しない
+        """
+
+
+class SearchServer(ThreadingHTTPServer):
+    """
+    SearchServiceの検索に応答するサーバー。リクエストごとのスレッドで同時に検索する
+    """
+    daemon_threads = True
+
+    def __init__(self, service, host='127.0.0.1', port=0, verbose=False):
+        """
+        初期化します
+        verbose: 検索ごとに結果の件数と時間を表示する場合はTrue
+        """
+        super().__init__((host, port), SearchHandler)
+        self.service = service
+        self.verbose = verbose
+
+    @property
+    def base_url(self):
+        """
+        サーバーのurlを返す
+        """
+        return f'http://{self.server_address[0]}:{self.server_port}'
+
+
+def get_args():
+    """
+    コマンドライン引数を応答します
+    """
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "-i", "--input_path", type=str, required=False, default='index',
+        help="入力フォルダを指定します",
+    )
+    parser.add_argument(
+        "--host", type=str, required=False, default='127.0.0.1',
+        help="待ち受けるアドレスを指定します",
+    )
+    parser.add_argument(
+        "--port", type=int, required=False, default=8080,
+        help="待ち受けるポート番号を指定します",
+    )
+    parser.add_argument(
+        "--score_cache_size", type=int, required=False, default=SCORE_CACHE_SIZE,
+        help="pklの索引で、最近使ったものから読み込んだままにする単語ごとのtf, tf-idfの数を指定します",
+    )
+    parser.add_argument(
+        "--verbose", action='store_true',
+        help="このオプションを付けると検索ごとに結果の件数と時間を表示します",
+    )
+    return parser.parse_args()
+
+
+def main():
+    """
+    メイン（main）プログラムです
+    常に0を応答します
+    """
+    args = get_args()
+    start = time.perf_counter()
+    service = SearchService(args.input_path, args.score_cache_size)
+    server = SearchServer(service, host=args.host, port=args.port, verbose=args.verbose)
+    stats = service.stats()
+    print(
+        f'{stats["index"]} index loaded in {time.perf_counter() - start:.2f} s'
+        f' (matrix: {"yes" if stats["matrix"] else "no"}) on {server.base_url}'
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('サーバーを終了します')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
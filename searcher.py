@@ -19,7 +19,9 @@ import copy
 import math
 from argparse import ArgumentParser
 from argparse import ArgumentDefaultsHelpFormatter
-from indexer import FileHandler
+from filehandler import FileHandler
+from segments import SegmentIndex
+from segments import SegmentReader
 
 
 
@@ -46,23 +48,88 @@ class Searcher:
             input_path = self.fileHandler.join_path(self.args.input_path)     # inputパス
             serach_word = self.args.search_word
             mode = self.args.mode
-            inverted_index_path = self.fileHandler.make_path(input_path, self.args.category)     # 転置インデックスのパス
-            inverted_index = self.makeindex.make_inverted_index(inverted_index_path)
+            # 検索サーバーに問い合わせる: 索引は読み込まない
+            if self.args.server:
+                self.search_server(serach_word, mode)
+                return
+            # ランキング検索: tf-idf行列だけを読む
+            if mode == 'ranked':
+                self.rank.rank_matrix(serach_word, input_path, self.args.category)
+                return
+            reader = None
+            if SegmentIndex.exists(input_path):
+                # セグメントの索引は必要な単語だけを読む
+                reader = SegmentReader(input_path, self.args.category)
+                inverted_index = reader
+            else:
+                inverted_index_path = self.fileHandler.make_path(input_path, self.args.category)     # 転置インデックスのパス
+                inverted_index = self.makeindex.make_inverted_index(inverted_index_path)
             self.serach_class = Serach(inverted_index)
             # 検索モード:single
             if mode == 'single':
                 id_list = self.serach_class.serach(serach_word[0])
-                self.rank.rank_sort_data(serach_word[0], id_list, input_path, 'tf-idf')
-                self.rank.rank_sort_data(serach_word[0], id_list, input_path, 'tf')
+                self.rank.rank_sort_data(serach_word[0], id_list, input_path, 'tf-idf', reader)
+                self.rank.rank_sort_data(serach_word[0], id_list, input_path, 'tf', reader)
             # AND検索
             elif mode == 'and':
-                self.serach_class.serach_and(serach_word)
+                if reader is not None:
+                    self.serach_class.print_ids(reader.intersect(serach_word))
+                else:
+                    self.serach_class.serach_and(serach_word)
             # OR検索
             elif mode == 'or':
                 self.serach_class.serach_or(serach_word)
+            # フレーズ検索・近接検索: 出現位置を保存したセグメントの索引だけで使える
+            elif mode in ('phrase', 'near'):
+                if reader is None or not reader.has_positions:
+                    print('索引に出現位置がありません。indexer.pyを--positionsを付けて実行してください。')
+                    sys.exit()
+                if mode == 'phrase':
+                    self.serach_class.print_ids(reader.phrase(serach_word))
+                else:
+                    self.serach_class.print_ids(reader.near(serach_word, self.args.distance))
         except KeyboardInterrupt:
             print('インデックスの作成を終了します')
 
+    def search_server(self, words, mode):
+        """
+        search_server.pyに検索を依頼し、このプログラムで検索した場合と同じ形式で結果を表示する
+        """
+        import json     # pylint: disable=import-outside-toplevel
+        from urllib.error import HTTPError     # pylint: disable=import-outside-toplevel
+        from urllib.error import URLError      # pylint: disable=import-outside-toplevel
+        from urllib.parse import urlencode     # pylint: disable=import-outside-toplevel
+        from urllib.request import urlopen     # pylint: disable=import-outside-toplevel
+        query = urlencode(
+            {'mode': mode, 'word': words, 'category': self.args.category, 'distance': self.args.distance},
+            doseq=True,
+        )
+        try:
+            with urlopen(f'{self.args.server.rstrip("/")}/search?{query}', timeout=self.args.timeout) as response:
+                result = json.load(response)
+        except HTTPError as error:
+            # サーバーの前にプロキシなどがあれば、本文がjsonでないこともある
+            try:
+                message = json.load(error)['error']
+            except (ValueError, KeyError, TypeError, OSError):
+                message = f'{error.code} {error.reason}'
+            print(message)
+            sys.exit()
+        except (URLError, OSError) as error:
+            # HTTPErrorもURLErrorの一種なので、サーバーの応答が無い場合だけここに来る
+            print(f'検索サーバー{self.args.server}に接続できません: {getattr(error, "reason", error)}')
+            sys.exit()
+        if not result['results']:
+            PrintMessage.not_fund()
+        if mode == 'ranked':
+            self.rank.printRank(dict(result['results']), 'マッチした文章をtf-idfのコサイン類似度でランキングします')
+        else:
+            PrintMessage.print_result(result['results'])
+            for kind, ranking in result.get('rankings', {}).items():
+                self.rank.printRank(dict(ranking), f'マッチした文章を{kind}でランキングします')
+        if self.args.verbose:
+            print(f'検索時間: {result["latency_ms"]:.2f} ms (サーバー)')
+
 
 
         
@@ -117,6 +184,17 @@ class Serach:
         else:
             self.printMessage.not_fund()
 
+    def print_ids(self, result):
+        """
+        検索結果の文書id一覧を表示して返す。
+        見つからなければプログラムを終了する
+        """
+        if len(result) >= 1:
+            self.printMessage.print_result(result)
+            return result
+        else:
+            self.printMessage.not_fund()
+
     def serach_or(self, word):
         """
         転置インデックスからワードをOR検索し文書id一覧を返す。
@@ -141,17 +219,21 @@ class Rank:
     def __init__(self):
         self.fileHandler = FileHandler()
 
-    def rank_sort_data(self, word, id_list, input_path, type):
+    def rank_sort_data(self, word, id_list, input_path, type, reader=None):
         """
         単語からから文書の引数typeのランキングを作成し出力する
         word = 検索ワード
         id_list = 該当する文書idのリスト
         input_path = 入力パス
         type = ランキング種別(ファイル名)
+        reader = セグメントの索引(SegmentReader)。Noneなら単語ごとのpklファイルを読む
         """
         # ワードのif-idfを読み込む
-        idf_path = self.fileHandler.join_path(input_path, type, word+'.pkl')  # idfのパス
-        load_tfidf_list = self.fileHandler.open_pkl(idf_path)
+        if reader is not None:
+            load_tfidf_list = reader.scores(word, type)
+        else:
+            idf_path = self.fileHandler.join_path(input_path, type, word+'.pkl')  # idfのパス
+            load_tfidf_list = self.fileHandler.open_pkl(idf_path)
 
         # 該当するtf-idfのみを抽出
         tfidf_list = {} # 該当する文書のifidfの辞書
@@ -161,13 +243,30 @@ class Rank:
 
         self.printRank(tfidf_list, f'マッチした文章を{type}でランキングします')
 
+    @staticmethod
+    def rank_matrix(words, input_path, category):
+        """
+        全ての検索ワードのtf-idf行列とのコサイン類似度で文書をランキングし出力する
+        words = 検索ワード
+        input_path = 入力パス(matrix.npzのあるフォルダ)
+        category = 検索対象のカテゴリー
+        """
+        from matrix import TfidfMatrix     # pylint: disable=import-outside-toplevel
+        if not TfidfMatrix.exists(input_path):
+            print('tf-idf行列がありません。indexer.pyを--matrixを付けて実行してください。')
+            sys.exit()
+        ranking = TfidfMatrix.load(input_path).rank(words, category)
+        if not ranking:
+            PrintMessage.not_fund()
+        Rank.printRank(dict(ranking), 'マッチした文章をtf-idfのコサイン類似度でランキングします')
+
     @staticmethod
     def printRank(dict, detail='ランキング表示します'):
         """
         入力の値からランキング表示します
         input: {文書id:値}, 表示するテキスト
         """
-        score_sorted = sorted(dict.items(), reverse=True, key=lambda x:x[1]) # ランク高い順でidの辞書を作成
+        score_sorted = sorted(dict.items(), key=lambda x:(-x[1], x[0])) # ランク高い順(同じ値はidの昇順)でidの辞書を作成
         print(detail)
         i = 0
         for tmp_tuple in score_sorted:
@@ -214,10 +313,11 @@ class PrintMessage:
     def print_result(result):
         """
         入力されたセットから結果を表示します。
+        検索の方法や--serverによらず同じ表示になるよう、文書idの昇順に並べる
         """
         print(len(result),end='')
         print('個の文書が見つかりました :',end='')
-        print(result)
+        print(sorted(result))
 
 
 
@@ -275,7 +375,23 @@ def get_args():
     )
     parser.add_argument(
         "-m", "--mode", type=str, required=False, default='single',
-        help="検索モードを指定します。single=1つのワードの検索 and=2ワードに対してand検索 or=2ワードに対してand検索",
+        help="検索モードを指定します。single=1つのワードの検索 and=2ワードに対してand検索 or=2ワードに対してand検索 ranked=全てのワードでランキング検索 phrase=ワードが連続する文書の検索 near=ワードが--distance語以内に出現する文書の検索",
+    )
+    parser.add_argument(
+        "--distance", type=int, required=False, default=5,
+        help="nearモードで全てのワードが出現する範囲の語数を指定します",
+    )
+    parser.add_argument(
+        "--server", type=str, required=False, default=None,
+        help="search_server.pyのurl(例: http://127.0.0.1:8080)を指定すると、索引を読み込まずにサーバーに検索を依頼します",
+    )
+    parser.add_argument(
+        "--timeout", type=float, required=False, default=10.0,
+        help="--serverの応答を待つ時間(秒)を指定します",
+    )
+    parser.add_argument(
+        "--verbose", action='store_true',
+        help="このオプションを付けると--serverでの検索時間も表示します",
     )
 
     return parser.parse_args()
@@ -0,0 +1,764 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+索引を追記専用のセグメントに分けて保存するプログラム
+新しい記事は小さなセグメントとして追加し、セグメントは裏で併合する(LSM)
+idfはセグメントごとの文書頻度を合算して検索時に計算するため、追加のたびに全体を作り直さない
+"""
+
+import copy
+import hashlib
+import json
+import math
+import os
+import shutil
+import sqlite3
+import threading
+from collections import Counter
+from indexfile import IndexFile
+from indexfile import write_index_file
+from spimi import SpimiBuilder
+from spimi import group_positions
+from postings import intersect
+
+
+def article_digest(article):
+    """
+    記事のタイトルと本文のダイジェストを返す。索引済みの記事が更新されたかの判定に使う
+    """
+    text = f"{article.get('title', '')}\n{article.get('body', '')}"
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class Segment:
+    """
+    変更しない1つのセグメントを読み書きするクラス
+    セグメントは1つの索引ファイル(<name>.idx)で、文書の表・単語の辞書・転置リストを持つ(indexfile.py)
+    文書番号(記事idの辞書)は文書の表の位置で、転置リストは文書番号の差分と回数をvarintで圧縮する
+    ファイルはmmapで開き、転置リストは単語ごとに必要な分だけ復元する
+    出現位置を保存したセグメントはフレーズ検索・近接検索に使える
+    """
+    SUFFIX = '.idx'
+
+    def __init__(self, path):
+        """
+        初期化します
+        """
+        self.path = path
+        self.name = os.path.basename(path)[:-len(self.SUFFIX)]
+        self.index_file = None  # 必要になるまで開かない
+        self.docs = None
+        self.keys = None
+
+    @classmethod
+    def write(cls, path, docs, postings, positions=None):
+        """
+        文書と転置リスト{word: [(文書番号, 回数)]}をセグメントとして保存し、Segmentを返す
+        positions: 転置リストと同じ順の出現位置{word: [[位置]]}。Noneなら出現位置は保存しない
+        書き込み途中のセグメントを読まないように、一時ファイルに書いてから名前を変える
+        """
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        write_index_file(tmp_path, docs, postings, positions)
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    @classmethod
+    def build(cls, path, articles, word_dict, positions=False):
+        """
+        記事と形態素解析の結果{id:[[word_list],(word_set)]}からセグメントを作成し返す
+        positions: 出現位置も保存する場合はTrue
+        """
+        docs = []
+        postings = {}
+        position_dict = {} if positions else None
+        for article in articles:
+            word_list = word_dict[article['id']][0]
+            doc_number = len(docs)
+            docs.append((article['category'], article['id'], len(word_list)))
+            for word, count in Counter(word_list).items():
+                postings.setdefault(word, []).append((doc_number, count))
+            if positions:
+                for word, word_positions in group_positions(word_list).items():
+                    position_dict.setdefault(word, []).append(word_positions)
+        return cls.write(path, docs, postings, position_dict)
+
+    @classmethod
+    def build_stream(cls, path, documents, memory_budget, positions=False):
+        """
+        (カテゴリー, 記事id, [word_list])を順に返すイテラブルから、
+        メモリの上限を超えないようにセグメントを作成し返す。文書が無ければNoneを返す
+        """
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        builder = SpimiBuilder(tmp_path, memory_budget, positions)
+        try:
+            for category, article_id, word_list in documents:
+                builder.add(category, article_id, word_list)
+        except BaseException:
+            builder.abort()
+            raise
+        if builder.finish() == 0:
+            os.remove(tmp_path)
+            return None
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    def open(self):
+        """
+        索引ファイルを開いて返す
+        """
+        if self.index_file is None:
+            self.index_file = IndexFile(self.path)
+        return self.index_file
+
+    def doc(self, doc_number):
+        """
+        文書番号の(カテゴリー, 記事id, 単語数)を返す
+        """
+        return self.open().doc(doc_number)
+
+    def load_docs(self):
+        """
+        文書の一覧を返す
+        """
+        if self.docs is None:
+            self.docs = self.open().docs()
+        return self.docs
+
+    def load_keys(self):
+        """
+        {(カテゴリー, 記事id): 文書番号}を返す
+        """
+        if self.keys is None:
+            self.keys = {
+                (category, article_id): doc_number
+                for doc_number, (category, article_id, _) in enumerate(self.load_docs())
+            }
+        return self.keys
+
+    def cursor(self, word):
+        """
+        単語の転置リストのPostingCursorを返す。単語が無ければNoneを返す
+        """
+        return self.open().cursor(word)
+
+    def iter_postings(self, word):
+        """
+        単語の(文書番号, 回数)を順に返すジェネレータ
+        """
+        cursor = self.cursor(word)
+        if cursor is not None:
+            yield from cursor
+
+    @property
+    def has_positions(self):
+        """
+        出現位置を保存したセグメントかを返す
+        """
+        return self.open().has_positions
+
+    def iter_positions(self, word):
+        """
+        単語の(文書番号, [出現位置])を順に返すジェネレータ
+        """
+        return self.open().iter_positions(word)
+
+    def iter_terms(self):
+        """
+        全ての単語の(word, [(文書番号, 回数)], [[出現位置]])を返すジェネレータ
+        出現位置を保存していなければ[[出現位置]]はNoneになる
+        """
+        index_file = self.open()
+        for position in range(index_file.term_count):
+            word, cursor = index_file.term(position)
+            entries = list(cursor)
+            positions = None
+            if index_file.has_positions:
+                positions = list(index_file.term_positions(position, entries))
+            yield word, entries, positions
+
+    def document_frequency(self, word):
+        """
+        このセグメントで単語が出現する文書数を返す
+        """
+        return self.open().document_frequency(word)
+
+
+class SegmentIndex:
+    """
+    セグメントの一覧(manifest.json)を管理し、追加・併合・検索用の統計を提供するクラス
+    各セグメントは文書数の桁(merge_factorを底とする対数)をlevelとして持ち、
+    merge_factor個の同じlevelのセグメントが連続して並んだら1つに併合する
+    新しいセグメントに同じ記事が追加されたら、古いセグメントの文書番号をmanifestのdeletedに記録する
+    索引済みの記事のダイジェスト(article_digest)はdigests.sqlite3に保存し、--incrementalで更新された記事を探すのに使う
+    positionsがTrueなら追加するセグメントに出現位置も保存する。併合後のセグメントは、
+    併合する全てのセグメントに出現位置がある場合だけ出現位置を持つ
+    manifestを書き換えるのは1つのプロセスだけとする
+    """
+    MANIFEST_NAME = 'manifest.json'
+    SEGMENTS_NAME = 'segments'
+    DIGESTS_NAME = 'digests.sqlite3'
+    DIGEST_BATCH = 1000     # 作成中のセグメントのダイジェストをまとめて書く件数
+
+    def __init__(self, path, merge_factor=4, positions=False):
+        """
+        初期化します
+        path: 索引のディレクトリ(セグメントは<path>/segmentsに保存する)
+        """
+        self.path = os.path.join(path, self.SEGMENTS_NAME)
+        self.merge_factor = merge_factor
+        self.positions = positions
+        self.lock = threading.Lock()
+        self.merge_thread = None
+        self.segment_cache = {}     # {name: Segment}
+        self.digests = None         # ダイジェストのデータベースの接続
+
+    @classmethod
+    def exists(cls, path):
+        """
+        セグメントの索引が存在するかを返す
+        """
+        return os.path.isfile(os.path.join(path, cls.SEGMENTS_NAME, cls.MANIFEST_NAME))
+
+    def load_manifest(self):
+        """
+        manifestを読み込み返す。無ければ空のmanifestを返す
+        """
+        path = os.path.join(self.path, self.MANIFEST_NAME)
+        if not os.path.isfile(path):
+            return {'next_segment': 1, 'segments': []}
+        with open(path, encoding='utf-8') as a_file:
+            return json.load(a_file)
+
+    def save_manifest(self, manifest):
+        """
+        manifestを一時ファイルに書いてから置き換える
+        """
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, self.MANIFEST_NAME)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as a_file:
+            json.dump(manifest, a_file, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def segment(self, name):
+        """
+        セグメント名からSegmentを返す。読み込んだ内容は使い回す
+        """
+        if name not in self.segment_cache:
+            self.segment_cache[name] = Segment(os.path.join(self.path, name + Segment.SUFFIX))
+        return self.segment_cache[name]
+
+    def segments(self):
+        """
+        manifestのセグメントを古い順にリストで返す
+        """
+        return [self.segment(entry['name']) for entry in self.load_manifest()['segments']]
+
+    def document_keys(self):
+        """
+        索引済みの(カテゴリー, 記事id)のセットを返す
+        """
+        keys = set()
+        for segment in self.segments():
+            keys.update(segment.load_keys())
+        return keys
+
+    def open_digests(self):
+        """
+        記事のダイジェストのデータベースを開いて返す
+        digestsは索引済みの記事、pendingは作成中のセグメントの記事のダイジェストで、
+        pendingはmanifestを保存した後でdigestsに移す
+        """
+        if self.digests is None:
+            os.makedirs(self.path, exist_ok=True)
+            # パイプラインでは作成したスレッドとは別の索引スレッドから使う(同時には使わない)
+            self.digests = sqlite3.connect(
+                os.path.join(self.path, self.DIGESTS_NAME), timeout=30, check_same_thread=False,
+            )
+            with self.digests:
+                self.digests.executescript("""
+                    CREATE TABLE IF NOT EXISTS digests (
+                        category TEXT NOT NULL,
+                        article_id TEXT NOT NULL,
+                        digest TEXT NOT NULL,
+                        PRIMARY KEY (category, article_id)
+                    );
+                    CREATE TABLE IF NOT EXISTS pending (
+                        category TEXT NOT NULL,
+                        article_id TEXT NOT NULL,
+                        digest TEXT NOT NULL,
+                        PRIMARY KEY (category, article_id)
+                    );
+                """)
+        return self.digests
+
+    def document_digests(self):
+        """
+        索引済みの記事の{(カテゴリー, 記事id): ダイジェスト}を返す
+        ダイジェストを記録する前の版で索引した記事は含まない
+        """
+        if not os.path.isfile(os.path.join(self.path, self.DIGESTS_NAME)):
+            return {}
+        rows = self.open_digests().execute('SELECT category, article_id, digest FROM digests')
+        return {(category, article_id): digest for category, article_id, digest in rows}
+
+    def stage_digests(self, rows):
+        """
+        作成中のセグメントの(カテゴリー, 記事id, ダイジェスト)をpendingに書く
+        """
+        with self.open_digests():
+            self.digests.executemany('INSERT OR REPLACE INTO pending VALUES (?, ?, ?)', rows)
+
+    def commit_digests(self, replace):
+        """
+        pendingのダイジェストを索引済みにする。replaceがTrueなら以前のダイジェストは削除する
+        manifestの保存とは別に書くため、間で終了しても次の--incrementalで記事を追加し直すだけになる
+        """
+        with self.open_digests():
+            if replace:
+                self.digests.execute('DELETE FROM digests')
+            self.digests.execute('INSERT OR REPLACE INTO digests SELECT * FROM pending')
+            self.digests.execute('DELETE FROM pending')
+
+    def reset(self):
+        """
+        全てのセグメントを削除する
+        """
+        self.wait()
+        with self.lock:
+            if self.digests is not None:
+                self.digests.close()
+                self.digests = None
+            if os.path.isdir(self.path):
+                shutil.rmtree(self.path)
+            self.segment_cache = {}
+
+    def add_documents(self, articles, word_dict, replace=False):
+        """
+        記事を新しいセグメントとして追加し、セグメント名を返す。記事が無ければNoneを返す
+        replace: Trueなら既存のセグメントを新しいセグメントで置き換える(記事が無ければ置き換えない)
+        """
+        articles = list(articles)
+        if not articles:
+            return None
+        if replace:
+            self.wait()
+        with self.lock:
+            manifest = self.load_manifest()
+            name = f'seg-{manifest["next_segment"]:06d}'
+            os.makedirs(self.path, exist_ok=True)
+            self.open_digests().execute('DELETE FROM pending')
+            self.stage_digests(
+                (article['category'], article['id'], article_digest(article)) for article in articles
+            )
+            segment = Segment.build(
+                os.path.join(self.path, name + Segment.SUFFIX), articles, word_dict, self.positions,
+            )
+            self.register(manifest, segment, replace)
+        return name
+
+    def add_stream(self, documents, memory_budget, replace=False):
+        """
+        (カテゴリー, 記事id, [word_list], ダイジェスト)を順に返すイテラブルを、
+        メモリの上限を超えないように新しいセグメントとして追加し、セグメント名を返す
+        文書が無ければNoneを返す
+        replace: Trueなら既存のセグメントを新しいセグメントで置き換える(文書が無ければ置き換えない)
+        """
+        if replace:
+            self.wait()
+        with self.lock:
+            manifest = self.load_manifest()
+            name = f'seg-{manifest["next_segment"]:06d}'
+            os.makedirs(self.path, exist_ok=True)
+            self.open_digests().execute('DELETE FROM pending')
+            segment = Segment.build_stream(
+                os.path.join(self.path, name + Segment.SUFFIX), self.iter_staged(documents), memory_budget,
+                self.positions,
+            )
+            if segment is None:
+                return None
+            self.register(manifest, segment, replace)
+        return name
+
+    def iter_staged(self, documents):
+        """
+        (カテゴリー, 記事id, [word_list], ダイジェスト)のダイジェストをDIGEST_BATCH件ずつpendingに書き、
+        (カテゴリー, 記事id, [word_list])を順に返すジェネレータ
+        """
+        rows = []
+        for category, article_id, word_list, digest in documents:
+            rows.append((category, article_id, digest))
+            if len(rows) >= self.DIGEST_BATCH:
+                self.stage_digests(rows)
+                rows = []
+            yield category, article_id, word_list
+        self.stage_digests(rows)
+
+    def register(self, manifest, segment, replace=False):
+        """
+        作成したセグメントをmanifestに加えて保存する
+        古いセグメントにある同じ記事は、manifestのdeletedに記録する
+        replaceがTrueなら、manifestを新しいセグメントだけにしてから古いセグメントを削除する。
+        manifestの置き換えまでは古い索引がそのまま検索できる
+        保存した後で、作成中のセグメントのダイジェストを索引済みにする
+        """
+        if replace:
+            old_names = [entry['name'] for entry in manifest['segments']]
+            manifest['segments'] = []
+        keys = segment.load_keys()
+        for entry in manifest['segments']:
+            segment_keys = self.segment(entry['name']).load_keys()
+            deleted = {segment_keys[key] for key in keys if key in segment_keys}
+            if deleted:
+                entry['deleted'] = sorted(deleted.union(entry.get('deleted', [])))
+        documents = segment.open().doc_count
+        manifest['next_segment'] += 1
+        manifest['segments'].append(
+            {'name': segment.name, 'level': self.level(documents), 'documents': documents},
+        )
+        self.save_manifest(manifest)
+        self.commit_digests(replace)
+        if replace:
+            for name in old_names:
+                self.segment_cache.pop(name, None)
+                path = os.path.join(self.path, name + Segment.SUFFIX)
+                if os.path.isfile(path):
+                    os.remove(path)
+
+    def level(self, documents):
+        """
+        文書数からセグメントのlevelを返す
+        """
+        level = 0
+        documents //= self.merge_factor    # math.logは1000を10の2.9999...乗と計算するため整数で割る
+        while documents > 0:
+            documents //= self.merge_factor
+            level += 1
+        return level
+
+    def plan_merge(self):
+        """
+        併合するセグメント名のリストを返す。併合の必要が無ければNoneを返す
+        """
+        entries = self.load_manifest()['segments']
+        for start in range(len(entries) - self.merge_factor + 1):
+            run = entries[start:start + self.merge_factor]
+            if len({entry['level'] for entry in run}) == 1:
+                return [entry['name'] for entry in run]
+        return None
+
+    def merge(self, names):
+        """
+        連続するセグメントを1つに併合する
+        新しいセグメントに置き換えられた(deletedに記録された)文書は併合後のセグメントに含めない
+        """
+        with self.lock:
+            manifest = self.load_manifest()
+            name = f'seg-{manifest["next_segment"]:06d}'
+            manifest['next_segment'] += 1
+            self.save_manifest(manifest)
+            deleted = {
+                entry['name']: set(entry.get('deleted', []))
+                for entry in manifest['segments'] if entry['name'] in names
+            }
+        sources = [self.segment(source) for source in names]
+        docs = []
+        remap = [{} for _ in sources]   # 併合前の文書番号 -> 併合後の文書番号
+        for position, segment in enumerate(sources):
+            for doc_number, doc in enumerate(segment.load_docs()):
+                if doc_number not in deleted[segment.name]:
+                    remap[position][doc_number] = len(docs)
+                    docs.append(doc)
+        postings = {}
+        positions = {} if all(segment.has_positions for segment in sources) else None
+        for position, segment in enumerate(sources):
+            mapping = remap[position]
+            for word, entries, position_lists in segment.iter_terms():
+                merged = postings.setdefault(word, [])
+                merged.extend(
+                    (mapping[doc_number], count) for doc_number, count in entries
+                    if doc_number in mapping
+                )
+                if positions is not None:
+                    positions.setdefault(word, []).extend(
+                        word_positions
+                        for (doc_number, _), word_positions in zip(entries, position_lists)
+                        if doc_number in mapping
+                    )
+        postings = {word: entries for word, entries in postings.items() if entries}
+        Segment.write(os.path.join(self.path, name + Segment.SUFFIX), docs, postings, positions)
+        with self.lock:
+            manifest = self.load_manifest()
+            entries = manifest['segments']
+            start = [entry['name'] for entry in entries].index(names[0])
+            merged = {'name': name, 'level': self.level(len(docs)), 'documents': len(docs)}
+            # 併合中に追加されたセグメントで置き換えられた文書を、併合後の文書番号で記録し直す
+            deleted_since = sorted(
+                remap[position][doc_number]
+                for position, entry in enumerate(entries[start:start + len(names)])
+                for doc_number in set(entry.get('deleted', [])) - deleted[entry['name']]
+            )
+            if deleted_since:
+                merged['deleted'] = deleted_since
+            entries[start:start + len(names)] = [merged]
+            self.save_manifest(manifest)
+            for source in names:
+                self.segment_cache.pop(source, None)
+                os.remove(os.path.join(self.path, source + Segment.SUFFIX))
+        return name
+
+    def maybe_merge(self):
+        """
+        併合が必要な間、セグメントを併合する
+        """
+        while True:
+            with self.lock:
+                names = self.plan_merge()
+            if names is None:
+                return
+            self.merge(names)
+
+    def merge_in_background(self):
+        """
+        別スレッドで併合を開始する。併合中であれば何もしない
+        """
+        if self.merge_thread is not None and self.merge_thread.is_alive():
+            return
+        self.merge_thread = threading.Thread(target=self.maybe_merge, daemon=True)
+        self.merge_thread.start()
+
+    def wait(self):
+        """
+        裏で実行中の併合の終了を待つ
+        """
+        if self.merge_thread is not None:
+            self.merge_thread.join()
+            self.merge_thread = None
+
+
+class SegmentReader:
+    """
+    セグメントの索引から検索するクラス
+    tf, tf-idfは保存した回数と、全セグメントの文書頻度を合算したidfから計算する
+    同じ記事が複数のセグメントにあれば、併合と同じく新しいセグメントの方だけを使う
+    開く時に読むのはmanifestと各セグメントのヘッダーだけなので、起動時間は索引の大きさによらない
+    """
+
+    def __init__(self, path, categories):
+        """
+        初期化します
+        path: 索引のディレクトリ
+        categories: 検索対象のカテゴリー
+        """
+        self.index = SegmentIndex(path)
+        entries = self.index.load_manifest()['segments']
+        self.segments = [self.index.segment(entry['name']) for entry in entries]
+        self.categories = set(categories)
+        # セグメントごとに、新しいセグメントに置き換えられた文書番号のセット
+        self.deleted = [set(entry.get('deleted', [])) for entry in entries]
+        self.document_count = sum(
+            entry['documents'] - len(deleted) for entry, deleted in zip(entries, self.deleted)
+        )
+        self.decoded = None     # 直前に復元した(単語, 転置リスト, 文書頻度)
+
+    def with_categories(self, categories):
+        """
+        開いたセグメントを共有し、検索対象のカテゴリーだけを変えたSegmentReaderを返す
+        """
+        reader = copy.copy(self)
+        reader.categories = set(categories)
+        reader.decoded = None
+        return reader
+
+    def open(self):
+        """
+        全てのセグメントの索引ファイルを開き、自身を返す
+        """
+        for segment in self.segments:
+            segment.open()
+        return self
+
+    def document_frequency(self, word):
+        """
+        全セグメントの文書頻度の合計を返す。用語辞書だけを読み、転置リストは復元しない
+        置き換えられた文書も数えるため、0でなければ単語を含む文書があるとは限らない
+        """
+        return sum(segment.document_frequency(word) for segment in self.segments)
+
+    def decode(self, word):
+        """
+        全セグメントの転置リストを1回だけ復元し、
+        (検索対象のカテゴリーの(記事id, 回数, 単語数)のリスト, 置き換えを除いた文書頻度)を返す
+        同じ単語が続けて引かれても(in, [], tf, tf-idf)、直前の結果を使い復元し直さない
+        """
+        decoded = self.decoded
+        if decoded is not None and decoded[0] == word:
+            return decoded[1], decoded[2]
+        postings = []
+        frequency = 0
+        for segment, deleted in zip(self.segments, self.deleted):
+            for doc_number, count in segment.iter_postings(word):
+                if doc_number in deleted:
+                    continue
+                frequency += 1
+                category, article_id, length = segment.doc(doc_number)
+                if category in self.categories:
+                    postings.append((article_id, count, length))
+        self.decoded = (word, postings, frequency)
+        return postings, frequency
+
+    def idf(self, word):
+        """
+        全セグメントの文書頻度を合算してidfを返す。単語が無ければNoneを返す
+        置き換えられた文書が無ければ用語辞書の文書頻度だけで計算する
+        """
+        if any(self.deleted):
+            frequency = self.decode(word)[1]
+        else:
+            frequency = self.document_frequency(word)
+        if frequency == 0:
+            return None
+        return math.log(self.document_count / frequency)
+
+    def iter_postings(self, word):
+        """
+        検索対象のカテゴリーで単語を含む(記事id, 回数, 単語数)を返すイテレータ
+        """
+        return iter(self.decode(word)[0])
+
+    def postings(self, word):
+        """
+        単語を含む記事idを昇順のリストで返す
+        """
+        return sorted({article_id for article_id, _, _ in self.decode(word)[0]})
+
+    def intersect(self, words):
+        """
+        全ての単語を含む記事idを昇順のリストで返す
+        セグメントごとにスキップポインタで転置リストを進め、必要なブロックだけを復元する
+        """
+        result = set()
+        for segment, deleted in zip(self.segments, self.deleted):
+            cursors = [segment.cursor(word) for word in words]
+            if any(cursor is None for cursor in cursors):
+                continue
+            for doc_number in intersect(cursors):
+                if doc_number in deleted:
+                    continue
+                category, article_id, _ = segment.doc(doc_number)
+                if category in self.categories:
+                    result.add(article_id)
+        return sorted(result)
+
+    @property
+    def has_positions(self):
+        """
+        全てのセグメントが出現位置を持つかを返す
+        """
+        return all(segment.has_positions for segment in self.segments)
+
+    def match_positions(self, words, match):
+        """
+        全ての単語を含み、単語ごとの出現位置のリストがmatchを満たす記事idを昇順のリストで返す
+        文書の候補はスキップポインタで絞り込み、出現位置は候補の単語の分だけ読むため、
+        検索時間は転置リストの大きさに比例し、文書の長さによらない
+        """
+        unique_words = list(dict.fromkeys(words))
+        result = set()
+        for segment, deleted in zip(self.segments, self.deleted):
+            cursors = [segment.cursor(word) for word in unique_words]
+            if any(cursor is None for cursor in cursors):
+                continue
+            candidates = set(intersect(cursors)) - deleted
+            if not candidates:
+                continue
+            positions = {
+                word: {
+                    doc_number: word_positions
+                    for doc_number, word_positions in segment.iter_positions(word)
+                    if doc_number in candidates
+                }
+                for word in unique_words
+            }
+            for doc_number in candidates:
+                if match([positions[word][doc_number] for word in words]):
+                    category, article_id, _ = segment.doc(doc_number)
+                    if category in self.categories:
+                        result.add(article_id)
+        return sorted(result)
+
+    def phrase(self, words):
+        """
+        単語がこの順に連続して出現する記事idを昇順のリストで返す
+        """
+        return self.match_positions(words, is_phrase)
+
+    def near(self, words, distance):
+        """
+        全ての単語がdistance語の範囲に出現する記事idを昇順のリストで返す(順序は問わない)
+        """
+        unique_words = list(dict.fromkeys(words))
+        return self.match_positions(
+            unique_words, lambda position_lists: is_near(position_lists, distance),
+        )
+
+    def __contains__(self, word):
+        if self.document_frequency(word) == 0:
+            return False
+        return bool(self.decode(word)[0])
+
+    def __getitem__(self, word):
+        """
+        転置インデックスの辞書と同じように、単語を含む記事idのリストを返す
+        """
+        postings = self.postings(word)
+        if not postings:
+            raise KeyError(word)
+        return postings
+
+    def scores(self, word, kind):
+        """
+        単語を含む記事の{記事id: 値}を返す。kindは'tf'か'tf-idf'
+        """
+        idf = self.idf(word) if kind == 'tf-idf' else 1.0
+        if idf is None:
+            return {}
+        return {
+            article_id: count / length * idf
+            for article_id, count, length in self.decode(word)[0]
+        }
+
+
+def is_phrase(position_lists):
+    """
+    単語ごとの出現位置のリストから、単語がこの順に連続する位置があるかを返す
+    """
+    following = [set(positions) for positions in position_lists[1:]]
+    return any(
+        all(start + offset in positions for offset, positions in enumerate(following, 1))
+        for start in position_lists[0]
+    )
+
+
+def is_near(position_lists, distance):
+    """
+    単語ごとの出現位置のリストから、全ての単語を含む幅distance以下の範囲があるかを返す
+    出現位置を位置の順に並べ、全ての単語を含む最小の範囲を尺取り法で求める
+    """
+    events = sorted(
+        (position, number) for number, positions in enumerate(position_lists) for position in positions
+    )
+    counts = Counter()
+    start = 0
+    for position, number in events:
+        counts[number] += 1
+        while len(counts) == len(position_lists):
+            first, first_number = events[start]
+            if position - first <= distance:
+                return True
+            counts[first_number] -= 1
+            if counts[first_number] == 0:
+                del counts[first_number]
+            start += 1
+    return False
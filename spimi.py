@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+メモリの上限を決めて索引ファイルを作成するプログラム(SPIMI)
+文書を読みながら転置リストをメモリに溜め、上限に達したら単語順に並べた中間ファイル(run)に書き出す。
+最後に全てのrunを単語順にk-wayマージして1つの索引ファイルにする
+"""
+
+import heapq
+import itertools
+import os
+import shutil
+import struct
+from collections import Counter
+from indexfile import IndexFileWriter
+from postings import concat_postings
+from postings import encode_positions
+from postings import encode_postings
+
+# メモリ使用量の見積もり(バイト)。CPythonのオブジェクトの大きさに、dictやlistの余裕を加えた値
+TERM_OVERHEAD = 200     # 単語の文字列, 辞書の要素, 空のリスト
+POSTING_OVERHEAD = 90   # (文書番号, 回数)のタプル, 整数, リストの要素
+POSITION_OVERHEAD = 40  # 出現位置の整数, リストの要素
+# runの1単語の, 単語のバイト数と転置リストのバイト数と出現位置のバイト数
+RUN_RECORD = struct.Struct('<III')
+
+
+class SpimiBuilder:
+    """
+    文書を1件ずつ追加し、メモリの上限を超えないように索引ファイルを作成するクラス
+    文書番号は追加した順の連番なので、各runの文書番号は前のrunより大きく、
+    同じ単語の転置リスト(と出現位置)はrunの順につなげるだけで併合できる
+    """
+
+    def __init__(self, path, memory_budget, positions=False):
+        """
+        初期化します
+        path: 作成する索引ファイル
+        memory_budget: 転置リストに使うメモリの上限(バイト)
+        positions: 出現位置も保存する場合はTrue
+        """
+        self.path = path
+        self.memory_budget = memory_budget
+        self.run_path = f'{path}.{os.getpid()}.runs'
+        os.makedirs(self.run_path, exist_ok=True)
+        self.writer = IndexFileWriter(path, positions=positions)
+        self.postings = {}  # {word: [(文書番号, 回数)]}
+        self.positions = {} if positions else None  # {word: [[出現位置]]}
+        self.memory = 0     # 見積もったメモリ使用量
+        self.runs = []
+
+    def add(self, category, article_id, word_list):
+        """
+        文書を追加し、文書番号を返す
+        """
+        doc_number = self.writer.add_doc(category, article_id, len(word_list))
+        for word, count in Counter(word_list).items():
+            entries = self.postings.get(word)
+            if entries is None:
+                entries = self.postings[word] = []
+                self.memory += TERM_OVERHEAD + len(word) * 4
+            entries.append((doc_number, count))
+            self.memory += POSTING_OVERHEAD
+        if self.positions is not None:
+            for word, positions in group_positions(word_list).items():
+                self.positions.setdefault(word, []).append(positions)
+            self.memory += POSITION_OVERHEAD * len(word_list)
+        if self.memory >= self.memory_budget:
+            self.spill()
+        return doc_number
+
+    def spill(self):
+        """
+        溜めた転置リストを単語順に並べてrunとして書き出す
+        run: [単語のバイト数, 転置リストのバイト数, 出現位置のバイト数, 単語, 圧縮した転置リスト, 圧縮した出現位置]*
+        """
+        if not self.postings:
+            return
+        path = os.path.join(self.run_path, f'run-{len(self.runs):06d}.bin')
+        with open(path, 'wb') as a_file:
+            for encoded, word in sorted((word.encode('utf-8'), word) for word in self.postings):
+                data = encode_postings(self.postings[word])
+                positions = b'' if self.positions is None else encode_positions(self.positions[word])
+                a_file.write(RUN_RECORD.pack(len(encoded), len(data), len(positions)))
+                a_file.write(encoded)
+                a_file.write(data)
+                a_file.write(positions)
+        self.runs.append(path)
+        self.postings = {}
+        if self.positions is not None:
+            self.positions = {}
+        self.memory = 0
+
+    @staticmethod
+    def iter_run(path, run_number):
+        """
+        runの(単語のバイト列, runの番号, 圧縮した転置リスト, 圧縮した出現位置)を順に返すジェネレータ
+        """
+        with open(path, 'rb') as a_file:
+            while True:
+                header = a_file.read(RUN_RECORD.size)
+                if not header:
+                    return
+                term_size, data_size, positions_size = RUN_RECORD.unpack(header)
+                yield (
+                    a_file.read(term_size), run_number, a_file.read(data_size),
+                    a_file.read(positions_size),
+                )
+
+    def finish(self):
+        """
+        残りの転置リストを書き出し、全てのrunをマージして索引ファイルを作成する
+        作成した文書数を返す
+        """
+        try:
+            self.spill()
+            runs = [self.iter_run(path, number) for number, path in enumerate(self.runs)]
+            merged = heapq.merge(*runs)     # 単語順, 同じ単語はrunの順
+            for encoded, records in itertools.groupby(merged, key=lambda record: record[0]):
+                # 転置リストは復元せず、圧縮したブロックのままrunの順につなげる
+                postings = []
+                positions = []
+                for _, _, data, position_data in records:
+                    postings.append(data)
+                    positions.append(position_data)
+                self.writer.add_encoded_term(
+                    str(encoded, 'utf-8'), concat_postings(postings),
+                    b''.join(positions) if self.positions is not None else None,
+                )
+        except BaseException:
+            self.abort()
+            raise
+        shutil.rmtree(self.run_path, ignore_errors=True)
+        self.writer.close()
+        return self.writer.doc_count
+
+    def abort(self):
+        """
+        作成を中止し、一時ファイルとrunを削除する
+        """
+        self.writer.abort()
+        shutil.rmtree(self.run_path, ignore_errors=True)
+
+
+def group_positions(word_list):
+    """
+    単語のリストから{word: [出現位置]}を返す
+    """
+    positions = {}
+    for position, word in enumerate(word_list):
+        positions.setdefault(word, []).append(position)
+    return positions
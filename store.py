@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+追記専用のセグメントファイルにレコードを保存するプログラム
+レコードごとにgzipメンバーとして圧縮するため、オフセットから1件ずつ読み出せる
+コマンドとして実行すると、記事ごとのjsonファイルを記事ストア(JSONL)に移行する
+"""
+
+import glob
+import gzip
+import json
+import os
+import sys
+import threading
+from argparse import ArgumentParser
+from argparse import ArgumentDefaultsHelpFormatter
+
+
+class RecordStore:
+    """
+    セグメントファイルにレコードを追記し、オフセットの索引を保存するクラス
+    <path>/segment-00000<suffix> : レコード本体
+    <path>/index.tsv             : key, セグメント名, オフセット, 長さ
+    """
+    INDEX_NAME = 'index.tsv'
+
+    def __init__(self, path, suffix='.gz', compress=True, segment_size=64 * 1024 * 1024):
+        """
+        初期化します
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.suffix = suffix
+        self.compress = compress
+        self.segment_size = segment_size
+        self.segment_number = self.find_last_segment()
+        self.segment_file = None
+        self.index_file = None
+        self.index = None   # {key: (セグメント名, オフセット, 長さ)} 必要になるまで読み込まない
+        self.lock = threading.Lock()
+
+    def segment_name(self, number):
+        """
+        番号からセグメントのファイル名を返す
+        """
+        return f'segment-{number:05d}{self.suffix}'
+
+    def find_last_segment(self):
+        """
+        既存のセグメントのうち最後の番号を返す。無ければ0を返す
+        """
+        numbers = [
+            int(name[len('segment-'):-len(self.suffix)])
+            for name in os.listdir(self.path)
+            if name.startswith('segment-') and name.endswith(self.suffix)
+        ]
+        return max(numbers, default=0)
+
+    def open_segment(self):
+        """
+        書き込み先のセグメントを開く。上限サイズを超えていれば次のセグメントに切り替える
+        """
+        path = os.path.join(self.path, self.segment_name(self.segment_number))
+        if os.path.isfile(path) and os.path.getsize(path) >= self.segment_size:
+            self.segment_number += 1
+            path = os.path.join(self.path, self.segment_name(self.segment_number))
+        self.segment_file = open(path, 'ab')
+
+    def append(self, key, data):
+        """
+        レコード(bytes)を追記し、索引に登録する
+        """
+        payload = gzip.compress(data) if self.compress else data
+        with self.lock:
+            if self.segment_file is None or self.segment_file.tell() >= self.segment_size:
+                if self.segment_file is not None:
+                    self.segment_file.close()
+                self.open_segment()
+            if self.index_file is None:
+                self.index_file = open(
+                    os.path.join(self.path, self.INDEX_NAME), 'a', encoding='utf-8',
+                )
+            name = self.segment_name(self.segment_number)
+            offset = self.segment_file.tell()
+            self.segment_file.write(payload)
+            self.segment_file.flush()   # 索引より先に本体を書き出す
+            self.index_file.write(f'{key}\t{name}\t{offset}\t{len(payload)}\n')
+            self.index_file.flush()
+            if self.index is not None:
+                self.index[key] = (name, offset, len(payload))
+
+    def load_index(self):
+        """
+        索引を読み込み、keyごとに最新の位置を持つ辞書を返す
+        """
+        if self.index is not None:
+            return self.index
+        index = {}
+        path = os.path.join(self.path, self.INDEX_NAME)
+        if os.path.isfile(path):
+            with open(path, encoding='utf-8') as a_file:
+                for line in a_file:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) != 4:    # 書き込み途中で終了した行は無視する
+                        continue
+                    key, name, offset, length = fields
+                    index[key] = (name, int(offset), int(length))
+        self.index = index
+        return index
+
+    def __contains__(self, key):
+        return key in self.load_index()
+
+    def __len__(self):
+        return len(self.load_index())
+
+    def decode(self, payload):
+        """
+        保存された形式からレコードを復元して返す
+        """
+        return gzip.decompress(payload) if self.compress else payload
+
+    def read(self, key):
+        """
+        keyのレコードを返す。無ければNoneを返す
+        """
+        entry = self.load_index().get(key)
+        if entry is None:
+            return None
+        name, offset, length = entry
+        with open(os.path.join(self.path, name), 'rb') as a_file:
+            a_file.seek(offset)
+            return self.decode(a_file.read(length))
+
+    def records(self):
+        """
+        keyごとに最新のレコードを(key, data)としてファイル順に返すジェネレータ
+        セグメントを先頭から順に読むため、ディスクの速度で走査できる
+        """
+        entries = sorted(
+            (name, offset, length, key)
+            for key, (name, offset, length) in self.load_index().items()
+        )
+        a_file = None
+        current = None
+        try:
+            for name, offset, length, key in entries:
+                if name != current:
+                    if a_file is not None:
+                        a_file.close()
+                    a_file = open(os.path.join(self.path, name), 'rb')
+                    current = name
+                if a_file.tell() != offset:
+                    a_file.seek(offset)
+                yield key, self.decode(a_file.read(length))
+        finally:
+            if a_file is not None:
+                a_file.close()
+
+    def close(self):
+        """
+        開いているファイルを閉じる
+        """
+        with self.lock:
+            for a_file in (self.segment_file, self.index_file):
+                if a_file is not None:
+                    a_file.close()
+            self.segment_file = None
+            self.index_file = None
+
+
+class ArticleStore(RecordStore):
+    """
+    記事の辞書を1行のjson(JSONL)としてセグメントに追記するクラス
+    既にセグメントがあれば、その圧縮形式に合わせる
+    """
+    STORE_NAME = 'store'
+
+    def __init__(self, path, compress=False):
+        """
+        初期化します
+        """
+        os.makedirs(path, exist_ok=True)
+        names = os.listdir(path)
+        if any(name.endswith('.jsonl.gz') for name in names):
+            compress = True
+        elif any(name.endswith('.jsonl') for name in names):
+            compress = False
+        suffix = '.jsonl.gz' if compress else '.jsonl'
+        super().__init__(path, suffix=suffix, compress=compress)
+
+    @classmethod
+    def category_path(cls, output_path, category):
+        """
+        カテゴリーの記事ストアのディレクトリを返す
+        """
+        return os.path.join(output_path, category, cls.STORE_NAME)
+
+    @classmethod
+    def exists(cls, output_path, category):
+        """
+        カテゴリーの記事ストアが存在するかを返す
+        """
+        path = cls.category_path(output_path, category)
+        return os.path.isfile(os.path.join(path, cls.INDEX_NAME))
+
+    def append_article(self, article):
+        """
+        記事の辞書を1行のjsonとして追記する
+        """
+        line = json.dumps(article, ensure_ascii=False) + '\n'
+        self.append(article['id'], line.encode('utf-8'))
+
+    def read_article(self, article_id):
+        """
+        記事idの辞書を返す。無ければNoneを返す
+        """
+        record = self.read(article_id)
+        return None if record is None else json.loads(record)
+
+    def articles(self):
+        """
+        記事の辞書をファイル順に返すジェネレータ
+        """
+        for _, record in self.records():
+            yield json.loads(record)
+
+    def migrate(self, category_path, remove=False):
+        """
+        category_path内の記事ごとのjsonファイルをストアに追記し、追記した件数を返す
+        既にストアにある記事は追記しない。removeがTrueなら移行したファイルを削除する
+        """
+        count = 0
+        for path in sorted(glob.glob(os.path.join(category_path, '*.json'))):
+            with open(path, encoding='utf-8') as a_file:
+                article = json.load(a_file)
+            if article['id'] not in self:
+                self.append_article(article)
+                count += 1
+            if remove:
+                os.remove(path)
+        return count
+
+
+def get_args():
+    """
+    コマンドライン引数を応答します
+    """
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "--category", nargs='*', required=True,
+        help="記事ストアに移行するカテゴリーを指定します",
+    )
+    parser.add_argument(
+        "-i", "--input_path", type=str, required=False, default='output',
+        help="クローラの出力ディレクトリ名を指定します",
+    )
+    parser.add_argument(
+        "--compress", action='store_true',
+        help="このオプションを付けるとセグメントをgzipで圧縮します(新規作成時のみ)",
+    )
+    parser.add_argument(
+        "--remove", action='store_true',
+        help="このオプションを付けると移行したjsonファイルを削除します",
+    )
+    return parser.parse_args()
+
+
+def main():
+    """
+    メイン（main）プログラムです
+    output/<category>/*.jsonを記事ストアに移行します
+    常に0を応答します
+    """
+    args = get_args()
+    for category in args.category:
+        category_path = os.path.join(args.input_path, category)
+        store = ArticleStore(
+            ArticleStore.category_path(args.input_path, category), compress=args.compress,
+        )
+        count = store.migrate(category_path, remove=args.remove)
+        store.close()
+        print(f'{category}: {count} articles migrated ({len(store)} in store)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
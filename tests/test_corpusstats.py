@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+コーパスの統計(corpusstats.py)のテスト
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from corpusstats import CorpusStatistics
+
+
+class CorpusStatisticsTest(unittest.TestCase):
+    """
+    Zipfの法則, Heapsの法則の当てはめと、間引いた曲線のテスト
+    """
+
+    def test_fit_power_law(self):
+        x = np.array([1.0, 2.0, 4.0, 9.0, 100.0])
+        c, a = CorpusStatistics.fit_power_law(x, 3 * x ** 0.5)
+        self.assertAlmostEqual(c, 3)
+        self.assertAlmostEqual(a, 0.5)
+        self.assertIsNone(CorpusStatistics.fit_power_law(x[:1], x[:1]))
+
+    def test_zipf_exponent(self):
+        statistics = CorpusStatistics()
+        # 順位rの単語が12000 / r回出現する(頻度 ∝ 順位^-1)
+        statistics.add([
+            f'単語{rank}' for rank in range(1, 1001) for _ in range(12000 // rank)
+        ])
+        ranks, frequencies = statistics.zipf(bins=20)
+        self.assertLessEqual(len(ranks), 20)
+        self.assertTrue(np.all(np.diff(ranks) > 0))
+        self.assertTrue(np.all(np.diff(frequencies) < 0))
+        self.assertAlmostEqual(statistics.summary(bins=20)['zipf']['exponent'], 1, delta=0.05)
+
+    def test_heaps_includes_last_document(self):
+        statistics = CorpusStatistics(growth=2)
+        for number in range(10):
+            statistics.add([f'単語{number}', '共通', '共通'])
+        documents, tokens, vocabulary = statistics.heaps()
+        self.assertEqual((documents[-1], tokens[-1], vocabulary[-1]), (10, 30, 11))
+        self.assertTrue(np.all(np.diff(tokens) > 0))
+        self.assertLess(len(tokens), 10)    # 単語数が2倍になるごとにだけ標本を取る
+
+    def test_empty(self):
+        summary = CorpusStatistics().summary()
+        self.assertEqual(summary['vocabulary'], 0)
+        self.assertIsNone(summary['zipf']['exponent'])
+        self.assertIsNone(summary['heaps']['beta'])
+
+    def test_write(self):
+        statistics = CorpusStatistics()
+        statistics.add(['政府', '増税', '政府'])
+        statistics.add(['増税', '国会'])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'stats.json')
+            with mock.patch('builtins.print'):
+                statistics.write(path)
+            with open(path, encoding='utf-8') as a_file:
+                summary = json.load(a_file)
+        self.assertEqual((summary['documents'], summary['tokens'], summary['vocabulary']), (2, 5, 3))
+        self.assertEqual(summary['heaps']['samples'][-1], [2, 5, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
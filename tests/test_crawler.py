@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+クローラ(crawler.py)のテスト
+"""
+
+import os
+import re
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+import requests
+from crawler import EXTRACTORS
+from crawler import Frontier
+from crawler import HttpCache
+
+
+class ArticleHandler(BaseHTTPRequestHandler):
+    """
+    ETagとLast-Modifiedを付けて応答し、If-None-Matchが一致すれば304を返すハンドラー
+    """
+    etag = '"v1"'
+    body = '<html><body>記事</body></html>'
+
+    def do_GET(self):   # pylint: disable=invalid-name
+        """
+        GETリクエストに応答する
+        """
+        self.server.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.send_header('ETag', self.etag)
+            self.end_headers()
+            return
+        body = self.body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.etag)
+        self.send_header('Last-Modified', 'Tue, 17 Oct 2023 00:00:00 GMT')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """
+        アクセスログは表示しない
+        """
+
+
+class HttpCacheTest(unittest.TestCase):
+    """
+    HttpCacheに保存した検証用のヘッダーで条件付きGETを行い、304なら保存した本文を使えることを確認する
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = HttpCache(self.directory.name)
+        self.server = HTTPServer(('127.0.0.1', 0), ArticleHandler)
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/article/1'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def test_revalidation(self):
+        self.assertIsNone(self.cache.load(self.url))
+        self.assertEqual(HttpCache.conditional_headers(None), {})
+        response = requests.get(self.url, timeout=5)
+        self.assertEqual(response.status_code, 200)
+        self.cache.store(self.url, response)
+
+        entry = self.cache.load(self.url)
+        self.assertEqual(entry['etag'], '"v1"')
+        self.assertEqual(entry['text'], ArticleHandler.body)
+        headers = HttpCache.conditional_headers(entry)
+        self.assertEqual(headers, {
+            'If-None-Match': '"v1"', 'If-Modified-Since': 'Tue, 17 Oct 2023 00:00:00 GMT',
+        })
+        response = requests.get(self.url, headers=headers, timeout=5)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.server.requests[-1]['If-None-Match'], '"v1"')
+
+    def test_response_without_validators_is_not_stored(self):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'body'     # pylint: disable=protected-access
+        self.cache.store(self.url, response)
+        self.assertIsNone(self.cache.load(self.url))
+
+    def test_entry_of_another_url_is_ignored(self):
+        response = requests.get(self.url, timeout=5)
+        self.cache.store(self.url, response)
+        other = self.url.replace('/1', '/2')
+        with open(self.cache.entry_path(self.url), 'rb') as source:
+            with open(self.cache.entry_path(other), 'wb') as target:
+                target.write(source.read())
+        self.assertIsNone(self.cache.load(other))
+
+
+class FrontierTest(unittest.TestCase):
+    """
+    フロンティアを開き直しても未取得の記事から再開できることを確認する
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'frontier.sqlite3')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_resume(self):
+        frontier = Frontier(self.path, max_retries=2)
+        self.assertFalse(frontier.has_category('society'))
+        frontier.add_listing('society', 'https://example.com/list', [
+            ('a1', 'https://example.com/a1'),
+            ('a2', 'https://example.com/a2'),
+            ('a3', 'https://example.com/a3'),
+        ])
+        frontier.mark_fetched('society', 'a1')
+        frontier.mark_failed('society', 'a2')
+        frontier.close()
+
+        frontier = Frontier(self.path, max_retries=2)
+        self.assertTrue(frontier.has_category('society'))
+        self.assertTrue(frontier.has_listing('society', 'https://example.com/list'))
+        self.assertFalse(frontier.has_listing('sports', 'https://example.com/list'))
+        self.assertEqual(
+            frontier.pending_urls('society'), ['https://example.com/a2', 'https://example.com/a3'],
+        )
+        self.assertEqual(
+            frontier.count_states('society'), {'fetched': 1, 'failed': 1, 'discovered': 1},
+        )
+        frontier.mark_failed('society', 'a2')   # 再試行の上限に達したら候補から外す
+        self.assertEqual(frontier.pending_urls('society'), ['https://example.com/a3'])
+        frontier.close()
+
+    def test_seeded_articles_are_not_fetched_again(self):
+        frontier = Frontier(self.path)
+        frontier.seed_fetched('society', ['a1'])
+        frontier.add_listing('society', 'https://example.com/list', [
+            ('a1', 'https://example.com/a1'), ('a2', 'https://example.com/a2'),
+        ])
+        self.assertEqual(frontier.pending_urls('society'), ['https://example.com/a2'])
+        self.assertEqual(frontier.count_states('society'), {'fetched': 1, 'discovered': 1})
+        frontier.close()
+
+
+LISTING = """<html><head><title>一覧</title></head><body>
+<ul class="widget_boxlist_set"><li><a href="https://example.com/article/1">1</a></li>
+<li><a href="https://example.com/article/2">2</a></li><li><a href="/other">other</a></li></ul>
+<ul class="menu"><li><a href="https://example.com/article/3">3</a></li></ul>
+</body></html>"""
+
+ARTICLE = """<html><head><meta charset="utf-8"><title>記事の題名</title></head><body>
+<div class="header">見出し</div>
+<div class="article_body"><p>本文の<b>1段落目</b>です。</p>
+<script>var x = 1;</script><p>2段落目<ruby>漢字<rp>(</rp><rt>かんじ</rt><rp>)</rp></ruby></p></div>
+</body></html>"""
+
+
+class ExtractorTest(unittest.TestCase):
+    """
+    全ての抽出器がBeautifulSoup(html.parser)と同じurlリスト・タイトル・本文を返すことを確認する
+    """
+
+    def test_extractors_agree(self):
+        url_pattern = re.compile(r'https://example\.com/article/\d+')
+        expected_urls = {'https://example.com/article/1', 'https://example.com/article/2'}
+        expected = EXTRACTORS['html.parser']().extract_title_and_body(ARTICLE)
+        self.assertEqual(expected[0], '記事の題名')
+        for name, extractor_class in EXTRACTORS.items():
+            with self.subTest(extractor=name):
+                extractor = extractor_class()
+                self.assertEqual(extractor.extract_urls(url_pattern, LISTING), expected_urls)
+                self.assertEqual(extractor.extract_title_and_body(ARTICLE), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+重複に近い記事の検出(dedup.py)のテスト
+"""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+from crawler import get_args
+from dedup import DuplicateIndex
+from dedup import load_duplicates
+from dedup import simhash
+from dedup import to_signed
+from dedup import to_unsigned
+
+TEXT = (
+    '政府は来年度の予算案について、消費税の増税分を社会保障の充実に充てる方針を示した。'
+    '財務省は歳出の見直しを進め、国債の新規発行額を前年度より抑えるとしている。'
+)
+
+
+def distance(first, second):
+    """
+    2つの指紋のハミング距離を返す
+    """
+    return bin(first ^ second).count('1')
+
+
+def flip(fingerprint, bits):
+    """
+    指紋の指定したビットを反転して返す
+    """
+    for bit in bits:
+        fingerprint ^= 1 << bit
+    return fingerprint
+
+
+class SimhashTest(unittest.TestCase):
+    """
+    SimHashの指紋のテスト
+    """
+
+    def test_near_duplicates_are_close(self):
+        fingerprint = simhash(TEXT)
+        self.assertLess(fingerprint, 1 << 64)
+        self.assertEqual(simhash(TEXT.replace('。', '。\n ')), fingerprint)    # 空白は無視する
+        self.assertLessEqual(distance(simhash(TEXT + '(共同)'), fingerprint), 3)
+        self.assertGreater(distance(simhash('プロ野球の日本シリーズは第7戦までもつれ込んだ。'), fingerprint), 3)
+
+    def test_signed_round_trip(self):
+        for value in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+            self.assertEqual(to_unsigned(to_signed(value)), value)
+            self.assertLess(to_signed(value), 1 << 63)
+
+
+class DuplicateIndexTest(unittest.TestCase):
+    """
+    帯(LSH)で候補を探し、閾値以下の距離の記事だけを重複とすることを確認する
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'frontier.sqlite3')
+        self.connection = sqlite3.connect(self.path)
+        self.index = DuplicateIndex(self.connection, threshold=3)
+        self.assertIsNone(self.index.check('society', 'a1', TEXT))
+        self.fingerprint = simhash(TEXT)
+
+    def tearDown(self):
+        self.connection.close()
+        self.directory.cleanup()
+
+    def test_threshold_distance_is_found(self):
+        # 3つの帯で1ビットずつ異なっても、残りの帯が一致するため候補になる
+        fingerprint = flip(self.fingerprint, (0, 16, 32))
+        self.assertEqual(self.index.find('society', 'a2', fingerprint), ('society', 'a1', 3))
+        # 同じ帯の中で3ビット異なる場合も候補になる
+        fingerprint = flip(self.fingerprint, (1, 2, 3))
+        self.assertEqual(self.index.find('society', 'a2', fingerprint), ('society', 'a1', 3))
+
+    def test_beyond_threshold_is_not_found(self):
+        self.assertIsNone(self.index.find('society', 'a2', flip(self.fingerprint, (1, 2, 3, 4))))
+        self.assertIsNone(self.index.find('society', 'a2', flip(self.fingerprint, (0, 16, 32, 48))))
+
+    def test_zero_threshold(self):
+        index = DuplicateIndex(self.connection, threshold=0)
+        self.assertEqual(index.find('society', 'a2', self.fingerprint), ('society', 'a1', 0))
+        self.assertIsNone(index.find('society', 'a2', flip(self.fingerprint, (5,))))
+
+    def test_threshold_must_be_below_bands(self):
+        # 帯の数以上の距離では、全ての帯が異なる指紋を見落とす
+        with self.assertRaises(ValueError):
+            DuplicateIndex(self.connection, threshold=DuplicateIndex.BANDS)
+        with mock.patch('sys.argv', ['crawler.py', '--dedup_threshold', '4']), \
+                mock.patch('sys.stderr'), self.assertRaises(SystemExit):
+            get_args()
+        with mock.patch('sys.argv', ['crawler.py', '--dedup_threshold', '2']):
+            self.assertEqual(get_args().dedup_threshold, 2)
+
+    def test_own_fingerprint_is_not_a_duplicate(self):
+        self.assertIsNone(self.index.find('society', 'a1', self.fingerprint))
+
+    def test_duplicates_are_recorded(self):
+        self.assertEqual(self.index.check('sports', 'b1', TEXT + '(共同)')[:2], ('society', 'a1'))
+        self.assertEqual(load_duplicates(self.path), {('sports', 'b1')})
+        # 重複になった記事は候補にならない
+        self.assertEqual(self.index.check('sports', 'b2', TEXT)[:2], ('society', 'a1'))
+        self.assertEqual(load_duplicates(os.path.join(self.directory.name, 'missing.sqlite3')), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
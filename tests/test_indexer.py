@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+インデクサー(indexer.py)のテスト
+"""
+
+import os
+import random
+import tempfile
+import time
+import unittest
+from unittest import mock
+import indexer
+from benchmark import LegacyAnalyzer
+from indexer import Analyzer
+from indexer import MorphologicalAnalyzer
+from indexer import TokenCache
+from segments import SegmentReader
+from store import ArticleStore
+
+
+def make_word_dict(documents, vocabulary_size, seed=0):
+    """
+    偏りのある単語で合成した{id:[[word_list],(word_set)]}を返す
+    """
+    generator = random.Random(seed)
+    vocabulary = [f'単語{number}' for number in range(vocabulary_size)]
+    weights = [1 / (rank + 1) for rank in range(vocabulary_size)]
+    word_dict = {}
+    for number in range(documents):
+        word_list = generator.choices(vocabulary, weights=weights, k=generator.randint(1, 40))
+        word_dict[f'{number:04d}'] = [word_list, set(word_list)]
+    return word_dict
+
+
+class TermStatisticsTest(unittest.TestCase):
+    """
+    1回の走査で計算した単語の統計が、以前の実装と完全に一致することを確認する
+    """
+
+    def setUp(self):
+        self.word_dict = make_word_dict(200, 300)
+
+    def test_term_statistics(self):
+        word_count_dict, tf_dict, idf_dict = Analyzer.term_statistics(self.word_dict)
+        expected_counts = LegacyAnalyzer.make_word_count(self.word_dict)
+        self.assertEqual(word_count_dict, expected_counts)
+        self.assertEqual(tf_dict, LegacyAnalyzer.count_tf(expected_counts))
+        self.assertEqual(idf_dict, LegacyAnalyzer.count_idf(expected_counts))
+
+    def test_separate_passes(self):
+        word_count_dict = Analyzer.make_word_count(self.word_dict)
+        self.assertEqual(word_count_dict, LegacyAnalyzer.make_word_count(self.word_dict))
+        self.assertEqual(Analyzer.count_tf(word_count_dict), LegacyAnalyzer.count_tf(word_count_dict))
+        json_list = [{'id': id, 'category': 'society'} for id in self.word_dict]
+        self.assertEqual(
+            Analyzer.count_idf(json_list, word_count_dict), LegacyAnalyzer.count_idf(word_count_dict),
+        )
+
+
+class MorphologicalAnalyzerTest(unittest.TestCase):
+    """
+    ワーカープロセスで解析しても、プロセス内で解析した場合と同じ結果になることを確認する
+    """
+
+    def test_workers(self):
+        json_list = [
+            {'id': f'a{number}', 'category': 'society', 'title': f'政府の発表{number}',
+             'body': '消費税の増税について首相が会見を行った。' * (number % 3 + 1)}
+            for number in range(10)
+        ]
+        expected = MorphologicalAnalyzer().morphological_analysis(json_list)
+        self.assertTrue({'政府', '増税', '会見'} <= expected['a0'][1])
+        self.assertEqual(MorphologicalAnalyzer(workers=2, batch_size=3).morphological_analysis(json_list), expected)
+
+
+class TokenCacheTest(unittest.TestCase):
+    """
+    解析済みの記事はMeCabを使わずにキャッシュから返し、上限を超えたら古いものから削除することを確認する
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'token_cache.sqlite3')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def analyze(self, cache, json_list):
+        """
+        キャッシュを使って形態素解析し、(結果, MeCabで解析した記事数)を返す
+        """
+        analyzer = MorphologicalAnalyzer(cache=cache)
+        tokenized = []
+        tokenize_texts = analyzer.tokenize_texts
+
+        def record(texts, executor=None):
+            tokenized.extend(texts)
+            return tokenize_texts(texts, executor)
+        with mock.patch.object(analyzer, 'tokenize_texts', record):
+            return analyzer.morphological_analysis(json_list), len(tokenized)
+
+    def test_hits_and_invalidation(self):
+        json_list = [
+            {'id': 'a1', 'category': 'society', 'title': '政府の発表', 'body': '消費税の増税'},
+            {'id': 'a2', 'category': 'society', 'title': '国会', 'body': '予算案の審議'},
+        ]
+        cache = TokenCache(self.path)
+        expected, count = self.analyze(cache, json_list)
+        self.assertEqual(count, 2)
+        self.assertEqual(expected, MorphologicalAnalyzer().morphological_analysis(json_list))
+        cache.close()
+
+        cache = TokenCache(self.path)
+        self.assertEqual(self.analyze(cache, json_list), (expected, 0))
+        json_list[1] = dict(json_list[1], body='予算案の採決')     # 本文が変われば解析し直す
+        word_dict, count = self.analyze(cache, json_list)
+        self.assertEqual(count, 1)
+        self.assertEqual(word_dict['a1'], expected['a1'])
+        self.assertIn('採決', word_dict['a2'][1])
+        cache.close()
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = TokenCache(self.path, max_bytes=10)
+        cache.put_many([('k1', 'aaaa'), ('k2', 'bbbb')])
+        time.sleep(0.01)
+        self.assertEqual(cache.get_many(['k1']), {'k1': 'aaaa'})     # k1を使うとk2が最も古くなる
+        time.sleep(0.01)
+        cache.put_many([('k3', 'cccc')])
+        self.assertEqual(cache.get_many(['k1', 'k2', 'k3']), {'k1': 'aaaa', 'k3': 'cccc'})
+        self.assertEqual(cache.total_size, 8)
+        cache.close()
+        cache = TokenCache(self.path, max_bytes=10)
+        self.assertEqual(cache.total_size, 8)
+        cache.close()
+
+
+class IncrementalIndexTest(unittest.TestCase):
+    """
+    --incrementalで新しい記事と本文が変わった記事だけを追加し直すことを確認する
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.directory.name, 'output')
+        self.output_path = os.path.join(self.directory.name, 'index')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def append(self, article_id, body):
+        """
+        記事ストアに記事を追記する。同じ記事idなら記事の更新になる
+        """
+        store = ArticleStore(ArticleStore.category_path(self.input_path, 'society'))
+        store.append_article({
+            'id': article_id, 'category': 'society', 'url': f'https://example.com/{article_id}',
+            'title': '政府の発表', 'body': body,
+        })
+        store.close()
+
+    def write_segments(self, *options):
+        """
+        indexer.pyと同じ引数で索引を作成し、追加した記事数の表示を返す
+        """
+        argv = ['indexer.py', '--category', 'society', '-i', self.input_path, '-o', self.output_path,
+                '--no_token_cache', *options]
+        with mock.patch('sys.argv', argv):
+            app = indexer.Indexer(indexer.get_args())
+        with mock.patch('builtins.print') as output:
+            app.write_segments(self.input_path, self.output_path)
+        return output.call_args_list[-1].args[0]
+
+    def test_changed_articles_are_indexed_again(self):
+        self.append('a1', '消費税の増税について会見を行った')
+        self.append('a2', '国会で予算案を審議した')
+        self.assertTrue(self.write_segments().startswith('2 articles added'))
+        self.assertTrue(self.write_segments('--incremental').startswith('0 articles added'))
+
+        self.append('a2', '国会で予算案を採決した')    # 更新された記事
+        self.append('a3', '首相が増税を表明した')
+        self.assertTrue(self.write_segments('--incremental').startswith('2 articles added'))
+        reader = SegmentReader(self.output_path, ['society'])
+        self.assertEqual(reader.postings('採決'), ['a2'])
+        self.assertEqual(reader.postings('審議'), [])
+        self.assertEqual(reader.postings('増税'), ['a1', 'a3'])
+        self.assertEqual(reader.document_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
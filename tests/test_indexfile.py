@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+1ファイルの索引(indexfile.py)のテスト
+"""
+
+import os
+import struct
+import tempfile
+import unittest
+from indexfile import HEADER
+from indexfile import IndexFile
+from indexfile import write_index_file
+from segments import SegmentIndex
+from segments import SegmentReader
+
+DOCS = [('society', 'a1', 3), ('society', 'a2', 2), ('sports', 'b1', 4)]
+POSTINGS = {'税': [(0, 2), (1, 1)], '野球': [(2, 3)], 'ａ': [(0, 1), (2, 1)]}
+POSITIONS = {'税': [[0, 2], [1]], '野球': [[0, 1, 3]], 'ａ': [[1], [2]]}
+
+
+class IndexFileTest(unittest.TestCase):
+    """
+    write_index_fileで保存し、IndexFileで読み込んだ内容が一致することを確認する
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'test.idx')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        write_index_file(self.path, DOCS, POSTINGS, POSITIONS)
+        index_file = IndexFile(self.path)
+        self.assertTrue(index_file.has_positions)
+        self.assertEqual(index_file.docs(), DOCS)
+        self.assertEqual(
+            [(word, list(cursor)) for word, cursor in index_file.iter_terms()],
+            [(word, POSTINGS[word]) for word in sorted(POSTINGS, key=lambda word: word.encode('utf-8'))],
+        )
+        self.assertEqual(list(index_file.cursor('税')), POSTINGS['税'])
+        self.assertIsNone(index_file.cursor('政府'))
+        self.assertEqual(index_file.document_frequency('ａ'), 2)
+        self.assertEqual(index_file.document_frequency('政府'), 0)
+        self.assertEqual(list(index_file.iter_positions('野球')), [(2, [0, 1, 3])])
+        self.assertEqual(list(index_file.iter_positions('ａ')), [(0, [1]), (2, [2])])
+
+    def test_without_positions(self):
+        write_index_file(self.path, DOCS, POSTINGS)
+        index_file = IndexFile(self.path)
+        self.assertFalse(index_file.has_positions)
+        self.assertEqual(list(index_file.iter_positions('税')), [])
+
+    def test_empty_file_keeps_positions_flag(self):
+        write_index_file(self.path, [('society', 'a1', 0)], {}, {})
+        index_file = IndexFile(self.path)
+        self.assertTrue(index_file.has_positions)
+        self.assertEqual(index_file.term_count, 0)
+        self.assertIsNone(index_file.cursor('税'))
+
+    def test_unknown_magic(self):
+        with open(self.path, 'wb') as a_file:
+            a_file.write(struct.pack('<8s', b'UNKNOWN0') + bytes(HEADER.size))
+        with self.assertRaises(ValueError):
+            IndexFile(self.path)
+
+
+class EmptySegmentMergeTest(unittest.TestCase):
+    """
+    単語の無いセグメントを併合しても出現位置が残ることを確認する
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_merge_with_empty_positional_segment(self):
+        index = SegmentIndex(self.path, merge_factor=2, positions=True)
+        index.add_documents([{'category': 'society', 'id': 'a1'}], {'a1': [[], set()]})
+        index.add_documents([{'category': 'society', 'id': 'a2'}], {'a2': [['消費', '税'], {'消費', '税'}]})
+        index.merge(index.plan_merge())
+        reader = SegmentReader(self.path, ['society'])
+        self.assertTrue(reader.has_positions)
+        self.assertEqual(reader.phrase(['消費', '税']), ['a2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+tf-idf行列(matrix.py)のテスト
+行列の値が、単語ごとのpickleに保存するtf-idfと一致することを確認する
+"""
+
+import os
+import pickle
+import tempfile
+import unittest
+import numpy as np
+from indexer import Analyzer
+from matrix import MatrixBuilder
+from matrix import TfidfMatrix
+from segments import Segment
+from tests.test_indexer import make_word_dict
+
+
+class TfidfMatrixTest(unittest.TestCase):
+    """
+    MatrixBuilderとTfidfMatrixのテスト
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+        self.word_dict = make_word_dict(120, 200)
+        self.categories = {id: 'society' if int(id) % 2 else 'sports' for id in self.word_dict}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def build(self):
+        """
+        文書を1件ずつ追加してTfidfMatrixを作成する
+        """
+        builder = MatrixBuilder()
+        for id, (word_list, _) in self.word_dict.items():
+            builder.add_document(self.categories[id], id, word_list)
+        return builder.build()
+
+    def load_tf_idf(self):
+        """
+        Analyzer.count_tf_idfで保存した単語ごとのpickleを読み込み、{word: {id: tf-idf}}を返す
+        """
+        _, tf_dict, idf_dict = Analyzer.term_statistics(self.word_dict)
+        Analyzer().count_tf_idf(tf_dict, idf_dict, self.path)
+        index = {}
+        path = os.path.join(self.path, 'tf-idf')
+        for name in os.listdir(path):
+            with open(os.path.join(path, name), 'rb') as a_file:
+                index[name[:-len('.pkl')]] = pickle.load(a_file)
+        return index
+
+    def assert_same_as_pickle(self, matrix):
+        rows = {str(id): row for row, id in enumerate(matrix.ids)}
+        index = self.load_tf_idf()
+        self.assertEqual(sorted(index), list(matrix.terms))
+        for word, scores in index.items():
+            column = matrix.columns([word])[0]
+            values = matrix.matrix[:, column].toarray().ravel()
+            expected = np.zeros(len(matrix.ids))
+            for id, tf_idf in scores.items():
+                expected[rows[id]] = tf_idf
+            np.testing.assert_allclose(values, expected, rtol=1e-12, atol=0)
+
+    def test_same_as_pickle(self):
+        self.assert_same_as_pickle(self.build())
+
+    def test_segment_same_as_documents(self):
+        articles = [{'category': self.categories[id], 'id': id} for id in self.word_dict]
+        segment = Segment.build(os.path.join(self.path, 'seg.idx'), articles, self.word_dict)
+        builder = MatrixBuilder()
+        builder.add_segment(segment)
+        matrix = builder.build()
+        self.assert_same_as_pickle(matrix)
+        self.assertEqual(
+            matrix.rank(['単語0', '単語3'], {'society'}), self.build().rank(['単語0', '単語3'], {'society'}),
+        )
+
+    def test_rank(self):
+        matrix = self.build()
+        ranked = matrix.rank(['単語5', '単語5', '単語9'], {'society', 'sports'})
+        documents = {id for id, (_, word_set) in self.word_dict.items() if word_set & {'単語5', '単語9'}}
+        self.assertEqual({id for id, _ in ranked}, documents)
+        scores = [score for _, score in ranked]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(matrix.rank(['単語5', '単語5', '単語9'], {'society', 'sports'}, top=3), ranked[:3])
+        society = matrix.rank(['単語5'], {'society'})
+        self.assertTrue(all(self.categories[id] == 'society' for id, _ in society))
+        self.assertEqual(matrix.rank(['未知語'], {'society'}), [])
+
+    def test_term_in_every_document(self):
+        self.word_dict = {
+            '0001': [['共通', '政府'], {'共通', '政府'}],
+            '0002': [['共通', '共通'], {'共通'}],
+            '0003': [['共通', '野球'], {'共通', '野球'}],
+        }
+        matrix = self.build()
+        # idfが0の単語だけでもNaNにならず、含む文書をスコア0で返す
+        self.assertEqual(
+            matrix.rank(['共通'], {'society', 'sports'}), [('0001', 0.0), ('0002', 0.0), ('0003', 0.0)],
+        )
+        ranked = matrix.rank(['共通', '政府'], {'society', 'sports'})
+        self.assertEqual([id for id, _ in ranked], ['0001', '0002', '0003'])
+        self.assertAlmostEqual(ranked[0][1], 1.0)
+        self.assertEqual(ranked[1:], [('0002', 0.0), ('0003', 0.0)])
+        matrix.save(self.path)
+        self.assertEqual(TfidfMatrix.load(self.path).rank(['共通'], {'sports'}), [('0002', 0.0)])
+
+    def test_save_and_load(self):
+        matrix = self.build()
+        self.assertFalse(TfidfMatrix.exists(self.path))
+        matrix.save(self.path)
+        self.assertTrue(TfidfMatrix.exists(self.path))
+        loaded = TfidfMatrix.load(self.path)
+        self.assertEqual((loaded.matrix != matrix.matrix).nnz, 0)
+        np.testing.assert_array_equal(loaded.terms, matrix.terms)
+        np.testing.assert_array_equal(loaded.ids, matrix.ids)
+        self.assertEqual(loaded.rank(['単語2'], {'society'}), matrix.rank(['単語2'], {'society'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+クロールと索引の作成を並行して行うパイプライン(pipeline.py)のテスト
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+import indexer
+import pipeline
+from indexer import TokenCache
+from segments import SegmentReader
+
+ARTICLES = [
+    {'id': f'a{number}', 'category': 'society', 'url': f'https://example.com/a{number}',
+     'title': '政府の発表', 'body': f'消費税の増税について{number}回目の会見を行った'}
+    for number in range(5)
+]
+
+
+class PipelineTest(unittest.TestCase):
+    """
+    索引スレッドが--flush_articles件ごとに索引を保存することを確認する
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.directory.name, 'index')
+        argv = [
+            'pipeline.py', '--category', 'society',
+            '--output_path', os.path.join(self.directory.name, 'output'),
+            '--index_path', self.index_path, '--flush_articles', '2', '--flush_interval', '600',
+        ]
+        with mock.patch('sys.argv', argv):
+            self.pipeline = pipeline.Pipeline(pipeline.get_args())
+        self.flushed = []   # 保存ごとの記事数
+        flush = self.pipeline.flush
+
+        def record(articles, word_dict):
+            self.flushed.append(len(articles))
+            flush(articles, word_dict)
+        self.pipeline.flush = record
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def consume(self, articles):
+        """
+        記事と終了の目印をキューに入れ、索引スレッドの処理をこのスレッドで行う
+        """
+        for article in articles:
+            self.pipeline.queue.put(article)
+        self.pipeline.queue.put(pipeline.Pipeline.STOP)
+        with mock.patch('builtins.print'):
+            self.pipeline.consume()
+        if self.pipeline.error is not None:
+            raise self.pipeline.error
+
+    def test_flush_every_articles(self):
+        self.consume(ARTICLES)
+        self.assertEqual(self.flushed, [2, 2, 1])    # 前回の保存以降の記事だけをセグメントにする
+        self.pipeline.segment_index.wait()
+        reader = SegmentReader(self.index_path, ['society'])
+        self.assertEqual(reader.postings('増税'), [article['id'] for article in ARTICLES])
+
+    def test_token_cache_shared_with_indexer(self):
+        # indexer.py -o <index_path>と同じキャッシュを使う
+        path = TokenCache.default_path(self.index_path)
+        self.assertTrue(os.path.isfile(path))
+        self.assertFalse(os.path.exists(os.path.join(self.directory.name, 'output', TokenCache.NAME)))
+        with mock.patch('sys.argv', ['indexer.py', '--category', 'society', '-o', self.index_path]):
+            app = indexer.Indexer(indexer.get_args())
+        database = app.morphologicalAnalyzer.cache.connection.execute('PRAGMA database_list').fetchone()[2]
+        self.assertEqual(os.path.realpath(database), os.path.realpath(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
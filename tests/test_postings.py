@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+転置リストの圧縮(postings.py)のテスト
+"""
+
+import random
+import unittest
+from postings import PostingCursor
+from postings import concat_postings
+from postings import decode_positions
+from postings import decode_varint
+from postings import encode_positions
+from postings import encode_postings
+from postings import encode_varint
+from postings import intersect
+
+
+def make_postings(generator, length, max_gap=300):
+    """
+    文書番号の昇順のランダムな[(文書番号, 回数)]を返す
+    """
+    postings = []
+    doc_number = -1
+    for _ in range(length):
+        doc_number += generator.randint(1, max_gap)
+        postings.append((doc_number, generator.randint(1, 200)))
+    return postings
+
+
+class VarintTest(unittest.TestCase):
+    """
+    可変長整数のテスト
+    """
+
+    def test_round_trip(self):
+        values = [0, 1, 127, 128, 255, 16383, 16384, 2 ** 32, 2 ** 63 - 1]
+        buffer = bytearray()
+        for value in values:
+            encode_varint(value, buffer)
+        offset = 0
+        decoded = []
+        for _ in values:
+            value, offset = decode_varint(buffer, offset)
+            decoded.append(value)
+        self.assertEqual(decoded, values)
+        self.assertEqual(offset, len(buffer))
+
+
+class PostingCursorTest(unittest.TestCase):
+    """
+    圧縮した転置リストを読むPostingCursorのテスト
+    """
+
+    def test_round_trip(self):
+        generator = random.Random(0)
+        for length in (0, 1, 127, 128, 129, 1000):
+            postings = make_postings(generator, length)
+            cursor = PostingCursor(encode_postings(postings))
+            self.assertEqual(len(cursor), length)
+            self.assertEqual(list(cursor), postings)
+            # memoryviewからも同じように読める
+            self.assertEqual(list(PostingCursor(memoryview(encode_postings(postings)))), postings)
+
+    def test_next(self):
+        postings = make_postings(random.Random(1), 300)
+        cursor = PostingCursor(encode_postings(postings, block_size=16))
+        read = []
+        while (entry := cursor.next()) is not None:
+            read.append(entry)
+        self.assertEqual(read, postings)
+        self.assertIsNone(cursor.next())
+
+    def test_advance(self):
+        generator = random.Random(2)
+        postings = make_postings(generator, 500)
+        doc_numbers = [doc_number for doc_number, _ in postings]
+        cursor = PostingCursor(encode_postings(postings, block_size=16))
+        target = 0
+        while True:
+            target += generator.randint(0, 800)
+            expected = next((entry for entry in postings if entry[0] >= target), None)
+            self.assertEqual(cursor.advance(target), expected)
+            if expected is None:
+                break
+            # 現在の文書以下のtargetでは進まない
+            self.assertEqual(cursor.advance(expected[0]), expected)
+        self.assertIsNone(cursor.advance(doc_numbers[-1] + 1))
+        self.assertIsNone(cursor.advance(0))
+
+    def test_intersect(self):
+        generator = random.Random(3)
+        for _ in range(20):
+            lists = [make_postings(generator, generator.randint(0, 600), max_gap=20) for _ in range(3)]
+            expected = sorted(set.intersection(*({doc for doc, _ in postings} for postings in lists)))
+            cursors = [PostingCursor(encode_postings(postings, block_size=32)) for postings in lists]
+            self.assertEqual(intersect(cursors), expected)
+        self.assertEqual(intersect([]), [])
+
+
+class ConcatPostingsTest(unittest.TestCase):
+    """
+    圧縮したままの転置リストをつなげるconcat_postingsのテスト
+    """
+
+    def test_concat(self):
+        generator = random.Random(5)
+        for _ in range(20):
+            parts = []
+            start = 0
+            for _ in range(generator.randint(1, 6)):
+                postings = [
+                    (start + doc_number, count)
+                    for doc_number, count in make_postings(generator, generator.randint(0, 300))
+                ]
+                if postings:
+                    start = postings[-1][0] + generator.randint(1, 1000)
+                parts.append(postings)
+            expected = [entry for postings in parts for entry in postings]
+            buffer = concat_postings(encode_postings(postings, block_size=16) for postings in parts)
+            self.assertEqual(list(PostingCursor(buffer)), expected)
+            # 大きさの揃わないブロックでもスキップポインタで進める
+            cursor = PostingCursor(buffer)
+            for doc_number, count in expected[::7]:
+                self.assertEqual(cursor.advance(doc_number), (doc_number, count))
+
+    def test_single_part_is_unchanged(self):
+        data = encode_postings(make_postings(random.Random(6), 400))
+        self.assertEqual(concat_postings([data]), data)
+
+    def test_rejects_decreasing_documents(self):
+        with self.assertRaises(ValueError):
+            concat_postings([encode_postings([(5, 1)]), encode_postings([(5, 1)])])
+
+
+class PositionsTest(unittest.TestCase):
+    """
+    出現位置の圧縮のテスト
+    """
+
+    def test_round_trip(self):
+        generator = random.Random(4)
+        position_lists = [
+            sorted(generator.sample(range(5000), generator.randint(1, 50))) for _ in range(100)
+        ]
+        buffer = encode_positions(position_lists)
+        counts = [len(positions) for positions in position_lists]
+        self.assertEqual(list(decode_positions(buffer, counts)), position_lists)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+リプレイサーバー(replay_server.py)のテスト
+"""
+
+import os
+import re
+import tempfile
+import threading
+import unittest
+import requests
+from crawler import RawArchive
+from crawler import SoupExtractor
+from replay_server import ReplayServer
+from replay_server import load_archive_pages
+from replay_server import make_synthetic_pages
+
+
+class ReplayServerTest(unittest.TestCase):
+    """
+    生成したページやアーカイブのページを、クローラが取得・抽出できる形で返すことを確認する
+    """
+
+    def serve(self, pages, **kwargs):
+        """
+        サーバーを別スレッドで起動して返す
+        """
+        server = ReplayServer(pages, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_synthetic_pages(self):
+        url_pattern = re.compile(r'/news/.+')
+        pages = make_synthetic_pages(
+            [('society', ['https://example.com/list/1'], url_pattern)], articles_per_page=3, paragraphs=2,
+        )
+        server = self.serve(pages)
+        listing = requests.get(server.base_url + '/list/1', timeout=5)
+        self.assertEqual(listing.status_code, 200)
+        urls = SoupExtractor.extract_urls(url_pattern, listing.text)
+        self.assertEqual(urls, {f'/news/society-0-{index}' for index in range(3)})
+        article = requests.get(server.base_url + '/news/society-0-1', timeout=5)
+        title, body = SoupExtractor.extract_title_and_body(article.text)
+        self.assertEqual(title, '記事 society-0-1')
+        self.assertIn('消費税', body)
+        self.assertEqual(requests.get(server.base_url + '/missing', timeout=5).status_code, 404)
+
+    def test_error_rate(self):
+        server = self.serve({'/page': '<html></html>'}, error_rate=1.0, retry_after=7)
+        response = requests.get(server.base_url + '/page', timeout=5)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '7')
+
+    def test_load_archive_pages(self):
+        with tempfile.TemporaryDirectory() as directory:
+            archive = RawArchive(os.path.join(directory, 'society'))
+            archive.append('https://example.com/news/1', '<html>記事1</html>')
+            archive.close()
+            self.assertEqual(load_archive_pages(directory), {'/news/1': '<html>記事1</html>'})
+
+
+if __name__ == '__main__':
+    unittest.main()
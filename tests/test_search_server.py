@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+検索サーバー(search_server.py)のテスト
+"""
+
+import json
+import os
+import pickle
+import tempfile
+import threading
+import unittest
+from argparse import Namespace
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+from matrix import MatrixBuilder
+from replay_server import ReplayServer
+from search_server import SearchError
+from search_server import SearchServer
+from search_server import SearchService
+from searcher import Searcher
+from segments import SegmentIndex
+
+DOCUMENTS = [
+    ('society', 'a1', ['税', '税', '政府']),
+    ('society', 'a2', ['税', '選挙']),
+    ('society', 'a3', ['税', '政府', '選挙', '国会']),
+    ('society', 'a4', ['野球']),
+    ('sports', 'b1', ['税', '野球']),
+]
+
+
+class SearchServiceTest(unittest.TestCase):
+    """
+    topで結果を絞っても、件数は一致した記事の総数を返すことを確認する
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = self.directory.name
+        articles = [{'category': category, 'id': article_id} for category, article_id, _ in DOCUMENTS]
+        word_dict = {article_id: [word_list, set(word_list)] for _, article_id, word_list in DOCUMENTS}
+        SegmentIndex(path).add_documents(articles, word_dict)
+        builder = MatrixBuilder()
+        for category, article_id, word_list in DOCUMENTS:
+            builder.add_document(category, article_id, word_list)
+        builder.build().save(path)
+        self.service = SearchService(path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_ranked_count_before_top(self):
+        response = self.service.search('ranked', ['税'], ['society'], top=1)
+        self.assertEqual(response['count'], 3)
+        self.assertEqual([article_id for article_id, _ in response['results']], ['a1'])
+        response = self.service.search('ranked', ['税'], ['society'])
+        self.assertEqual(response['count'], 3)
+        self.assertEqual([article_id for article_id, _ in response['results']], ['a1', 'a2', 'a3'])
+
+    def test_count_before_top(self):
+        response = self.service.search('or', ['政府', '選挙'], ['society'], top=2)
+        self.assertEqual(response['count'], 3)
+        self.assertEqual(response['results'], ['a1', 'a2'])
+
+
+    def test_negative_top_and_distance(self):
+        for mode in ('ranked', 'or'):
+            with self.assertRaises(SearchError):
+                self.service.search(mode, ['税'], ['society'], top=-1)
+        with self.assertRaises(SearchError):
+            self.service.search('near', ['税', '政府'], ['society'], distance=-1)
+        with self.assertRaises(ValueError):
+            self.service.matrix.rank(['税'], ['society'], top=-1)
+        self.assertEqual(self.service.search('ranked', ['税'], ['society'], top=0)['results'], [])
+
+        server = SearchServer(self.service)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        for mode, option in (('ranked', 'top'), ('near', 'distance')):
+            query = urlencode({'mode': mode, 'word': '税', 'category': 'society', option: -1})
+            with self.assertRaises(HTTPError) as context:
+                urlopen(f'{server.base_url}/search?{query}', timeout=5)
+            self.assertEqual(context.exception.code, 400)
+            self.assertIn('0以上', json.load(context.exception)['error'])
+            context.exception.close()
+
+    def test_server_output_matches_local_search(self):
+        server = SearchServer(self.service)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        for mode, words in (('single', ['税']), ('and', ['税', '政府']), ('or', ['政府', '選挙']),
+                            ('ranked', ['税', '選挙'])):
+            outputs = []
+            for url in (None, server.base_url):
+                args = Namespace(
+                    input_path=self.directory.name, search_word=words, category=['society', 'sports'],
+                    mode=mode, distance=5, server=url, timeout=5, verbose=False,
+                )
+                with mock.patch('builtins.print') as output:
+                    Searcher(args).run()
+                outputs.append(output.call_args_list)
+            self.assertEqual(outputs[0], outputs[1], mode)
+
+
+class ScoreCacheTest(unittest.TestCase):
+    """
+    pklの索引のtf, tf-idfは、最近使ったものから上限の数だけ読み込んだままにすることを確認する
+    """
+
+    def test_least_recently_used_scores_are_evicted(self):
+        with tempfile.TemporaryDirectory() as path:
+            os.makedirs(os.path.join(path, 'tf'))
+            for word in ('税', '政府', '選挙'):
+                with open(os.path.join(path, 'tf', word + '.pkl'), 'wb') as a_file:
+                    pickle.dump({'a1': len(word)}, a_file)
+            service = SearchService(path, score_cache_size=2)
+            self.assertEqual(service.scores('税', 'tf', None), {'a1': 1})
+            service.scores('政府', 'tf', None)
+            service.scores('税', 'tf', None)     # 税を使うと政府が最も古くなる
+            service.scores('選挙', 'tf', None)
+            self.assertEqual(list(service.score_cache), [('tf', '税'), ('tf', '選挙')])
+            self.assertEqual(service.scores('政府', 'tf', None), {'a1': 2})
+            self.assertEqual(service.scores('未知語', 'tf', None), {})
+            self.assertEqual(len(service.score_cache), 2)
+
+
+class SearchClientTest(unittest.TestCase):
+    """
+    searcher.pyの--serverで、jsonでないエラーの応答もステータスを表示して終了することを確認する
+    """
+
+    def test_error_without_json_body(self):
+        server = ReplayServer({}, error_rate=1.0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        args = Namespace(server=server.base_url, category=['society'], distance=5, timeout=5, verbose=False)
+        with mock.patch('builtins.print') as output, self.assertRaises(SystemExit):
+            Searcher(args).search_server(['税'], 'single')
+        output.assert_called_once_with('503 Service Unavailable')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+セグメントの索引(segments.py)のテスト
+追加・置き換え・併合の後も、記事ごとに最後に追加した内容で検索できることを確認する
+"""
+
+import json
+import math
+import os
+import tempfile
+import unittest
+from unittest import mock
+from segments import SegmentIndex
+from segments import SegmentReader
+from segments import article_digest
+
+
+def make_batch(documents):
+    """
+    [(カテゴリー, 記事id, [word_list])]から(記事のリスト, {id:[[word_list],(word_set)]})を返す
+    """
+    articles = [{'category': category, 'id': article_id} for category, article_id, _ in documents]
+    word_dict = {article_id: [word_list, set(word_list)] for _, article_id, word_list in documents}
+    return articles, word_dict
+
+
+class SegmentIndexTest(unittest.TestCase):
+    """
+    SegmentIndexとSegmentReaderのテスト
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def add(self, index, documents, replace=False):
+        """
+        文書を1つのセグメントとして追加する
+        """
+        articles, word_dict = make_batch(documents)
+        return index.add_documents(articles, word_dict, replace=replace)
+
+    def manifest(self):
+        """
+        manifest.jsonを読み込み返す
+        """
+        with open(os.path.join(self.path, 'segments', 'manifest.json'), encoding='utf-8') as a_file:
+            return json.load(a_file)
+
+    def test_level_of_exact_powers(self):
+        index = SegmentIndex(self.path, merge_factor=10)
+        self.assertEqual([index.level(n) for n in (0, 1, 9, 10, 99, 100, 999, 1000)], [0, 0, 0, 1, 1, 2, 2, 3])
+        self.assertEqual(SegmentIndex(self.path, merge_factor=3).level(243), 5)
+
+    def test_merge_drops_replaced_documents(self):
+        index = SegmentIndex(self.path, merge_factor=2)
+        self.add(index, [
+            ('society', 'a1', ['税金', '政府', '税金']),
+            ('society', 'a2', ['政府', '国会']),
+            ('sports', 'a3', ['野球']),
+        ])
+        # a2を新しい内容で追加し直す
+        self.add(index, [('society', 'a2', ['野球', '選手']), ('sports', 'b1', ['選手', '税金'])])
+        expected = {
+            '税金': ['a1', 'b1'], '政府': ['a1'], '国会': [], '野球': ['a2', 'a3'], '選手': ['a2', 'b1'],
+        }
+        reader = SegmentReader(self.path, ['society', 'sports'])
+        before = {word: reader.postings(word) for word in expected}
+        tfidf_before = reader.scores('税金', 'tf-idf')
+        self.assertEqual(before, expected)
+        self.assertEqual(self.manifest()['segments'][0]['deleted'], [1])
+
+        names = index.plan_merge()
+        self.assertEqual(len(names), 2)
+        index.merge(names)
+        segments = self.manifest()['segments']
+        self.assertEqual(len(segments), 1)
+        self.assertEqual(segments[0]['documents'], 4)
+        self.assertNotIn('deleted', segments[0])
+        for name in names:
+            self.assertFalse(os.path.exists(os.path.join(self.path, 'segments', name + '.idx')))
+
+        reader = SegmentReader(self.path, ['society', 'sports'])
+        self.assertEqual({word: reader.postings(word) for word in expected}, expected)
+        self.assertEqual(reader.scores('税金', 'tf-idf'), tfidf_before)
+        self.assertEqual(reader.intersect(['選手', '税金']), ['b1'])
+        self.assertEqual(SegmentReader(self.path, ['sports']).postings('野球'), ['a3'])
+
+    def test_merge_keeps_positions(self):
+        index = SegmentIndex(self.path, merge_factor=2, positions=True)
+        self.add(index, [('society', 'a1', ['消費', '税', '増税']), ('society', 'a2', ['税', '消費'])])
+        self.add(index, [('society', 'a3', ['消費', '税']), ('society', 'a1', ['税', '消費'])])
+        reader = SegmentReader(self.path, ['society'])
+        self.assertEqual(reader.phrase(['消費', '税']), ['a3'])
+        self.assertEqual(reader.near(['消費', '税'], 1), ['a1', 'a2', 'a3'])
+        index.merge(index.plan_merge())
+        reader = SegmentReader(self.path, ['society'])
+        self.assertTrue(reader.has_positions)
+        self.assertEqual(reader.phrase(['消費', '税']), ['a3'])
+        self.assertEqual(reader.near(['消費', '税'], 1), ['a1', 'a2', 'a3'])
+
+    def test_replace_keeps_index_until_new_segment(self):
+        index = SegmentIndex(self.path)
+        old = self.add(index, [('society', 'a1', ['税金'])])
+        self.assertIsNone(self.add(index, [], replace=True))
+        self.assertEqual(SegmentReader(self.path, ['society']).postings('税金'), ['a1'])
+
+        new = self.add(index, [('society', 'b1', ['政府'])], replace=True)
+        self.assertEqual([entry['name'] for entry in self.manifest()['segments']], [new])
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'segments', old + '.idx')))
+        reader = SegmentReader(self.path, ['society'])
+        self.assertEqual(reader.postings('税金'), [])
+        self.assertEqual(reader.postings('政府'), ['b1'])
+        self.assertEqual(index.document_keys(), {('society', 'b1')})
+
+    def test_word_lookup_decodes_postings_once(self):
+        index = SegmentIndex(self.path)
+        self.add(index, [('society', 'a1', ['税金', '政府']), ('sports', 'b1', ['野球'])])
+        self.add(index, [('society', 'a1', ['政府'])])     # 古いa1の税金は置き換えられる
+        reader = SegmentReader(self.path, ['society'])
+        decoded = []
+        for segment in reader.segments:
+            segment.open()
+            iter_postings = segment.iter_postings
+            mock.patch.object(segment, 'iter_postings', lambda word, iter_postings=iter_postings: (
+                decoded.append(word) or iter_postings(word)
+            )).start()
+        self.addCleanup(mock.patch.stopall)
+        # 用語辞書に無い単語は転置リストを復元しない
+        self.assertNotIn('国会', reader)
+        self.assertEqual(decoded, [])
+        # 置き換えられた文書やカテゴリー外の文書しか無ければ含まない
+        self.assertNotIn('税金', reader)
+        self.assertNotIn('野球', reader)
+        # in, [], tf-idf, tfで同じ単語を引いても、各セグメントで1回だけ復元する
+        decoded.clear()
+        self.assertIn('政府', reader)
+        self.assertEqual(reader['政府'], ['a1'])
+        self.assertEqual(reader.scores('政府', 'tf-idf'), {'a1': math.log(2)})
+        self.assertEqual(reader.scores('政府', 'tf'), {'a1': 1.0})
+        self.assertEqual(decoded, ['政府', '政府'])
+        self.assertEqual(reader.with_categories(['sports']).postings('政府'), [])
+
+    def test_digests_follow_the_index(self):
+        index = SegmentIndex(self.path)
+        first = {'category': 'society', 'id': 'a1', 'title': '政府', 'body': '増税'}
+        second = dict(first, body='減税')
+        index.add_documents([first], {'a1': [['政府', '増税'], {'政府', '増税'}]})
+        self.assertEqual(index.document_digests(), {('society', 'a1'): article_digest(first)})
+        self.assertNotEqual(article_digest(first), article_digest(second))
+        index.add_documents([second], {'a1': [['政府', '減税'], {'政府', '減税'}]})
+        self.assertEqual(index.document_digests(), {('society', 'a1'): article_digest(second)})
+        self.assertEqual(self.manifest()['segments'][0]['deleted'], [0])    # 古い文書は削除済みになる
+        self.assertEqual(SegmentReader(self.path, ['society']).postings('増税'), [])
+        # 作り直すと以前のダイジェストは残らない
+        index.add_documents([{'category': 'sports', 'id': 'b1'}], {'b1': [['野球'], {'野球'}]}, replace=True)
+        self.assertEqual(list(index.document_digests()), [('sports', 'b1')])
+
+    def test_stream_digests_are_kept_only_after_registering(self):
+        index = SegmentIndex(self.path)
+        index.DIGEST_BATCH = 2
+
+        def documents(count, fail=False):
+            for number in range(count):
+                yield 'society', f'a{number}', ['税金'], f'digest{number}'
+            if fail:
+                raise RuntimeError('interrupted')
+
+        with self.assertRaises(RuntimeError):
+            index.add_stream(documents(5, fail=True), 4096)
+        self.assertEqual(index.document_digests(), {})
+        self.assertIsNotNone(index.add_stream(documents(5), 4096))
+        self.assertEqual(
+            index.document_digests(), {('society', f'a{number}'): f'digest{number}' for number in range(5)},
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
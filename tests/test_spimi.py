@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+メモリの上限を決めた索引の作成(spimi.py)のテスト
+runに分けて作成した索引ファイルが、メモリ上で作成した索引ファイルと同じ内容になることを確認する
+"""
+
+import os
+import random
+import tempfile
+import unittest
+from segments import Segment
+
+
+def make_documents(count, seed=0):
+    """
+    Zipf分布に近い頻度の単語で合成した[(カテゴリー, 記事id, [word_list])]を返す
+    """
+    generator = random.Random(seed)
+    vocabulary = [f'単語{number}' for number in range(300)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    return [
+        (
+            generator.choice(['society', 'sports']), f'id{number}',
+            generator.choices(vocabulary, weights, k=generator.randint(1, 80)),
+        )
+        for number in range(count)
+    ]
+
+
+class SpimiTest(unittest.TestCase):
+    """
+    Segment.build_streamのテスト
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def build_both(self, documents, positions):
+        """
+        メモリ上とrunに分けた作成の両方でセグメントを作成し、(メモリ上, run)を返す
+        """
+        articles = [{'category': category, 'id': article_id} for category, article_id, _ in documents]
+        word_dict = {article_id: [word_list, set(word_list)] for _, article_id, word_list in documents}
+        in_memory = Segment.build(os.path.join(self.path, 'memory.idx'), articles, word_dict, positions)
+        # 上限を小さくして、文書数件ごとにrunを書き出す
+        streamed = Segment.build_stream(
+            os.path.join(self.path, 'stream.idx'), iter(documents), 4096, positions,
+        )
+        return in_memory, streamed
+
+    def assert_same(self, in_memory, streamed):
+        self.assertEqual(streamed.load_docs(), in_memory.load_docs())
+        self.assertEqual(list(streamed.iter_terms()), list(in_memory.iter_terms()))
+        self.assertEqual(
+            [streamed.document_frequency(word) for word, _, _ in in_memory.iter_terms()],
+            [in_memory.document_frequency(word) for word, _, _ in in_memory.iter_terms()],
+        )
+
+    def test_same_as_in_memory(self):
+        in_memory, streamed = self.build_both(make_documents(400), positions=False)
+        self.assertFalse(streamed.has_positions)
+        self.assert_same(in_memory, streamed)
+
+    def test_same_as_in_memory_with_positions(self):
+        in_memory, streamed = self.build_both(make_documents(400, seed=1), positions=True)
+        self.assertTrue(streamed.has_positions)
+        self.assert_same(in_memory, streamed)
+
+    def test_no_documents(self):
+        self.assertIsNone(Segment.build_stream(os.path.join(self.path, 'empty.idx'), iter([]), 4096))
+        self.assertEqual(os.listdir(self.path), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+追記専用のレコードの保存(store.py)のテスト
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from store import ArticleStore
+from store import RecordStore
+
+
+class RecordStoreTest(unittest.TestCase):
+    """
+    追記したレコードを、開き直した後もkeyごとに最新のものだけ読み出せることを確認する
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_append_and_read(self):
+        store = RecordStore(self.path)
+        store.append('a1', '記事1'.encode('utf-8'))
+        store.append('a2', b'second')
+        store.append('a1', '記事1の更新'.encode('utf-8'))
+        self.assertEqual(store.read('a1').decode('utf-8'), '記事1の更新')
+        self.assertIsNone(store.read('a3'))
+        store.close()
+
+        store = RecordStore(self.path)
+        self.assertEqual(len(store), 2)
+        self.assertIn('a2', store)
+        self.assertNotIn('a3', store)
+        self.assertEqual(
+            [(key, data.decode('utf-8')) for key, data in store.records()],
+            [('a2', 'second'), ('a1', '記事1の更新')],
+        )
+        store.close()
+
+    def test_segments_roll_over(self):
+        store = RecordStore(self.path, suffix='.bin', compress=False, segment_size=10)
+        for number in range(5):
+            store.append(f'k{number}', b'0123456789')
+        store.close()
+        names = sorted(name for name in os.listdir(self.path) if name.endswith('.bin'))
+        self.assertEqual(names, [f'segment-{number:05d}.bin' for number in range(5)])
+        store = RecordStore(self.path, suffix='.bin', compress=False, segment_size=10)
+        store.append('k5', b'tail')
+        self.assertEqual(store.read('k5'), b'tail')
+        self.assertEqual([key for key, _ in store.records()], [f'k{number}' for number in range(6)])
+        store.close()
+
+    def test_torn_index_line_is_ignored(self):
+        store = RecordStore(self.path)
+        store.append('a1', b'complete')
+        store.close()
+        with open(os.path.join(self.path, RecordStore.INDEX_NAME), 'a', encoding='utf-8') as a_file:
+            a_file.write('a2\tsegment-00000.gz')     # 書き込み途中で終了した行
+        store = RecordStore(self.path)
+        self.assertEqual(list(store.records()), [('a1', b'complete')])
+        store.close()
+
+
+class ArticleStoreTest(unittest.TestCase):
+    """
+    記事ストアへの追記・読み出しと、記事ごとのjsonファイルからの移行のテスト
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.output_path = self.directory.name
+        self.category_path = os.path.join(self.output_path, 'society')
+        os.makedirs(self.category_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_json(self, article):
+        """
+        記事を以前の形式(記事ごとのjsonファイル)で保存する
+        """
+        with open(os.path.join(self.category_path, article['id'] + '.json'), 'w', encoding='utf-8') as a_file:
+            json.dump(article, a_file, ensure_ascii=False)
+
+    def test_append_and_read_articles(self):
+        store = ArticleStore(ArticleStore.category_path(self.output_path, 'society'))
+        self.assertFalse(ArticleStore.exists(self.output_path, 'society'))
+        article = {'id': 'a1', 'category': 'society', 'title': '題名', 'body': '本文\n2行目'}
+        store.append_article(article)
+        store.append_article({'id': 'a2', 'category': 'society', 'title': 't', 'body': 'b'})
+        store.close()
+        self.assertTrue(ArticleStore.exists(self.output_path, 'society'))
+
+        store = ArticleStore(ArticleStore.category_path(self.output_path, 'society'))
+        self.assertEqual(store.read_article('a1'), article)
+        self.assertIsNone(store.read_article('a3'))
+        self.assertEqual([article['id'] for article in store.articles()], ['a1', 'a2'])
+        store.close()
+
+    def test_existing_compression_wins(self):
+        path = ArticleStore.category_path(self.output_path, 'society')
+        store = ArticleStore(path, compress=True)
+        store.append_article({'id': 'a1', 'category': 'society', 'title': 't', 'body': 'b'})
+        store.close()
+        store = ArticleStore(path, compress=False)
+        self.assertTrue(store.compress)
+        self.assertEqual(store.read_article('a1')['body'], 'b')
+        store.close()
+
+    def test_migrate(self):
+        for number in range(3):
+            self.write_json({'id': f'a{number}', 'category': 'society', 'title': 't', 'body': str(number)})
+        store = ArticleStore(ArticleStore.category_path(self.output_path, 'society'))
+        store.append_article({'id': 'a1', 'category': 'society', 'title': 't', 'body': 'stored'})
+        self.assertEqual(store.migrate(self.category_path, remove=True), 2)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.read_article('a1')['body'], 'stored')   # ストアにある記事は上書きしない
+        self.assertEqual(store.read_article('a2')['body'], '2')
+        self.assertFalse(any(name.endswith('.json') for name in os.listdir(self.category_path)))
+        self.assertEqual(store.migrate(self.category_path), 0)
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()